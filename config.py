@@ -1,5 +1,9 @@
 import logging
+import os
+
 from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
 # Настройка логирования
 logging.basicConfig(
@@ -9,4 +13,15 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Бот будет инициализирован в main.py
-bot = None
\ No newline at end of file
+bot = None
+
+
+def create_bot(token: str) -> Bot:
+    """
+    Создаёт объект бота. Если задан TELEGRAM_API_URL, запросы идут на указанный
+    сервер (локальный Bot API или тестовый сервер из server/fake_telegram.py).
+    """
+    api_url = os.getenv("TELEGRAM_API_URL")
+    if api_url:
+        return Bot(token=token, session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+    return Bot(token=token)
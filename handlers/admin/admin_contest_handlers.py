@@ -2,200 +2,214 @@ import os
 from datetime import datetime, timedelta
 
 from aiogram import Router, types
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from bson import ObjectId
 
 from config import logger
 from handlers.contest.responsible_handlers import show_responsible_list
 from keyboards.cancel_keyboard import create_cancel_keyboard
-from services.database import users_col, contests_col
+from keyboards.contest_keyboard import (
+    CONTEST_PAGE_PREFIX, CONTESTS_PER_PAGE, get_contest_selection_keyboard, parse_contest_page_callback,
+)
+from services import file_io
+from services.database import contests_repo
+from utils.contest_states import ContestCreationStates, ContestEditStates
+from utils.file_utils import UPLOAD_FOLDER
 from utils.role_utils import send_role_keyboard
 
 router = Router()
 
+ALLOWED_FILE_EXTENSIONS = ["pdf", "docx", "doc", "xlsx"]
 
-# Хэндлер для отмены создания конкурса
-@router.message(lambda message: message.text == "❌ Отменить создание конкурса")
-async def cancel_contest_creation(message: types.Message):
-    # Получаем данные пользователя из базы данных
-    user = users_col.find_one({"telegram_id": message.from_user.id})
 
-    if not user:
-        await message.answer("Пользователь не найден.", reply_markup=types.ReplyKeyboardRemove())
-        return
+DATES_FORMAT_ERROR = "Некорректный формат дат. Введите 'ДД.ММ.ГГГГ' или 'ДД.ММ.ГГГГ - ДД.ММ.ГГГГ'."
 
-    # Удаляем конкурс, который находится в процессе создания
-    result = contests_col.delete_one({
-        "telegram_id": message.from_user.id,
-        "step": {"$ne": None}  # Ищем конкурс, у которого шаг не равен None
-    })
 
-    if result.deleted_count > 0:
-        await message.answer("Создание конкурса отменено.",
-                             reply_markup=await send_role_keyboard(message.bot, message.from_user.id, user.get("role")))
-    else:
-        await message.answer("Нет активного конкурса для отмены.",
-                             reply_markup=await send_role_keyboard(message.bot, message.from_user.id, user.get("role")))
+def parse_contest_dates(text: str):
+    """
+    Разбирает даты проведения конкурса в формате 'ДД.ММ.ГГГГ' или 'ДД.ММ.ГГГГ - ДД.ММ.ГГГГ'.
+
+    Returns:
+        tuple: (start_date, end_date); start_date равен None, если указана только дата окончания
+
+    Raises:
+        ValueError: с текстом для пользователя, если даты указаны некорректно
+    """
+    dates = text.split(" - ")
+    if len(dates) not in (1, 2):
+        raise ValueError(DATES_FORMAT_ERROR)
+
+    try:
+        parsed = [datetime.strptime(date.strip(), "%d.%m.%Y") for date in dates]
+    except ValueError:
+        raise ValueError(DATES_FORMAT_ERROR)
+
+    if len(parsed) == 1:
+        # Только дата окончания
+        return None, parsed[0]
+
+    start_date, end_date = parsed
+    if start_date > end_date:
+        raise ValueError("Дата начала не может быть позже даты окончания. Попробуйте снова.")
+    return start_date, end_date
+
+
+async def download_contest_file(message: types.Message):
+    """Проверяет расширение документа и скачивает его в uploads; возвращает имя файла или None"""
+    file_ext = message.document.file_name.split(".")[-1].lower()
+    if file_ext not in ALLOWED_FILE_EXTENSIONS:
+        await message.answer("Недопустимый формат файла. Разрешены только pdf, docx, doc, xlsx.")
+        return None
+
+    file = await message.bot.get_file(message.document.file_id)
+    file_name = message.document.file_name
+    await file_io.download(message.bot, file.file_path, os.path.join(UPLOAD_FOLDER, file_name))
+    return file_name
+
+
+# Хэндлер для отмены создания конкурса
+@router.message(StateFilter(ContestCreationStates, ContestEditStates),
+                lambda message: message.text == "❌ Отменить создание конкурса")
+async def cancel_contest_creation(message: types.Message, state: FSMContext, user: dict = None):
+    # Черновик хранится только в FSM, поэтому достаточно очистить состояние
+    await state.clear()
+    await message.answer("Создание конкурса отменено.",
+                         reply_markup=await send_role_keyboard(message.bot, message.from_user.id, user.get("role")))
+
+
+@router.message(lambda message: message.text == "❌ Отменить создание конкурса")
+async def cancel_contest_creation_without_draft(message: types.Message, user: dict = None):
+    await message.answer("Нет активного конкурса для отмены.",
+                         reply_markup=await send_role_keyboard(message.bot, message.from_user.id, user.get("role")))
 
 
 # Хэндлер для добавления конкурса
 @router.message(lambda message: message.text == "Добавить конкурс")
-async def add_contest(message: types.Message):
+async def add_contest(message: types.Message, state: FSMContext, raw_state: str = None):
     # Проверяем, есть ли у пользователя активный конкурс в процессе создания
-    active_contest = contests_col.find_one({
-        "telegram_id": message.from_user.id,
-        "step": {"$ne": None}  # Ищем конкурс, у которого шаг не равен None
-    })
-
-    if active_contest:
+    if raw_state in ContestCreationStates:
         await message.answer("У вас уже есть активный конкурс в процессе создания. Завершите его или отмените.")
         return
 
-    # Создаем новый конкурс с уникальным _id
-    contest_id = ObjectId()  # Уникальный идентификатор для нового конкурса
-    contests_col.insert_one({
-        "_id": contest_id,
-        "telegram_id": message.from_user.id,
-        "step": "name",  # Устанавливаем начальный шаг
-        "files": []
-    })
+    # Черновик конкурса живёт в FSM и попадает в базу только после выбора ответственного
+    await state.clear()
+    await state.set_state(ContestCreationStates.entering_name)
+    await state.update_data(files=[])
     await message.answer("Введите название конкурса:", reply_markup=create_cancel_keyboard())
 
 
 # Хэндлер для обработки названия конкурса
-@router.message(lambda message: contests_col.find_one({"telegram_id": message.from_user.id, "step": "name"}))
-async def process_contest_name(message: types.Message):
+@router.message(ContestCreationStates.entering_name)
+async def process_contest_name(message: types.Message, state: FSMContext):
     if not message.text:
         await message.answer("Пожалуйста, введите название конкурса текстом.")
         return
-    # Обновляем конкурс, добавляя название
-    contests_col.update_one(
-        {"telegram_id": message.from_user.id, "step": "name"},
-        {"$set": {"name": message.text, "step": "dates"}}
-    )
+    await state.update_data(name=message.text)
+    await state.set_state(ContestCreationStates.entering_dates)
     await message.answer("Введите даты проведения конкурса (в формате ДД.ММ.ГГГГ - ДД.ММ.ГГГГ или ДД.ММ.ГГГГ):",
                          reply_markup=create_cancel_keyboard())
 
 
 # Хэндлер для обработки даты конкурса
-@router.message(lambda message: contests_col.find_one({"telegram_id": message.from_user.id, "step": "dates"}))
-async def process_contest_dates(message: types.Message):
+@router.message(ContestCreationStates.entering_dates)
+async def process_contest_dates(message: types.Message, state: FSMContext):
     if not message.text:
         await message.answer("Пожалуйста, введите даты в текстовом формате.")
         return
 
     try:
-        # Разделяем строку на две части
-        dates = message.text.split(" - ")
-
-        if len(dates) == 1:
-            # Только дата окончания
-            end_date = datetime.strptime(dates[0].strip(), "%d.%m.%Y")
-            start_date = None
-        elif len(dates) == 2:
-            # Дата начала и дата окончания
-            start_date = datetime.strptime(dates[0].strip(), "%d.%m.%Y")
-            end_date = datetime.strptime(dates[1].strip(), "%d.%m.%Y")
-
-            if start_date > end_date:
-                await message.answer("Дата начала не может быть позже даты окончания. Попробуйте снова.")
-                return
-        else:
-            await message.answer("Некорректный формат дат. Введите 'ДД.ММ.ГГГГ' или 'ДД.ММ.ГГГГ - ДД.ММ.ГГГГ'.")
-            return
-
-        # Обновляем конкурс, добавляя даты
-        contests_col.update_one(
-            {"telegram_id": message.from_user.id, "step": "dates"},
-            {"$set": {
-                "start_date": start_date,
-                "end_date": end_date,
-                "step": "description"
-            }}
-        )
-        await message.answer("Введите описание конкурса:", reply_markup=create_cancel_keyboard())
+        start_date, end_date = parse_contest_dates(message.text)
+    except ValueError as e:
+        await message.answer(str(e))
+        return
 
-    except ValueError:
-        await message.answer("Некорректный формат дат. Введите 'ДД.ММ.ГГГГ' или 'ДД.ММ.ГГГГ - ДД.ММ.ГГГГ'.")
+    await state.update_data(start_date=start_date, end_date=end_date)
+    await state.set_state(ContestCreationStates.entering_description)
+    await message.answer("Введите описание конкурса:", reply_markup=create_cancel_keyboard())
 
 
 # Хэндлер для обработки описания конкурса
-@router.message(lambda message: contests_col.find_one({"telegram_id": message.from_user.id, "step": "description"}))
-async def process_contest_description(message: types.Message):
+@router.message(ContestCreationStates.entering_description)
+async def process_contest_description(message: types.Message, state: FSMContext):
     if not message.text:
         await message.answer("Пожалуйста, введите описание конкурса текстом.")
         return
-    # Обновляем конкурс, добавляя описание
-    contests_col.update_one(
-        {"telegram_id": message.from_user.id, "step": "description"},
-        {"$set": {"description": message.text, "step": "file"}}
-    )
+    await state.update_data(description=message.text)
+    await state.set_state(ContestCreationStates.uploading_files)
     await message.answer("Прикрепите файл (pdf, docx, doc, xlsx). Чтобы закончить загрузку файлов, нажмите /done.",
                          reply_markup=create_cancel_keyboard())
 
 
 # Хэндлер для обработки файла
-@router.message(lambda message: contests_col.find_one({"telegram_id": message.from_user.id, "step": "file"}))
-async def process_contest_file(message: types.Message):
+@router.message(ContestCreationStates.uploading_files)
+async def process_contest_file(message: types.Message, state: FSMContext):
     if message.document:
-        file_ext = message.document.file_name.split(".")[-1].lower()
-        if file_ext not in ["pdf", "docx", "doc", "xlsx"]:
-            await message.answer("Недопустимый формат файла. Разрешены только pdf, docx, doc, xlsx.")
+        file_name = await download_contest_file(message)
+        if not file_name:
             return
 
-        file_id = message.document.file_id
-        file = await message.bot.get_file(file_id)
-        file_path = file.file_path
-        file_name = message.document.file_name
-        await message.bot.download_file(file_path, os.path.join("uploads", file_name))
-
-        # Добавляем файл в список файлов конкурса
-        contests_col.update_one(
-            {"telegram_id": message.from_user.id, "step": "file"},
-            {"$push": {"files": file_name}}
+        # Добавляем файл в черновик конкурса; file_id документа пригодится для повторной отправки без загрузки
+        data = await state.get_data()
+        await state.update_data(
+            files=data.get("files", []) + [file_name],
+            file_ids=data.get("file_ids", []) + [{"name": file_name, "file_id": message.document.file_id}],
         )
         await message.answer(f"Файл {file_name} успешно загружен. Прикрепите еще файлы или нажмите /done.")
     elif message.text == "/done":
         # Если пользователь нажал /done, завершаем загрузку файлов
-        contest = contests_col.find_one({"telegram_id": message.from_user.id, "step": "file"})
-        if contest:
-            contests_col.update_one(
-                {"telegram_id": message.from_user.id, "step": "file"},
-                {"$set": {"step": "responsible"}}
-            )
-            await message.answer("Загрузка файлов завершена. Теперь выберите ответственного за конкурс.")
-            await show_responsible_list(message)
+        await state.set_state(ContestCreationStates.selecting_responsible)
+        await message.answer("Загрузка файлов завершена. Теперь выберите ответственного за конкурс.")
+        await show_responsible_list(message)
     else:
         await message.answer("Пожалуйста, прикрепите файл или нажмите /done для завершения.",
                              reply_markup=create_cancel_keyboard())
 
 
+def delete_contests_keyboard(page) -> InlineKeyboardMarkup:
+    def button_text(contest: dict) -> str:
+        # Предлагаем удалить конкурсы, которые закончились больше двух недель назад
+        if datetime.now() > contest["end_date"] + timedelta(weeks=2):
+            return contest["name"] + " 🗑️"
+        return contest["name"]
+
+    return get_contest_selection_keyboard(
+        page, "d", item_callback=lambda contest: f"select_contest_{contest['_id']}", item_text=button_text
+    )
+
+
+def edit_contests_keyboard(page) -> InlineKeyboardMarkup:
+    return get_contest_selection_keyboard(
+        page, "e",
+        item_callback=lambda contest: f"edit_contest_{contest['_id']}",
+        item_text=lambda contest: contest["name"],
+    )
+
+
+# Переход по страницам списков конкурсов для удаления и изменения
+@router.callback_query(lambda query: query.data.startswith((f"{CONTEST_PAGE_PREFIX}:d:", f"{CONTEST_PAGE_PREFIX}:e:")))
+async def show_admin_contests_page(query: types.CallbackQuery):
+    cursor, backward = parse_contest_page_callback(query.data)
+    page = await contests_repo.page(cursor, backward, limit=CONTESTS_PER_PAGE)
+    if not page.contests:
+        page = await contests_repo.page(limit=CONTESTS_PER_PAGE)
+    build_keyboard = delete_contests_keyboard if query.data.split(":")[1] == "d" else edit_contests_keyboard
+    await query.message.edit_reply_markup(reply_markup=build_keyboard(page))
+    await query.answer()
+
+
 #  Хэндлер для отображения списка конкурсов
 @router.message(lambda message: message.text == "Удалить конкурсы")
 async def edit_contests(message: types.Message):
-    # Получаем список всех конкурсов
-    contests = list(contests_col.find().sort("start_date", 1))
+    # Получаем первую страницу конкурсов
+    page = await contests_repo.page(limit=CONTESTS_PER_PAGE)
 
-    if not contests:
+    if not page.contests:
         await message.answer("Нет доступных конкурсов для редактирования.")
         return
 
-    # Создаем inline-клавиатуру с конкурсами
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-    for contest in contests:
-        contest_name = contest["name"]
-        end_date = contest["end_date"]
-
-        # Проверяем, прошло ли две недели с даты окончания конкурса
-        if datetime.now() > end_date + timedelta(weeks=2):
-            contest_name += " 🗑️"  # Добавляем значок для предложения удалить
-
-        # Добавляем кнопку с названием конкурса
-        keyboard.inline_keyboard.append(
-            [InlineKeyboardButton(text=contest_name, callback_data=f"select_contest_{contest['_id']}")]
-        )
-
-    await message.answer("Выберите конкурс для удаления:", reply_markup=keyboard)
+    await message.answer("Выберите конкурс для удаления:", reply_markup=delete_contests_keyboard(page))
 
 
 # Хэндлер для обработки выбора конкурса
@@ -205,7 +219,7 @@ async def select_contest(query: types.CallbackQuery):
     contest_id = query.data.split("_")[2]
 
     # Ищем конкурс в базе данных
-    contest = contests_col.find_one({"_id": ObjectId(contest_id)})
+    contest = await contests_repo.find_one({"_id": ObjectId(contest_id)})
 
     if not contest:
         await query.answer("Конкурс не найден.")
@@ -229,14 +243,14 @@ async def delete_contest(query: types.CallbackQuery):
     contest_id = query.data.split("_")[2]
 
     # Ищем конкурс в базе данных
-    contest = contests_col.find_one({"_id": ObjectId(contest_id)})
+    contest = await contests_repo.find_one({"_id": ObjectId(contest_id)})
 
     if not contest:
         await query.answer("Конкурс не найден.")
         return
 
     # Удаляем конкурс из базы данных
-    result = contests_col.delete_one({"_id": ObjectId(contest_id)})
+    result = await contests_repo.delete_one({"_id": ObjectId(contest_id)})
 
     if result.deleted_count > 0:
         await query.message.edit_text(f"Конкурс '{contest['name']}' успешно удален.")
@@ -247,29 +261,21 @@ async def delete_contest(query: types.CallbackQuery):
 # Хэндлер для отображения списка конкурсов для изменения
 @router.message(lambda message: message.text == "Изменить конкурс")
 async def show_contests_for_edit(message: types.Message):
-    # Получаем список всех конкурсов
-    contests = list(contests_col.find().sort("start_date", 1))
+    # Получаем первую страницу конкурсов
+    page = await contests_repo.page(limit=CONTESTS_PER_PAGE)
 
-    if not contests:
+    if not page.contests:
         await message.answer("Нет доступных конкурсов для редактирования.")
         return
 
-    # Создаем inline-клавиатуру с конкурсами
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-    for contest in contests:
-        # Добавляем кнопку с названием конкурса
-        keyboard.inline_keyboard.append(
-            [InlineKeyboardButton(text=contest["name"], callback_data=f"edit_contest_{contest['_id']}")]
-        )
-
-    await message.answer("Выберите конкурс для редактирования:", reply_markup=keyboard)
+    await message.answer("Выберите конкурс для редактирования:", reply_markup=edit_contests_keyboard(page))
 
 
 # Хэндлер для выбора поля конкурса для редактирования
 @router.callback_query(lambda query: query.data.startswith("edit_contest_"))
 async def select_contest_field(query: types.CallbackQuery):
     contest_id = query.data.split("_")[2]
-    contest = contests_col.find_one({"_id": ObjectId(contest_id)})
+    contest = await contests_repo.find_one({"_id": ObjectId(contest_id)})
 
     if not contest:
         await query.answer("Конкурс не найден.")
@@ -289,92 +295,61 @@ async def select_contest_field(query: types.CallbackQuery):
     )
 
 
-# Хэндлер для редактирования названия
-@router.callback_query(lambda query: query.data.startswith("edit_field_name_"))
-async def edit_contest_name(query: types.CallbackQuery):
+async def start_field_edit(query: types.CallbackQuery, state: FSMContext, edit_state, prompt: str):
+    """Запоминает редактируемый конкурс в FSM и переводит администратора в нужное состояние"""
     contest_id = query.data.split("_")[3]
-    contests_col.update_one(
-        {"_id": ObjectId(contest_id)},
-        {"$set": {"edit_step": "name"}}
-    )
+    await state.clear()
+    await state.set_state(edit_state)
+    await state.update_data(contest_id=contest_id, files=[])
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_edit")]
     ])
-    await query.message.edit_text("Введите новое название конкурса:", reply_markup=keyboard)
+    await query.message.edit_text(prompt, reply_markup=keyboard)
+
+
+# Хэндлер для редактирования названия
+@router.callback_query(lambda query: query.data.startswith("edit_field_name_"))
+async def edit_contest_name(query: types.CallbackQuery, state: FSMContext):
+    await start_field_edit(query, state, ContestEditStates.editing_name, "Введите новое название конкурса:")
 
 
 # Хэндлер для редактирования дат
 @router.callback_query(lambda query: query.data.startswith("edit_field_dates_"))
-async def edit_contest_dates(query: types.CallbackQuery):
-    contest_id = query.data.split("_")[3]
-    contests_col.update_one(
-        {"_id": ObjectId(contest_id)},
-        {"$set": {"edit_step": "dates"}}
-    )
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_edit")]
-    ])
-    await query.message.edit_text(
-        "Введите новые даты проведения конкурса (в формате ДД.ММ.ГГГГ - ДД.ММ.ГГГГ или ДД.ММ.ГГГГ):",
-        reply_markup=keyboard
+async def edit_contest_dates(query: types.CallbackQuery, state: FSMContext):
+    await start_field_edit(
+        query, state, ContestEditStates.editing_dates,
+        "Введите новые даты проведения конкурса (в формате ДД.ММ.ГГГГ - ДД.ММ.ГГГГ или ДД.ММ.ГГГГ):"
     )
 
 
 # Хэндлер для редактирования описания
 @router.callback_query(lambda query: query.data.startswith("edit_field_description_"))
-async def edit_contest_description(query: types.CallbackQuery):
-    contest_id = query.data.split("_")[3]
-    contests_col.update_one(
-        {"_id": ObjectId(contest_id)},
-        {"$set": {"edit_step": "description"}}
-    )
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_edit")]
-    ])
-    await query.message.edit_text("Введите новое описание конкурса:", reply_markup=keyboard)
+async def edit_contest_description(query: types.CallbackQuery, state: FSMContext):
+    await start_field_edit(query, state, ContestEditStates.editing_description, "Введите новое описание конкурса:")
 
 
 # Хэндлер для редактирования файлов
 @router.callback_query(lambda query: query.data.startswith("edit_field_files_"))
-async def edit_contest_files(query: types.CallbackQuery):
-    contest_id = query.data.split("_")[3]
-    contests_col.update_one(
-        {"_id": ObjectId(contest_id)},
-        {"$set": {"edit_step": "files"}}
-    )
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_edit")]
-    ])
-    await query.message.edit_text(
-        "Прикрепите новые файлы (pdf, docx, doc, xlsx). Чтобы закончить загрузку файлов, нажмите /done.",
-        reply_markup=keyboard
+async def edit_contest_files(query: types.CallbackQuery, state: FSMContext):
+    await start_field_edit(
+        query, state, ContestEditStates.uploading_files,
+        "Прикрепите новые файлы (pdf, docx, doc, xlsx). Чтобы закончить загрузку файлов, нажмите /done."
     )
 
 
 # Хэндлер для редактирования ответственного
 @router.callback_query(lambda query: query.data.startswith("edit_field_responsible_"))
-async def edit_contest_responsible(query: types.CallbackQuery):
-    contest_id = query.data.split("_")[3]
-    contests_col.update_one(
-        {"_id": ObjectId(contest_id)},
-        {"$set": {"edit_step": "responsible"}}
+async def edit_contest_responsible(query: types.CallbackQuery, state: FSMContext):
+    await start_field_edit(
+        query, state, ContestEditStates.selecting_responsible, "Выберите нового ответственного за конкурс:"
     )
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_edit")]
-    ])
-    await query.message.edit_text("Выберите нового ответственного за конкурс:", reply_markup=keyboard)
     await show_responsible_list(query.message)
 
 
 # Хэндлер для отмены редактирования
 @router.callback_query(lambda query: query.data == "cancel_edit")
-async def cancel_edit(query: types.CallbackQuery):
-    contest = contests_col.find_one({"edit_step": {"$ne": None}})
-    if contest:
-        contests_col.update_one(
-            {"_id": contest["_id"]},
-            {"$set": {"edit_step": None}}
-        )
+async def cancel_edit(query: types.CallbackQuery, state: FSMContext):
+    await state.clear()
     await query.message.edit_text(
         "Редактирование отменено.",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[])
@@ -385,106 +360,73 @@ async def cancel_edit(query: types.CallbackQuery):
     )
 
 
+async def finish_edit(message: types.Message, state: FSMContext, fields: dict, text: str):
+    """Сохраняет изменённые поля конкурса и завершает редактирование"""
+    data = await state.get_data()
+    await contests_repo.update_one({"_id": ObjectId(data["contest_id"])}, {"$set": fields})
+    await state.clear()
+    await message.answer(text, reply_markup=await send_role_keyboard(message.bot, message.from_user.id, "admin"))
+
+
 # Обработчики для сохранения изменений
-@router.message(lambda message: contests_col.find_one({"edit_step": "name", "telegram_id": message.from_user.id}))
-async def save_contest_name(message: types.Message):
+@router.message(ContestEditStates.editing_name)
+async def save_contest_name(message: types.Message, state: FSMContext):
     if not message.text:
         await message.answer("Пожалуйста, введите название конкурса текстом.")
         return
-    
-    contest = contests_col.find_one({"edit_step": "name", "telegram_id": message.from_user.id})
-    contests_col.update_one(
-        {"_id": contest["_id"]},
-        {"$set": {"name": message.text, "edit_step": None}}
-    )
-    await message.answer(
-        f"Название конкурса успешно изменено на: {message.text}",
-        reply_markup=await send_role_keyboard(message.bot, message.from_user.id, "admin")
-    )
+    await finish_edit(message, state, {"name": message.text},
+                      f"Название конкурса успешно изменено на: {message.text}")
 
 
-@router.message(lambda message: contests_col.find_one({"edit_step": "dates", "telegram_id": message.from_user.id}))
-async def save_contest_dates(message: types.Message):
+@router.message(ContestEditStates.editing_dates)
+async def save_contest_dates(message: types.Message, state: FSMContext):
     if not message.text:
         await message.answer("Пожалуйста, введите даты в текстовом формате.")
         return
 
     try:
-        dates = message.text.split(" - ")
-        if len(dates) == 1:
-            end_date = datetime.strptime(dates[0].strip(), "%d.%m.%Y")
-            start_date = None
-        elif len(dates) == 2:
-            start_date = datetime.strptime(dates[0].strip(), "%d.%m.%Y")
-            end_date = datetime.strptime(dates[1].strip(), "%d.%m.%Y")
-            if start_date > end_date:
-                await message.answer("Дата начала не может быть позже даты окончания. Попробуйте снова.")
-                return
-        else:
-            await message.answer("Некорректный формат дат. Введите 'ДД.ММ.ГГГГ' или 'ДД.ММ.ГГГГ - ДД.ММ.ГГГГ'.")
-            return
-
-        contest = contests_col.find_one({"edit_step": "dates", "telegram_id": message.from_user.id})
-        contests_col.update_one(
-            {"_id": contest["_id"]},
-            {"$set": {
-                "start_date": start_date,
-                "end_date": end_date,
-                "edit_step": None
-            }}
-        )
-        await message.answer(
-            "Даты конкурса успешно изменены.",
-            reply_markup=await send_role_keyboard(message.bot, message.from_user.id, "admin")
-        )
+        start_date, end_date = parse_contest_dates(message.text)
+    except ValueError as e:
+        await message.answer(str(e))
+        return
 
-    except ValueError:
-        await message.answer("Некорректный формат дат. Введите 'ДД.ММ.ГГГГ' или 'ДД.ММ.ГГГГ - ДД.ММ.ГГГГ'.")
+    # Для нового срока окончания напоминания участникам отправляются заново
+    await finish_edit(message, state, {"start_date": start_date, "end_date": end_date, "reminders": []},
+                      "Даты конкурса успешно изменены.")
 
 
-@router.message(lambda message: contests_col.find_one({"edit_step": "description", "telegram_id": message.from_user.id}))
-async def save_contest_description(message: types.Message):
+@router.message(ContestEditStates.editing_description)
+async def save_contest_description(message: types.Message, state: FSMContext):
     if not message.text:
         await message.answer("Пожалуйста, введите описание конкурса текстом.")
         return
-    
-    contest = contests_col.find_one({"edit_step": "description", "telegram_id": message.from_user.id})
-    contests_col.update_one(
-        {"_id": contest["_id"]},
-        {"$set": {"description": message.text, "edit_step": None}}
-    )
-    await message.answer(
-        "Описание конкурса успешно изменено.",
-        reply_markup=await send_role_keyboard(message.bot, message.from_user.id, "admin")
-    )
+    await finish_edit(message, state, {"description": message.text}, "Описание конкурса успешно изменено.")
 
 
-@router.message(lambda message: contests_col.find_one({"edit_step": "files", "telegram_id": message.from_user.id}))
-async def save_contest_files(message: types.Message):
+@router.message(ContestEditStates.uploading_files)
+async def save_contest_files(message: types.Message, state: FSMContext):
     if message.document:
-        file_ext = message.document.file_name.split(".")[-1].lower()
-        if file_ext not in ["pdf", "docx", "doc", "xlsx"]:
-            await message.answer("Недопустимый формат файла. Разрешены только pdf, docx, doc, xlsx.")
+        file_name = await download_contest_file(message)
+        if not file_name:
             return
 
-        file_id = message.document.file_id
-        file = await message.bot.get_file(file_id)
-        file_path = file.file_path
-        file_name = message.document.file_name
-        await message.bot.download_file(file_path, os.path.join("uploads", file_name))
-
-        contest = contests_col.find_one({"edit_step": "files", "telegram_id": message.from_user.id})
-        contests_col.update_one(
-            {"_id": contest["_id"]},
-            {"$push": {"files": file_name}}
+        data = await state.get_data()
+        await state.update_data(
+            files=data.get("files", []) + [file_name],
+            file_ids=data.get("file_ids", []) + [{"name": file_name, "file_id": message.document.file_id}],
         )
         await message.answer(f"Файл {file_name} успешно загружен. Прикрепите еще файлы или нажмите /done.")
     elif message.text == "/done":
-        contest = contests_col.find_one({"edit_step": "files", "telegram_id": message.from_user.id})
-        contests_col.update_one(
-            {"_id": contest["_id"]},
-            {"$set": {"edit_step": None}}
-        )
+        # Новые файлы добавляются в конкурс одной операцией после завершения загрузки
+        data = await state.get_data()
+        if data.get("files"):
+            contest_id = ObjectId(data["contest_id"])
+            await contests_repo.update_one(
+                {"_id": contest_id},
+                {"$push": {"files": {"$each": data["files"]}}}
+            )
+            await contests_repo.add_file_ids(contest_id, data.get("file_ids", []))
+        await state.clear()
         await message.answer(
             "Загрузка файлов завершена.",
             reply_markup=await send_role_keyboard(message.bot, message.from_user.id, "admin")
@@ -493,4 +435,18 @@ async def save_contest_files(message: types.Message):
         await message.answer(
             "Пожалуйста, прикрепите файл или нажмите /done для завершения.",
             reply_markup=create_cancel_keyboard()
-        ) 
\ No newline at end of file
+        )
+
+
+# Хэндлер для выбора нового ответственного при редактировании
+@router.callback_query(ContestEditStates.selecting_responsible, lambda query: query.data.startswith("responsible_"))
+async def save_contest_responsible(query: types.CallbackQuery, state: FSMContext):
+    responsible_id = int(query.data.split("_")[1])
+    data = await state.get_data()
+    await contests_repo.update_one(
+        {"_id": ObjectId(data["contest_id"])},
+        {"$set": {"responsible_id": responsible_id}}
+    )
+    await state.clear()
+    await query.answer("Ответственный изменён.")
+    await query.message.edit_text("Ответственный за конкурс успешно изменён.")
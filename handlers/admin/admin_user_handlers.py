@@ -7,8 +7,10 @@ from bson import ObjectId
 from aiogram.filters import Command
 
 from config import logger
-from services.database import users_col
-from utils.user_utils import show_user_list
+from services.bot_commands import sync_user_commands_by_id
+from services.database import users_repo
+from handlers.admin.user_picker import UserPicker
+from utils.user_utils import USERS_PER_PAGE, show_user_list, user_page_navigation
 from utils.role_utils import send_role_keyboard
 
 router = Router()
@@ -53,7 +55,7 @@ async def view_user_info_handler(query: types.CallbackQuery):
     # Если роль "view_user_info", отображаем полную информацию о пользователе
     logger.info(role)
     if role == "view_user_info":
-        user = users_col.find_one({"telegram_id": int(user_id)})
+        user = await users_repo.get(int(user_id))
         if not user:
             await query.answer("Пользователь не найден.")
             return
@@ -103,7 +105,7 @@ async def delete_user_handler(query: types.CallbackQuery):
     user_id = query.data.split("_")[2]  # Получаем ID пользователя из callback_data
 
     # Получаем данные пользователя из базы данных
-    user = users_col.find_one({"telegram_id": int(user_id)})
+    user = await users_repo.get(int(user_id))
     if not user:
         await query.message.edit_text("Пользователь не найден.")
         await query.answer()
@@ -116,7 +118,7 @@ async def delete_user_handler(query: types.CallbackQuery):
         return
 
     # Удаляем пользователя из базы данных
-    result = users_col.delete_one({"telegram_id": int(user_id)})
+    result = await users_repo.delete(int(user_id))
 
     if result.deleted_count > 0:
         await query.message.edit_text("Пользователь успешно удален.")
@@ -136,6 +138,31 @@ async def cancel_delete_user_handler(query: types.CallbackQuery):
     await query.answer()
 
 
+def _role_picker(key: str, role: str) -> UserPicker:
+    # Для изменения роли пользователя
+    return UserPicker(
+        key,
+        f"Выберите пользователя, которому нужно назначить роль '{role}':",
+        item_callback=lambda user: f"usereditrole_{user['telegram_id']}_{role}",
+        item_text=lambda user: user["full_name"],
+        query={"role": {"$ne": role}},
+    )
+
+
+# Списки пользователей для кнопок выбора буквы по значению role из callback_data
+USER_PICKERS = {
+    "view_user_info": UserPicker(
+        "vi",
+        "Выберите пользователя:",
+        item_callback=lambda user: f"userinfo_{user['telegram_id']}_view_user_info",
+        item_text=lambda user: user["full_name"],
+    ),
+    "admin": _role_picker("ra", "admin"),
+    "responsible": _role_picker("rr", "responsible"),
+    "teacher": _role_picker("rt", "teacher"),
+}
+
+
 # Хэндлер для обработки выбора буквы
 @router.callback_query(lambda query: query.data.startswith("letter_"))
 async def process_letter_selection(query: types.CallbackQuery):
@@ -145,27 +172,16 @@ async def process_letter_selection(query: types.CallbackQuery):
         return
 
     _, letter, role = parts[0], parts[1], "_".join(parts[2:])  # Объединяем оставшиеся части для роли
+    picker = USER_PICKERS.get(role)
+    if picker is None:
+        await query.answer("Некорректные данные.")
+        return
 
-    users = list(users_col.find({"full_name": {"$regex": f"^{letter}", "$options": "i"}}).sort("full_name", 1))
-    if not users:
+    # Список по букве — это поиск по началу ФИО: диапазон по индексу full_name_key
+    if not await picker.show(query.message, prefix=letter, edit=True):
         await query.answer("Пользователи не найдены.")
         return
-
-    # Создание инлайн-клавиатуры с пользователями
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-    for user in users:
-        if role == "view_user_info":
-            # Для просмотра информации о пользователе
-            callback_data = f"userinfo_{user['telegram_id']}_view_user_info"
-        else:
-            # Для изменения роли пользователя
-            callback_data = f"usereditrole_{user['telegram_id']}_{role}"
-
-        keyboard.inline_keyboard.append(
-            [InlineKeyboardButton(text=user["full_name"], callback_data=callback_data)]
-        )
-
-    await query.message.edit_text(f"Пользователи, фамилии которых начинаются на {letter}:", reply_markup=keyboard)
+    await query.answer()
 
 # Хэндлер для обработки выбора пользователя
 @router.callback_query(lambda query: query.data.startswith("usereditrole_"))
@@ -180,7 +196,7 @@ async def process_user_selection(query: types.CallbackQuery):
     role = "_".join(parts[2:])  # Объединяем оставшиеся части для роли
 
     # Проверка, является ли пользователь администратором
-    user = users_col.find_one({"telegram_id": user_id})
+    user = await users_repo.get(user_id)
     if not user:
         await query.answer("Пользователь не найден.")
         return
@@ -207,9 +223,12 @@ async def process_user_selection(query: types.CallbackQuery):
     current_roles.append(role)
 
     # Обновление роли пользователя
-    users_col.update_one({"telegram_id": user_id}, {"$set": {"role": current_roles}})
+    await users_repo.update(user_id, {"role": current_roles})
     await query.answer(f"Роль '{role}' успешно назначена пользователю.")
 
+    # Новая роль может открывать дополнительные команды
+    await sync_user_commands_by_id(query.bot, user_id)
+
     # Уведомление пользователя о новой роли
     try:
         await query.bot.send_message(user_id, f"Вам назначена новая роль: {role}.")
@@ -234,24 +253,34 @@ async def process_user_selection(query: types.CallbackQuery):
 
 
 # Хэндлер для обработки кнопки "Показать всех пользователей"
-@router.callback_query(lambda query: query.data.startswith("show_all_users_"))
+@router.callback_query(lambda query: query.data.startswith(("show_all_users_", "allusers_")))
 async def show_all_users_handler(query: types.CallbackQuery):
-    _, role = query.data.split("_", 2)[0], query.data.split("_", 2)[2]  # Получаем роль из callback_data
-    
-    users = list(users_col.find({"full_name": {"$exists": True}}).sort("full_name", 1))
-    if not users:
+    # show_all_users_<роль> — первая страница, allusers_<n|p>_<telegram_id>_<роль> — переход по страницам
+    if query.data.startswith("allusers_"):
+        _, direction, cursor, role = query.data.split("_", 3)
+        backward, cursor = direction == "p", int(cursor)
+    else:
+        role = query.data.split("_", 3)[3]  # Получаем роль из callback_data
+        backward, cursor = False, None
+
+    page = await users_repo.directory_page(cursor=cursor, backward=backward, limit=USERS_PER_PAGE)
+    if not page.users:
         await query.answer("Пользователи не найдены.")
         return
     
-    # Формируем текстовый список всех пользователей
+    # Формируем текстовый список пользователей страницы
     user_text = "Список всех пользователей:\n\n"
-    for i, user in enumerate(users, 1):
-        user_text += f"{i}. {user.get('full_name', 'Без имени')} - {user.get('role', 'Без роли')}\n"
+    for user in page.users:
+        user_text += f"• {user.get('full_name', 'Без имени')} - {user.get('role', 'Без роли')}\n"
     
-    # Создаем кнопку "Назад"
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="◀️ Назад", callback_data=f"back_to_letters_{role}")]
-    ])
+    # Кнопки навигации и "Назад"
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[])
+    navigation = user_page_navigation(
+        page, lambda direction, telegram_id: f"allusers_{direction}_{telegram_id}_{role}"
+    )
+    if navigation:
+        keyboard.inline_keyboard.append(navigation)
+    keyboard.inline_keyboard.append([InlineKeyboardButton(text="◀️ Назад", callback_data=f"back_to_letters_{role}")])
     
     await query.message.edit_text(user_text, reply_markup=keyboard)
     await query.answer()
@@ -259,40 +288,26 @@ async def show_all_users_handler(query: types.CallbackQuery):
 # Хэндлер для обработки кнопки "Назад" к выбору букв
 @router.callback_query(lambda query: query.data.startswith("back_to_letters_"))
 async def back_to_letters_handler(query: types.CallbackQuery):
-    role = query.data.split("_")[3]  # Получаем роль из callback_data
+    role = query.data.split("_", 3)[3]  # Получаем роль из callback_data (она может содержать "_")
     
     # Вызываем функцию показа списка пользователей с выбором букв
     await show_user_list(query.message, role)
     await query.answer() 
 
+# Пользователи, у которых есть хотя бы одна роль
+users_with_roles_picker = UserPicker(
+    "rm",
+    "Выберите пользователя, у которого нужно удалить роль:",
+    item_callback=lambda user: f"remove_role_{user['telegram_id']}",
+    query={"role": {"$exists": True, "$nin": [None, "", []]}},
+)
+
+
 @router.message(Command("remove_role"))
 async def cmd_remove_role(message: types.Message):
     """Обработчик команды /remove_role для удаления роли у пользователя"""
-    # Получаем список всех пользователей
-    users = list(users_col.find())
-    
-    # Создаем клавиатуру с пользователями
-    keyboard = []
-    for user in users:
-        # Пропускаем пользователей без ролей
-        user_roles = user.get("role")
-        if not user_roles:
-            continue
-            
-        # Добавляем пользователя в клавиатуру
-        keyboard.append([{
-            "text": f"{user.get('full_name', 'Без имени')} ({user.get('telegram_id')})",
-            "callback_data": f"remove_role_{user.get('telegram_id')}"
-        }])
-    
-    if not keyboard:
-        await message.answer("Нет пользователей с ролями.")
-        return
-    
-    await message.answer(
-        "Выберите пользователя, у которого нужно удалить роль:",
-        reply_markup={"inline_keyboard": keyboard}
-    )
+    await users_with_roles_picker.show(message)
+
 
 @router.callback_query(lambda query: query.data.startswith("remove_role_"))
 async def process_remove_role_selection(query: types.CallbackQuery):
@@ -300,7 +315,7 @@ async def process_remove_role_selection(query: types.CallbackQuery):
     user_id = int(query.data.split("_")[2])
     
     # Получаем информацию о пользователе
-    user = users_col.find_one({"telegram_id": user_id})
+    user = await users_repo.get(user_id)
     if not user:
         await query.message.edit_text("Пользователь не найден.")
         await query.answer()
@@ -343,7 +358,7 @@ async def process_remove_role_confirmation(query: types.CallbackQuery):
     role_to_remove = "_".join(parts[4:])  # Объединяем оставшиеся части для роли
     
     # Получаем информацию о пользователе
-    user = users_col.find_one({"telegram_id": user_id})
+    user = await users_repo.get(user_id)
     if not user:
         await query.message.edit_text("Пользователь не найден.")
         await query.answer()
@@ -372,10 +387,10 @@ async def process_remove_role_confirmation(query: types.CallbackQuery):
             user_roles = None
     
     # Обновляем данные пользователя в базе
-    users_col.update_one(
-        {"telegram_id": user_id},
-        {"$set": {"role": user_roles}}
-    )
+    await users_repo.update(user_id, {"role": user_roles})
+
+    # Убираем команды, которые были доступны только с удалённой ролью
+    await sync_user_commands_by_id(query.bot, user_id)
     
     # Отправляем сообщение пользователю об удалении роли
     try:
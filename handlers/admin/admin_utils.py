@@ -1,5 +1,5 @@
 from config import logger
-from services.database import users_col
+from services.notifications import notification_service
 
 
 # Уведомление всех пользователей о новом конкурсе
@@ -8,15 +8,5 @@ async def notify_all_users(contest_name, bot):
         logger.error("Название конкурса не указано.")
         return
 
-    users = users_col.find({"notifications_enabled": True})
-    if users is None:
-        logger.info("Не найдено пользователей для уведомления.")
-        return
-
-    logger.info(f"Bot: {bot}")
-
-    for user in users:
-        try:
-            await bot.send_message(user["telegram_id"], f"Уведомление: новый конкурс {contest_name}.")
-        except Exception as e:
-            logger.error(f"Не удалось уведомить пользователя {user['telegram_id']}: {e}") 
\ No newline at end of file
+    # Рассылка идёт в фоне: здесь уведомления только ставятся в очередь
+    await notification_service.notify_subscribers(f"Уведомление: новый конкурс {contest_name}.")
@@ -3,10 +3,11 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import BotCommand, BotCommandScopeChat
 
 from config import logger
-from services.database import users_col
+from services.bot_commands import sync_user_commands_by_id
+from services.database import users_repo
+from handlers.admin.user_picker import UserPicker
 from keyboards.contest_keyboard import get_cancel_keyboard
 from utils.role_utils import send_role_keyboard
 
@@ -17,37 +18,20 @@ class WatcherState(StatesGroup):
     selecting_user = State()
     confirming = State()
 
+# Пользователи, которым ещё не присвоена роль watcher (роль может быть строкой или массивом)
+watcher_candidates_picker = UserPicker(
+    "w",
+    "Выберите пользователя, которому нужно добавить роль watcher:",
+    item_callback=lambda user: f"watcher_{user['telegram_id']}",
+    query={"role": {"$ne": "watcher"}},
+)
+
 @router.message(Command("add_watcher"))
 async def cmd_add_watcher(message: Message, state: FSMContext):
     """Обработчик команды /add_watcher для добавления роли watcher"""
-    # Получаем список всех пользователей
-    users = list(users_col.find())
-    
-    # Создаем клавиатуру с пользователями
-    keyboard = []
-    for user in users:
-        # Пропускаем пользователей, у которых уже есть роль watcher
-        user_roles = user.get("role")
-        if isinstance(user_roles, list) and "watcher" in user_roles:
-            continue
-        if isinstance(user_roles, str) and user_roles == "watcher":
-            continue
-        
-        # Добавляем пользователя в клавиатуру
-        keyboard.append([{
-            "text": f"{user.get('full_name', 'Без имени')} ({user.get('telegram_id')})",
-            "callback_data": f"watcher_{user.get('telegram_id')}"
-        }])
-    
-    if not keyboard:
-        await message.answer("Нет пользователей, которым можно добавить роль watcher.")
-        return
-    
     await state.set_state(WatcherState.selecting_user)
-    await message.answer(
-        "Выберите пользователя, которому нужно добавить роль watcher:",
-        reply_markup={"inline_keyboard": keyboard}
-    )
+    if not await watcher_candidates_picker.show(message):
+        await state.clear()
 
 @router.callback_query(WatcherState.selecting_user, F.data.startswith("watcher_"))
 async def process_user_selection(callback: CallbackQuery, state: FSMContext):
@@ -58,7 +42,7 @@ async def process_user_selection(callback: CallbackQuery, state: FSMContext):
     await state.update_data(selected_user_id=user_id)
     
     # Получаем информацию о пользователе
-    user = users_col.find_one({"telegram_id": user_id})
+    user = await users_repo.get(user_id)
     if not user:
         await callback.message.answer("Пользователь не найден.")
         await state.clear()
@@ -93,7 +77,7 @@ async def process_confirmation(callback: CallbackQuery, state: FSMContext):
         return
     
     # Получаем информацию о пользователе
-    user = users_col.find_one({"telegram_id": user_id})
+    user = await users_repo.get(user_id)
     if not user:
         await callback.message.answer("Пользователь не найден.")
         await state.clear()
@@ -112,10 +96,7 @@ async def process_confirmation(callback: CallbackQuery, state: FSMContext):
         user_roles = [user_roles, "watcher"]
     
     # Обновляем данные пользователя в базе
-    users_col.update_one(
-        {"telegram_id": user_id},
-        {"$set": {"role": user_roles}}
-    )
+    await users_repo.update(user_id, {"role": user_roles})
 
     # Отправляем сообщение пользователю о присвоении роли наблюдателя
     await callback.bot.send_message(
@@ -128,20 +109,7 @@ async def process_confirmation(callback: CallbackQuery, state: FSMContext):
     await send_role_keyboard(callback.bot, user_id, user_roles)
 
     # Обновляем команды для пользователя
-    watcher_commands = [
-        BotCommand(command="start", description="Начать работу с ботом или перезапустить"),
-        BotCommand(command="watcher", description="Посмотреть доступные команды для наблюдателей"),
-        BotCommand(command="get_report", description="Получить отчет за период"),
-        BotCommand(command="contest", description="Заполнить участие в конкурсе"),
-    ]
-    
-    try:
-        await callback.bot.set_my_commands(
-            watcher_commands,
-            scope=BotCommandScopeChat(chat_id=user_id)
-        )
-    except Exception as e:
-        logger.error(f"Ошибка при установке команд для watcher {user_id}: {e}")
+    await sync_user_commands_by_id(callback.bot, user_id)
 
     await callback.message.edit_text(
         f"Пользователю {user.get('full_name', 'Без имени')} (ID: {user_id}) успешно присвоена роль наблюдателя."
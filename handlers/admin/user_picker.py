@@ -0,0 +1,145 @@
+"""
+Постраничный выбор пользователя с поиском по началу ФИО.
+
+Список читается страницами из users_repo.directory_page: условия отбора (например,
+«ещё не наблюдатель») выполняются в MongoDB, в бот попадают только поля для кнопок.
+callback_data кнопок навигации: up:<ключ списка>:<действие>:<telegram_id>:<поиск>,
+где действие — n (вперёд), p (назад), f (первая страница) или s (начать поиск).
+"""
+from typing import Callable, Dict, Optional
+
+from aiogram import F, Router, types
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from services.database import users_repo
+from utils.user_utils import USERS_PER_PAGE, user_page_navigation
+
+router = Router()
+
+CALLBACK_PREFIX = "up"
+# Сколько символов поискового запроса хранится в callback_data (лимит Telegram — 64 байта)
+SEARCH_PREFIX_LENGTH = 16
+
+# Зарегистрированные списки по ключу из callback_data
+_pickers: Dict[str, "UserPicker"] = {}
+
+
+class UserPickerStates(StatesGroup):
+    """Ожидание текста для поиска пользователя по ФИО"""
+    searching = State()
+
+
+def default_user_text(user: Dict) -> str:
+    return f"{user.get('full_name', 'Без имени')} ({user.get('telegram_id')})"
+
+
+class UserPicker:
+    """
+    Список пользователей для выбора.
+
+    Args:
+        key: Короткий уникальный ключ списка (входит в callback_data)
+        title: Текст сообщения над списком
+        item_callback: callback_data кнопки пользователя; её обрабатывает владелец списка
+        query: Дополнительные условия отбора пользователей
+        item_text: Текст кнопки пользователя
+    """
+
+    def __init__(
+        self,
+        key: str,
+        title: str,
+        item_callback: Callable[[Dict], str],
+        query: Optional[Dict] = None,
+        item_text: Callable[[Dict], str] = default_user_text,
+    ):
+        if key in _pickers:
+            raise ValueError(f"Список пользователей с ключом {key} уже зарегистрирован")
+        self.key = key
+        self.title = title
+        self.item_callback = item_callback
+        self.query = query
+        self.item_text = item_text
+        _pickers[key] = self
+
+    def _callback(self, action: str, telegram_id: Optional[int] = None, prefix: str = "") -> str:
+        return f"{CALLBACK_PREFIX}:{self.key}:{action}:{telegram_id or ''}:{prefix}"
+
+    async def show(
+        self,
+        message: types.Message,
+        prefix: str = "",
+        cursor: Optional[int] = None,
+        backward: bool = False,
+        edit: bool = False,
+    ) -> bool:
+        """
+        Показывает страницу списка новым сообщением или заменяет им message (edit=True).
+        Возвращает False, если подходящих пользователей нет.
+        """
+        prefix = prefix[:SEARCH_PREFIX_LENGTH]
+        page = await users_repo.directory_page(prefix, cursor, backward, limit=USERS_PER_PAGE, query=self.query)
+
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=self.item_text(user), callback_data=self.item_callback(user))]
+            for user in page.users
+        ])
+        navigation = user_page_navigation(page, lambda direction, telegram_id: self._callback(direction, telegram_id, prefix))
+        if navigation:
+            keyboard.inline_keyboard.append(navigation)
+        search_row = [InlineKeyboardButton(text="🔍 Поиск по ФИО", callback_data=self._callback("s"))]
+        if prefix:
+            search_row.append(InlineKeyboardButton(text="Показать всех", callback_data=self._callback("f")))
+        keyboard.inline_keyboard.append(search_row)
+
+        text = self.title
+        if prefix:
+            text += f"\n\nПоиск: «{prefix}»"
+        if not page.users:
+            text += "\n\nПользователи не найдены."
+
+        if edit:
+            await message.edit_text(text, reply_markup=keyboard)
+        else:
+            await message.answer(text, reply_markup=keyboard)
+        return bool(page.users)
+
+
+@router.callback_query(F.data.startswith(f"{CALLBACK_PREFIX}:"))
+async def process_picker_callback(query: types.CallbackQuery, state: FSMContext):
+    _, key, action, cursor, prefix = query.data.split(":", 4)
+    picker = _pickers.get(key)
+    if picker is None:
+        await query.answer("Список устарел, откройте его заново.")
+        return
+
+    if action == "s":
+        # Запоминаем состояние сценария, в котором открыт список, чтобы вернуться в него после поиска
+        await state.update_data(user_picker=key, user_picker_return_state=await state.get_state())
+        await state.set_state(UserPickerStates.searching)
+        await query.message.answer("Введите начало ФИО пользователя:")
+        await query.answer()
+        return
+
+    if action == "f":
+        await picker.show(query.message, edit=True)
+    else:
+        await picker.show(query.message, prefix, int(cursor) if cursor else None, backward=action == "p", edit=True)
+    await query.answer()
+
+
+@router.message(UserPickerStates.searching)
+async def process_picker_search(message: types.Message, state: FSMContext):
+    if not message.text:
+        await message.answer("Введите начало ФИО текстом.")
+        return
+
+    data = await state.get_data()
+    await state.set_state(data.get("user_picker_return_state"))
+    picker = _pickers.get(data.get("user_picker"))
+    if picker is None:
+        await message.answer("Список устарел, откройте его заново.")
+        return
+    await picker.show(message, prefix=message.text.strip())
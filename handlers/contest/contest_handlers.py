@@ -1,43 +1,113 @@
 from aiogram import Router, types
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile, InputMediaDocument
 from bson import ObjectId
 
-from services.database import contests_col, users_col
+from keyboards.contest_keyboard import (
+    CONTEST_PAGE_PREFIX, CONTESTS_PER_PAGE, get_contest_selection_keyboard, parse_contest_page_callback,
+)
+from services import file_io
+from services.database import contests_repo, users_repo
+from services.notifications import notification_service
 from config import logger
 import os
 
 # Создаем роутер
 router = Router()
 
+# Максимальное число документов в одной медиагруппе Telegram
+MEDIA_GROUP_LIMIT = 10
+
+
+async def send_contest_files(message: types.Message, contest: dict):
+    """
+    Отправляет вложения конкурса. Файлы с известным file_id отправляются без загрузки,
+    документы группируются в медиагруппы; с диска загружаются только файлы без file_id.
+    Полученные file_id сохраняются в конкурсе, только если отправлены все группы: иначе
+    в кэше остался бы неполный набор вложений.
+    """
+    cached = {entry["name"]: entry["file_id"] for entry in contest.get("file_ids", [])}
+
+    async def from_disk(file_name: str):
+        file_path = os.path.join("uploads", file_name)
+        if await file_io.exists(file_path):  # Проверяем, существует ли файл
+            return FSInputFile(file_path)
+        logger.error(f"Файл не найден: {file_path}")
+        await message.answer(f"Файл {file_name} не найден.")
+        return None
+
+    documents = []
+    for file_name in contest["files"]:
+        media = cached.get(file_name) or await from_disk(file_name)
+        if media:
+            documents.append((file_name, media))
+
+    new_file_ids = []
+    start = 0
+    while start < len(documents):
+        chunk = documents[start:start + MEDIA_GROUP_LIMIT]
+        try:
+            if len(chunk) == 1:
+                sent = [await message.answer_document(chunk[0][1])]
+            else:
+                sent = await message.answer_media_group([InputMediaDocument(media=media) for _, media in chunk])
+        except TelegramBadRequest as e:
+            if all(isinstance(media, FSInputFile) for _, media in chunk):
+                raise
+            # Сохранённый file_id стал недействительным: эту и следующие группы загружаем с диска,
+            # уже отправленные группы не повторяем. Новые file_id заменят устаревшие
+            logger.warning(f"Не удалось отправить файлы конкурса {contest['_id']} по file_id: {e}")
+            remaining = []
+            for file_name, media in documents[start:]:
+                if not isinstance(media, FSInputFile):
+                    media = await from_disk(file_name)
+                if media:
+                    remaining.append((file_name, media))
+            documents = documents[:start] + remaining
+            continue
+        for (file_name, media), sent_message in zip(chunk, sent):
+            if isinstance(media, FSInputFile) and sent_message.document:
+                new_file_ids.append({"name": file_name, "file_id": sent_message.document.file_id})
+        start += MEDIA_GROUP_LIMIT
+
+    await contests_repo.add_file_ids(contest["_id"], new_file_ids)
+
+
+def contests_list_keyboard(page) -> InlineKeyboardMarkup:
+    def button_text(contest: dict) -> str:
+        start_date_str = (
+            contest["start_date"].strftime("%d.%m.%Y")
+            if "start_date" in contest and contest["start_date"]
+            else "Не указана"
+        )
+        return f"{contest['name']} ({start_date_str} - {contest['end_date'].strftime('%d.%m.%Y')})"
 
+    return get_contest_selection_keyboard(
+        page, "l", item_callback=lambda contest: f"contest_{contest['_id']}", item_text=button_text
+    )
 
 
 # Хэндлер для отображения списка конкурсов
 @router.message(lambda message: message.text == "Список конкурсов")
 async def show_contests_list(message: types.Message):
-    contests = list(contests_col.find({}).sort("start_date", 1))  # Сортировка по дате начала
-    if not contests:
+    # Читается только первая страница, остальные — по кнопкам навигации
+    page = await contests_repo.page(limit=CONTESTS_PER_PAGE)
+    if not page.contests:
         await message.answer("Конкурсы не найдены.")
         return
 
-    # Создание инлайн-клавиатуры с конкурсами
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-    for contest in contests:
-        # Проверяем наличие обязательных полей
-        if "name" in contest and "end_date" in contest:
-            start_date_str = (
-                contest["start_date"].strftime("%d.%m.%Y")
-                if "start_date" in contest and contest["start_date"]
-                else "Не указана"
-            )
-            button_text = f"{contest['name']} ({start_date_str} - {contest['end_date'].strftime('%d.%m.%Y')})"
-            keyboard.inline_keyboard.append(
-                [InlineKeyboardButton(text=button_text, callback_data=f"contest_{contest['_id']}")]
-            )
-        else:
-            logger.warning(f"Конкурс с _id {contest['_id']} пропущен из-за отсутствия обязательных полей.")
-
-    await message.answer("Список конкурсов:", reply_markup=keyboard)
+    await message.answer("Список конкурсов:", reply_markup=contests_list_keyboard(page))
+
+
+# Хэндлер для перехода по страницам списка конкурсов
+@router.callback_query(lambda query: query.data.startswith(f"{CONTEST_PAGE_PREFIX}:l:"))
+async def show_contests_page(query: types.CallbackQuery):
+    cursor, backward = parse_contest_page_callback(query.data)
+    page = await contests_repo.page(cursor, backward, limit=CONTESTS_PER_PAGE)
+    if not page.contests:
+        page = await contests_repo.page(limit=CONTESTS_PER_PAGE)
+    await query.message.edit_reply_markup(reply_markup=contests_list_keyboard(page))
+    await query.answer()
 
 
 # Хэндлер для обработки выбора конкурса
@@ -48,14 +118,14 @@ async def view_contest_details(query: types.CallbackQuery):
 
     try:
         # Преобразуем строку в ObjectId
-        contest = contests_col.find_one({"_id": ObjectId(contest_id)})
+        contest = await contests_repo.get(ObjectId(contest_id))
         if not contest:
             await query.answer("Конкурс не найден.")
             return
 
         # Получаем имя ответственного
-        responsible = users_col.find_one({"telegram_id": contest.get("responsible_id")})
-        responsible_name = responsible["full_name"] if responsible else "Неизвестно"
+        responsible_id = contest.get("responsible_id")
+        responsible_name = (await users_repo.get_names([responsible_id])).get(responsible_id, "Неизвестно")
 
         # Формируем сообщение с информацией о конкурсе
         start_date_str = (
@@ -86,19 +156,11 @@ async def view_contest_details(query: types.CallbackQuery):
 
         # Если есть файлы, отправляем их
         if contest.get("files"):
-            for file_name in contest["files"]:
-                file_path = os.path.join("uploads", file_name)
-                if os.path.exists(file_path):  # Проверяем, существует ли файл
-                    try:
-                        # Используем FSInputFile для отправки файла
-                        file_to_send = FSInputFile(file_path)
-                        await query.message.answer_document(file_to_send)
-                    except Exception as e:
-                        logger.error(f"Не удалось отправить файл {file_name}: {e}")
-                        await query.message.answer(f"Произошла ошибка при отправке файла {file_name}.")
-                else:
-                    logger.error(f"Файл не найден: {file_path}")
-                    await query.message.answer(f"Файл {file_name} не найден.")
+            try:
+                await send_contest_files(query.message, contest)
+            except Exception as e:
+                logger.error(f"Не удалось отправить файлы конкурса {contest_id}: {e}")
+                await query.message.answer("Произошла ошибка при отправке файлов конкурса.")
     except Exception as e:
         logger.error(f"Ошибка при обработке конкурса: {e}")
         await query.answer("Произошла ошибка при обработке конкурса.")
@@ -111,13 +173,13 @@ async def process_join_contest(query: types.CallbackQuery):
 
     try:
         # Находим конкурс
-        contest = contests_col.find_one({"_id": ObjectId(contest_id)})
+        contest = await contests_repo.get(ObjectId(contest_id))
         if not contest:
             await query.answer("Конкурс не найден.")
             return
 
-        # Находим пользователя
-        user = users_col.find_one({"telegram_id": user_id})
+        # Находим пользователя (через кэш профилей)
+        user = await users_repo.get_cached(user_id)
         if not user:
             await query.answer("Пользователь не найден.")
             return
@@ -130,7 +192,7 @@ async def process_join_contest(query: types.CallbackQuery):
         )
 
         # Добавляем пользователя в список участников конкурса
-        contests_col.update_one(
+        await contests_repo.update_one(
             {"_id": ObjectId(contest_id)},
             {"$addToSet": {"participants": user_id}}  # Используем $addToSet, чтобы избежать дубликатов
         )
@@ -142,9 +204,9 @@ async def process_join_contest(query: types.CallbackQuery):
         # Отправляем уведомление ответственному
         responsible_id = contest.get("responsible_id")
         if responsible_id:
-            responsible = users_col.find_one({"telegram_id": responsible_id})
+            responsible = await users_repo.get_cached(responsible_id)
             if responsible:
-                await query.bot.send_message(
+                await notification_service.notify(
                     responsible_id,
                     f"Новый участник конкурса:\n"
                     f"Название конкурса: {contest['name']}\n"
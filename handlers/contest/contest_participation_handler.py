@@ -1,13 +1,18 @@
 import os
 from datetime import datetime
+from typing import List, Optional
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from utils.contest_states import ContestParticipationStates
 from utils.contest_utils import save_contest_participation
-from utils.file_utils import compress_and_save_image
-from services.database import db
+from services.thumbnails import schedule_derivatives
+from services.upload_store import save_telegram_file, store_path
+from services.database import contests_repo
+from keyboards.contest_keyboard import (
+    CONTEST_PAGE_PREFIX, CONTESTS_PER_PAGE, get_contest_selection_keyboard, parse_contest_page_callback,
+)
 from aiogram.utils.markdown import hbold, hcode
 import logging
 from bson import ObjectId
@@ -70,6 +75,13 @@ def with_cancel_keyboard(keyboard=None):
     keyboard.inline_keyboard.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")])
     return keyboard
 
+def contest_picker_keyboard(page):
+    return get_contest_selection_keyboard(
+        page, "p",
+        item_callback=lambda contest: f"participate_contest_{contest['_id']}",
+        item_text=lambda contest: f"Окон. {contest['end_date'].strftime('%d.%m.%Y')} - {contest['name']}",
+    )
+
 # --- Стартовая команда ---
 @router.message(Command("contest"))
 async def cmd_contest(message: Message, state: FSMContext):
@@ -80,23 +92,28 @@ async def cmd_contest(message: Message, state: FSMContext):
     await state.set_state(ContestParticipationStates.selecting_contest)
     new_state = await state.get_state()
     logger.info(f"Новое состояние FSM после установки: {new_state}")
-    contests = list(db.contests.find({}))
-    if not contests:
+    page = await contests_repo.page(limit=CONTESTS_PER_PAGE)
+    if not page.contests:
         logger.warning(f"Пользователь {message.from_user.id}: в базе нет конкурсов")
         await message.answer("В базе нет конкурсов. Обратитесь к администратору.")
         return
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text=f"Окон. {contest['end_date'].strftime('%d.%m.%Y')} - {contest['name']}", callback_data=f"participate_contest_{str(contest['_id'])}")]
-            for contest in contests
-        ]
-    )
     await message.answer(
         "<b>Заполнение участия в конкурсе</b>\n\nВыберите конкурс для участия:",
-        reply_markup=with_cancel_keyboard(keyboard),
+        reply_markup=with_cancel_keyboard(contest_picker_keyboard(page)),
         parse_mode="HTML"
     )
 
+# --- Переход по страницам списка конкурсов ---
+@router.callback_query(ContestParticipationStates.selecting_contest, F.data.startswith(f"{CONTEST_PAGE_PREFIX}:p:"))
+async def process_contest_page(callback: CallbackQuery):
+    cursor, backward = parse_contest_page_callback(callback.data)
+    page = await contests_repo.page(cursor, backward, limit=CONTESTS_PER_PAGE)
+    if not page.contests:
+        # Конкурсы страницы удалены: показываем первую страницу
+        page = await contests_repo.page(limit=CONTESTS_PER_PAGE)
+    await callback.message.edit_reply_markup(reply_markup=with_cancel_keyboard(contest_picker_keyboard(page)))
+    await callback.answer()
+
 # --- Выбор конкурса для участия ---
 @router.callback_query(ContestParticipationStates.selecting_contest, F.data.startswith("participate_contest_"))
 async def process_selecting_contest(callback: CallbackQuery, state: FSMContext):
@@ -105,7 +122,7 @@ async def process_selecting_contest(callback: CallbackQuery, state: FSMContext):
     contest_id = callback.data.split("_", 2)[2]
     logger.info(f"Пользователь {callback.from_user.id} выбрал конкурс participate_contest_{contest_id} (FSM selecting_contest)")
     try:
-        contest = db.contests.find_one({"_id": ObjectId(contest_id)})
+        contest = await contests_repo.get(ObjectId(contest_id))
         if not contest:
             logger.error(f"Пользователь {callback.from_user.id}: конкурс {contest_id} не найден (FSM selecting_contest)")
             await callback.answer("Конкурс не найден.", show_alert=True)
@@ -176,7 +193,7 @@ async def process_entering_date(message: Message, state: FSMContext):
 
 # --- Уровень конкурса ---
 @router.callback_query(ContestParticipationStates.selecting_level)
-async def process_selecting_level(callback: CallbackQuery, state: FSMContext):
+async def process_selecting_level(callback: CallbackQuery, state: FSMContext, user: dict = None):
     level_code = callback.data.split("_")[1]
     level = LEVEL_CODES.get(level_code)
     if not level:
@@ -188,7 +205,7 @@ async def process_selecting_level(callback: CallbackQuery, state: FSMContext):
     await state.set_state(ContestParticipationStates.selecting_teacher_name)
     await callback.message.answer(
         f"{get_summary_text(await state.get_data())}\n\n<b>Шаг 4/10</b>\n\nВыберите ФИО преподавателя:",
-        reply_markup=with_cancel_keyboard(teacher_name_keyboard(callback.from_user.id)),
+        reply_markup=with_cancel_keyboard(teacher_name_keyboard(user)),
         parse_mode="HTML"
     )
     await callback.answer()
@@ -249,10 +266,9 @@ async def process_participant_type(callback: CallbackQuery, state: FSMContext):
 
 # --- Выбор ФИО преподавателя ---
 @router.callback_query(ContestParticipationStates.selecting_teacher_name)
-async def process_selecting_teacher_name(callback: CallbackQuery, state: FSMContext):
+async def process_selecting_teacher_name(callback: CallbackQuery, state: FSMContext, user: dict = None):
     if callback.data == "use_my_name":
-        # Получаем имя пользователя из базы данных
-        user = db.users.find_one({"telegram_id": callback.from_user.id})
+        # Профиль пользователя передаётся из RoleMiddleware
         if user and user.get("full_name"):
             teacher_name = user["full_name"]
             logger.info(f"Пользователь {callback.from_user.id}: выбрал своё имя '{teacher_name}'")
@@ -277,11 +293,9 @@ async def process_selecting_teacher_name(callback: CallbackQuery, state: FSMCont
         await callback.answer("Пожалуйста, выберите один из вариантов.", show_alert=True)
     await callback.answer()
 
-def teacher_name_keyboard(user_id: int) -> InlineKeyboardMarkup:
+def teacher_name_keyboard(user: dict) -> InlineKeyboardMarkup:
     """Создает клавиатуру для выбора ФИО преподавателя"""
     keyboard = []
-    # Получаем имя пользователя из базы данных
-    user = db.users.find_one({"telegram_id": user_id})
     if user and user.get("full_name"):
         keyboard.append([InlineKeyboardButton(
             text=f"Использовать моё имя ({user['full_name']})",
@@ -473,87 +487,75 @@ async def process_result(message: Message, state: FSMContext):
     await state.update_data(last_message_id=msg.message_id)
 
 # --- Фото ---
+async def save_confirmation_photo(message: Message) -> dict:
+    """
+    Скачивает фото из сообщения в хранилище загрузок.
+    Возвращает элемент confirmation_files: путь в хранилище и имя, под которым фото видно в отчёте.
+    """
+    file_id = message.photo[-1].file_id
+    file = await message.bot.get_file(file_id)
+    logger.info(f"Получен файл из Telegram. Путь: {file.file_path}")
+    
+    # Файл сохраняется под хэшем содержимого: повторно отправленное фото не занимает место ещё раз
+    file_name = await save_telegram_file(message.bot, file.file_path)
+    logger.info(f"Файл успешно скачан в {store_path(file_name)}")
+    
+    # Миниатюры для отчётов готовим заранее, в фоне, не задерживая ответ пользователю
+    schedule_derivatives(store_path(file_name))
+    return {"saved_name": file_name, "original_name": f"{file_id}.jpg", "file_id": file_id}
+
+
 @router.message(ContestParticipationStates.uploading_confirmation_file, F.photo)
-async def process_confirmation_photo(message: Message, state: FSMContext):
+async def process_confirmation_photo(message: Message, state: FSMContext, album: Optional[List[Message]] = None):
+    # Фото альбома приходят одним вызовом (AlbumMiddleware): скачиваем их параллельно
+    # и обновляем состояние и отвечаем пользователю один раз на весь альбом
+    messages = album or [message]
     data = await state.get_data()
-    photo = message.photo[-1]
-    file_id = photo.file_id
     
-    logger.info(f"Начало обработки фото. File ID: {file_id}")
-    logger.info(f"Текущие данные в состоянии: {data}")
+    logger.info(f"Начало обработки фото: {len(messages)} шт.")
     
     try:
-        # Получаем файл
-        file = await message.bot.get_file(file_id)
-        file_path = file.file_path
-        file_name = f"{file_id}.jpg"
-        
-        logger.info(f"Получен файл из Telegram. Путь: {file_path}")
-        
-        # Создаем директорию uploads, если её нет
-        os.makedirs("uploads", exist_ok=True)
-        
-        # Скачиваем файл
-        upload_path = os.path.join("uploads", file_name)
-        logger.info(f"Начинаем скачивание файла в {upload_path}")
-        await message.bot.download_file(file_path, upload_path)
-        
-        if not os.path.exists(upload_path):
-            logger.error(f"Файл не был скачан в {upload_path}")
-            raise Exception(f"Файл не был скачан в {upload_path}")
-        
-        logger.info(f"Файл успешно скачан в {upload_path}")
+        results = await asyncio.gather(*(save_confirmation_photo(m) for m in messages), return_exceptions=True)
+        file_names = [result for result in results if isinstance(result, dict)]
+        errors = [result for result in results if isinstance(result, BaseException)]
+        for error in errors:
+            logger.error(f"Ошибка при сохранении фото: {error}")
+        if not file_names:
+            raise errors[0]
         
         if data["participant_type"] == "Преподаватель":
             # Для преподавателя добавляем в общий список
-            confirmation_files = data.get("confirmation_files", [])
-            confirmation_files.append(file_name)
-            await state.update_data(confirmation_files=confirmation_files)
-            logger.info(f"Название файла добавлено в список преподавателя. Текущий список: {confirmation_files}")
+            confirmation_files = data.get("confirmation_files", []) + file_names
+            updated_data = await state.update_data(confirmation_files=confirmation_files)
+            total = len(confirmation_files)
+            logger.info(f"Фото добавлены в список преподавателя. Текущий список: {confirmation_files}")
         else:
             # Для студента добавляем в список текущего студента
             students = data.get("students", [])
-            if students:
-                current_student = students[-1]  # Берем последнего добавленного студента
-                if "confirmation_files" not in current_student:
-                    current_student["confirmation_files"] = []
-                current_student["confirmation_files"].append(file_name)
-                await state.update_data(students=students)
-                logger.info(f"Название файла добавлено в список студента {current_student['name']}. Текущий список: {current_student['confirmation_files']}")
-        
-        # Проверяем, что данные действительно обновлены
-        updated_data = await state.get_data()
-        logger.info(f"Данные в состоянии после обновления: {updated_data}")
-        
-        logger.info(f"Пользователь {message.from_user.id}: добавил фото {file_name}")
+            if not students:
+                return
+            current_student = students[-1]  # Берем последнего добавленного студента
+            current_student["confirmation_files"] = current_student.get("confirmation_files", []) + file_names
+            updated_data = await state.update_data(students=students)
+            total = len(current_student["confirmation_files"])
+            logger.info(f"Фото добавлены в список студента {current_student['name']}. Текущий список: {current_student['confirmation_files']}")
         
-        # Отправляем сообщение об успешной загрузке
-        await message.answer("✅ Фото успешно загружено и сохранено!")
+        logger.info(f"Пользователь {message.from_user.id}: добавил фото {file_names}")
         
-        # Отправляем новое сообщение с информацией
-        if data["participant_type"] == "Преподаватель":
-            confirmation_files = updated_data.get("confirmation_files", [])
-            await message.answer(
-                f"{get_summary_text(updated_data)}\n\n"
-                f"Фото получено. Всего загружено фото: {len(confirmation_files)}.\n"
-                f"Если хотите добавить ещё — отправьте ещё фото.\n"
-                f"Когда закончите — напишите /done.",
-                reply_markup=cancel_keyboard(),
-                parse_mode="HTML"
-            )
-        else:
-            students = updated_data.get("students", [])
-            if students:
-                current_student = students[-1]
-                await message.answer(
-                    f"{get_summary_text(updated_data)}\n\n"
-                    f"Фото получено для студента {current_student['name']}. "
-                    f"Всего загружено фото: {len(current_student.get('confirmation_files', []))}.\n"
-                    f"Если хотите добавить ещё — отправьте ещё фото.\n"
-                    f"Когда закончите — напишите /done.",
-                    reply_markup=cancel_keyboard(),
-                    parse_mode="HTML"
-                )
+        received = f"Получено фото: {len(file_names)}"
+        if data["participant_type"] != "Преподаватель":
+            received += f" для студента {current_student['name']}"
+        if errors:
+            received += f". Не удалось сохранить: {len(errors)}, отправьте их ещё раз"
+        await message.answer(
+            f"✅ {received}.\n\n"
+            f"{get_summary_text(updated_data)}\n\n"
+            f"Всего загружено фото: {total}.\n"
+            f"Если хотите добавить ещё — отправьте ещё фото.\n"
+            f"Когда закончите — напишите /done.",
+            reply_markup=cancel_keyboard(),
+            parse_mode="HTML"
+        )
     except Exception as e:
         logger.error(f"Ошибка при обработке фото: {str(e)}")
         logger.error(f"Тип ошибки: {type(e)}")
@@ -682,7 +684,7 @@ async def fallback_participate_contest(callback: CallbackQuery, state: FSMContex
     
     try:
         # Проверяем, существует ли конкурс
-        contest = db.contests.find_one({"_id": ObjectId(contest_id)})
+        contest = await contests_repo.get(ObjectId(contest_id))
         if not contest:
             logger.error(f"Пользователь {callback.from_user.id}: конкурс {contest_id} не найден в базе")
             await callback.answer("Конкурс не найден в базе.", show_alert=True)
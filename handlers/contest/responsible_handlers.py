@@ -1,20 +1,26 @@
 from aiogram import Router, types
+from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from bson import ObjectId
 
-from services.database import users_col, contests_col
+from services.database import users_repo, contests_repo
 from config import logger
+from services.notifications import notification_service
+from utils.contest_states import ContestCreationStates
 from utils.role_utils import send_role_keyboard
 from handlers.admin.admin_utils import notify_all_users
 
 # Создаем роутер
 router = Router()
 
+# Сколько участников показывается на одной странице списка
+PARTICIPANTS_PAGE_SIZE = 30
+
 
 # Хэндлер для отображения списка ответственных
 @router.message(lambda message: message.text == "Список ответственных")
 async def show_responsible_list(message: types.Message):
-    responsibles = list(users_col.find({"role": "responsible"}).sort("full_name", 1))
+    responsibles = await users_repo.find({"role": "responsible"}, sort=[("full_name", 1)])
     if not responsibles:
         await message.answer("Ответственные не найдены.")
         return
@@ -28,63 +34,70 @@ async def show_responsible_list(message: types.Message):
     await message.answer("Выберите ответственного за конкурс:", reply_markup=keyboard)
 
 
-# Хэндлер для обработки выбора ответственного
-@router.callback_query(lambda query: query.data.startswith("responsible_"))
-async def process_responsible_selection(query: types.CallbackQuery):
+# Хэндлер для обработки выбора ответственного (последний шаг создания конкурса)
+@router.callback_query(ContestCreationStates.selecting_responsible, lambda query: query.data.startswith("responsible_"))
+async def process_responsible_selection(query: types.CallbackQuery, state: FSMContext):
     responsible_id = int(query.data.split("_")[1])  # Получаем ID ответственного
-    contest = contests_col.find_one({"telegram_id": query.from_user.id, "step": "responsible"})
-    if not contest:
+    draft = await state.get_data()
+    if not draft.get("name"):
         await query.answer("Конкурс не найден.")
         return
 
+    # Черновик из FSM записывается в базу только сейчас, целиком
+    contest = {
+        "_id": ObjectId(),
+        "telegram_id": query.from_user.id,
+        "name": draft["name"],
+        "start_date": draft.get("start_date"),
+        "end_date": draft["end_date"],
+        "description": draft.get("description"),
+        "files": draft.get("files", []),
+        "file_ids": draft.get("file_ids", []),
+        "responsible_id": responsible_id,
+    }
+    await contests_repo.insert_one(contest)
+    await state.clear()
+
     # Формируем сообщение с информацией о конкурсе
     start_date_str = (
         contest["start_date"].strftime("%d.%m.%Y")
-        if "start_date" in contest and contest["start_date"]
+        if contest["start_date"]
         else "Не указана"
     )
-    # Обновляем конкурс, добавляя ID ответственного
-    contests_col.update_one(
-        {"_id": contest["_id"]},
-        {"$set": {"responsible_id": responsible_id, "step": None}}
-    )
 
     # Получаем имя ответственного
-    responsible = users_col.find_one({"telegram_id": responsible_id})
-    responsible_name = responsible["full_name"] if responsible else "Неизвестно"
+    responsible_name = (await users_repo.get_names([responsible_id])).get(responsible_id, "Неизвестно")
 
     # Отправляем подтверждение администратору
     await query.answer(f"Ответственный {responsible_name} успешно назначен.")
 
-    # Отправляем уведомление ответственному
+    # Ставим уведомление ответственному в очередь
     try:
-        await query.bot.send_message(
+        await notification_service.notify(
             responsible_id,
             f"Вас назначили ответственным за конкурс:\n"
             f"Название: {contest['name']}\n"
             f"Даты проведения: {start_date_str} - {contest['end_date'].strftime('%d.%m.%Y')}\n"
-            f"Описание: {contest.get('description', 'Описание отсутствует')}"
+            f"Описание: {contest.get('description') or 'Описание отсутствует'}"
         )
     except Exception as e:
-        logger.error(f"Не удалось отправить уведомление ответственному {responsible_id}: {e}")
+        logger.error(f"Не удалось поставить уведомление ответственному {responsible_id}: {e}")
 
     await query.message.edit_text(f"Ответственный {responsible_name} назначен за конкурс.", )
-    user = users_col.find_one({"telegram_id": query.from_user.id})
+    user = await users_repo.get_cached(query.from_user.id)
     if user:
         await send_role_keyboard(query.bot, query.from_user.id, user.get("role"))
 
-        # Уведомление пользователей после добавления
-    contest = contests_col.find_one({"_id": contest["_id"]})
-    logger.warning('Уведомление пользователей: '+ str(contest))
-    if contest and contest.get("name"):
-        await notify_all_users(contest["name"], query.bot)
+    # Уведомление пользователей после добавления
+    logger.warning('Уведомление пользователей: ' + str(contest))
+    await notify_all_users(contest["name"], query.bot)
 
 
 # Хэндлер для отображения списка конкурсов с участниками
 @router.message(lambda message: message.text == "Список участников")
 async def show_contests_with_participants(message: types.Message):
     # Находим все конкурсы, за которые отвечает текущий пользователь
-    contests = list(contests_col.find({"responsible_id": message.from_user.id}).sort("start_date", 1))
+    contests = await contests_repo.find({"responsible_id": message.from_user.id}, sort=[("start_date", 1)])
     if not contests:
         await message.answer("Конкурсы не найдены.")
         return
@@ -105,13 +118,22 @@ async def show_contests_with_participants(message: types.Message):
     await message.answer("Выберите конкурс для просмотра списка участников:", reply_markup=keyboard)
 
 
+# Кнопка с номером страницы списка участников ничего не делает
+@router.callback_query(lambda query: query.data == "participants_page")
+async def process_participants_page_number(query: types.CallbackQuery):
+    await query.answer()
+
+
 # Хэндлер для обработки выбора конкурса и отображения списка участников
 @router.callback_query(lambda query: query.data.startswith("participants_"))
 async def process_contest_participants(query: types.CallbackQuery):
-    contest_id = query.data.split("_")[1]
+    # participants_<id конкурса> — первая страница, participants_<id>_<страница> — переход по страницам
+    parts = query.data.split("_")
+    contest_id = parts[1]
+    page = int(parts[2]) if len(parts) > 2 else 0
     try:
         # Находим конкурс
-        contest = contests_col.find_one({"_id": ObjectId(contest_id)})
+        contest = await contests_repo.find_one({"_id": ObjectId(contest_id)}, {"name": 1, "participants": 1})
         if not contest:
             await query.answer("Конкурс не найден.")
             return
@@ -122,14 +144,34 @@ async def process_contest_participants(query: types.CallbackQuery):
             await query.answer("Участники не найдены.")
             return
 
-        # Формируем сообщение с информацией об участниках
-        participants_info = "Список участников:\n"
-        for participant_id in participants:
-            participant = users_col.find_one({"telegram_id": participant_id})
-            if participant:
-                participants_info += f"- {participant['full_name']}\n"
-
-        await query.message.answer(participants_info)
+        pages = (len(participants) + PARTICIPANTS_PAGE_SIZE - 1) // PARTICIPANTS_PAGE_SIZE
+        page = min(max(page, 0), pages - 1)
+        first = page * PARTICIPANTS_PAGE_SIZE
+        page_ids = participants[first:first + PARTICIPANTS_PAGE_SIZE]
+
+        # ФИО участников страницы читаются одним запросом
+        names = await users_repo.get_names(page_ids)
+
+        participants_info = f"Список участников ({len(participants)}):\n"
+        for number, participant_id in enumerate(page_ids, start=first + 1):
+            participants_info += f"{number}. {names.get(participant_id, f'Неизвестный пользователь ({participant_id})')}\n"
+
+        keyboard = None
+        if pages > 1:
+            navigation = []
+            if page > 0:
+                navigation.append(InlineKeyboardButton(text="⬅️", callback_data=f"participants_{contest_id}_{page - 1}"))
+            navigation.append(InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data="participants_page"))
+            if page < pages - 1:
+                navigation.append(InlineKeyboardButton(text="➡️", callback_data=f"participants_{contest_id}_{page + 1}"))
+            keyboard = InlineKeyboardMarkup(inline_keyboard=[navigation])
+
+        if len(parts) > 2:
+            # Переход по страницам: меняем уже показанный список
+            await query.message.edit_text(participants_info, reply_markup=keyboard)
+        else:
+            await query.message.answer(participants_info, reply_markup=keyboard)
+        await query.answer()
     except Exception as e:
         logger.error(f"Ошибка при обработке списка участников: {e}")
         await query.answer("Произошла ошибка при обработке списка участников.")
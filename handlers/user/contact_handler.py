@@ -1,7 +1,7 @@
 import hashlib
 
 from aiogram import Router, types
-from services.database import users_col
+from services.database import users_repo
 
 # Создаем роутер
 router = Router()
@@ -22,9 +22,9 @@ async def contact_handler(message: types.Message):
     phone = message.contact.phone_number
 
     # Обновляем данные пользователя в базе данных
-    users_col.update_one(
-        {"telegram_id": message.from_user.id},
-        {"$set": {"phone": phone, "role": "teacher", "notifications_enabled": True}},
+    await users_repo.update(
+        message.from_user.id,
+        {"phone": phone, "role": "teacher", "notifications_enabled": True},
         upsert=True
     )
 
@@ -1,21 +1,23 @@
 from aiogram import Router, types
-from services.database import users_col
+from services.database import users_repo
 from utils.role_utils import send_role_keyboard
 
 # Создаем роутер
 router = Router()
 
+async def is_waiting_for_name(message: types.Message) -> bool:
+    """Фильтр: пользователь отправил телефон, но ещё не указал ФИО"""
+    user = await users_repo.get_cached(message.from_user.id)
+    return user is not None and "phone" in user and user.get("full_name") is None
+
+
 # Хэндлер для получения ФИО
-@router.message(lambda message: users_col.find_one(
-    {"telegram_id": message.from_user.id, "phone": {"$exists": True}, "full_name": None}))
+@router.message(is_waiting_for_name)
 async def name_handler(message: types.Message):
     if not message.text:
         await message.answer("Пожалуйста, введите ваше полное имя (ФИО).")
         return
 
-    users_col.update_one(
-        {"telegram_id": message.from_user.id},
-        {"$set": {"full_name": message.text}}
-    )
+    await users_repo.update(message.from_user.id, {"full_name": message.text})
     await message.answer("Ваши данные сохранены.")
     await send_role_keyboard(message.bot, message.from_user.id, "teacher")
\ No newline at end of file
@@ -3,7 +3,7 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import Command
 
-from services.database import db
+from services.database import users_repo
 from utils.role_utils import send_role_keyboard
 from keyboards.event_type_keyboard import get_event_type_keyboard_with_pagination
 from handlers.contest.contest_participation_handler import cmd_contest
@@ -16,9 +16,8 @@ editing_name = {}
 
 # Хэндлер для настроек
 @router.message(lambda message: message.text == "Настройки")
-async def settings_handler(message: types.Message):
-    # Получаем данные пользователя из базы данных
-    user = db.users.find_one({"telegram_id": message.from_user.id})
+async def settings_handler(message: types.Message, user: dict = None):
+    # Профиль пользователя передаётся из RoleMiddleware
     if not user:
         await message.answer("Пользователь не найден.")
         return
@@ -47,15 +46,11 @@ async def settings_handler(message: types.Message):
 
 # Хэндлер для включения уведомлений
 @router.callback_query(lambda query: query.data == "enable_notifications")
-async def enable_notifications_handler(query: types.CallbackQuery):
+async def enable_notifications_handler(query: types.CallbackQuery, user: dict):
     # Обновляем настройки уведомлений в базе данных
-    db.users.update_one(
-        {"telegram_id": query.from_user.id},
-        {"$set": {"notifications_enabled": True}}
-    )
+    await users_repo.update(query.from_user.id, {"notifications_enabled": True})
 
-    # Получаем роль пользователя
-    user = db.users.find_one({"telegram_id": query.from_user.id})
+    # Роль не меняется, поэтому берём её из профиля, загруженного RoleMiddleware
     user_role = user.get("role")
 
     await query.message.edit_text("Уведомления включены.")
@@ -65,15 +60,11 @@ async def enable_notifications_handler(query: types.CallbackQuery):
 
 # Хэндлер для отключения уведомлений
 @router.callback_query(lambda query: query.data == "disable_notifications")
-async def disable_notifications_handler(query: types.CallbackQuery):
+async def disable_notifications_handler(query: types.CallbackQuery, user: dict):
     # Обновляем настройки уведомлений в базе данных
-    db.users.update_one(
-        {"telegram_id": query.from_user.id},
-        {"$set": {"notifications_enabled": False}}
-    )
+    await users_repo.update(query.from_user.id, {"notifications_enabled": False})
 
-    # Получаем роль пользователя
-    user = db.users.find_one({"telegram_id": query.from_user.id})
+    # Роль не меняется, поэтому берём её из профиля, загруженного RoleMiddleware
     user_role = user.get("role")
 
     await query.message.edit_text("Уведомления отключены.")
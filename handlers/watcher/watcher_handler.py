@@ -1,23 +1,31 @@
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from datetime import datetime
+import asyncio
 import io
-from aiogram.types import BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+import os
+from aiogram.types import FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 import calendar
 from bson import ObjectId
 import logging
+from typing import Tuple
 
-from utils.contest_utils import generate_contest_report, create_contest_excel_report, create_contest_html_report
-from services.database import db
+from services import file_io
+from services.database import participations_repo, report_snapshots_repo
+from services.report_queue import REPORT_PROGRESS_INTERVAL, ReportJob, ReportQueueBusy, report_queue
 
 # Настраиваем логгер
 logger = logging.getLogger(__name__)
 
 router = Router()
 
+# Ссылки на фоновые задачи доставки отчётов, чтобы их не удалил сборщик мусора
+_delivery_tasks = set()
+
 # Словарь с названиями месяцев на русском языке
 RUSSIAN_MONTHS = {
     1: "Январь",
@@ -34,15 +42,26 @@ RUSSIAN_MONTHS = {
     12: "Декабрь"
 }
 
+# Файлы отчёта: вид -> (расширение, пояснение в подписи)
+REPORT_DOCUMENTS = {
+    "excel": ("xlsx", "Excel"),
+    "html_archive": ("zip", "HTML с возможностью сортировки и фото (откройте report.html из архива)"),
+}
+# Сколько файлов отчёта загружается в Telegram одновременно
+REPORT_UPLOAD_CONCURRENCY = int(os.getenv("REPORT_UPLOAD_CONCURRENCY", "3"))
+
+class ReportDeliveryError(Exception):
+    """Часть файлов отчёта не удалось отправить; текст исключения перечисляет эти файлы"""
+
+
 class ReportState(StatesGroup):
     """Состояния для процесса получения отчета"""
     selecting_month = State()
 
 @router.message(Command("get_report"))
-async def cmd_get_report(message: Message, state: FSMContext):
+async def cmd_get_report(message: Message, state: FSMContext, user: dict = None):
     """Обработчик команды /get_report для получения отчета за выбранный месяц"""
-    # Проверяем, есть ли у пользователя роль watcher
-    user = db.users.find_one({"telegram_id": message.from_user.id})
+    # Проверяем, есть ли у пользователя роль watcher (профиль передаётся из RoleMiddleware)
     
     # Получаем роли пользователя
     user_roles = user.get("role") if user else None
@@ -58,33 +77,13 @@ async def cmd_get_report(message: Message, state: FSMContext):
         await message.answer("У вас нет прав для получения отчетов.")
         return
     
-    # Получаем уникальные месяцы и годы из записей самообследования
-    available_months = set()
-    
-    # Получаем все записи самообследования
-    participations = list(db.contest_participations.find())
-    
-    for part in participations:
-        # Получаем дату создания записи
-        created_at = part.get("created_at")
-        if created_at:
-            # Преобразуем строку в объект datetime, если это строка
-            if isinstance(created_at, str):
-                try:
-                    created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                except ValueError:
-                    continue
-            
-            # Добавляем месяц и год в множество
-            available_months.add((created_at.year, created_at.month))
+    # Месяцы берутся из сводки participation_months, которая обновляется при каждой новой записи
+    available_months = await participations_repo.available_months()
     
     if not available_months:
         await message.answer("В базе данных нет записей для генерации отчета.")
         return
     
-    # Сортируем месяцы по убыванию (от новых к старым)
-    available_months = sorted(available_months, reverse=True)
-    
     # Создаем клавиатуру с доступными месяцами
     keyboard = []
     row = []
@@ -121,39 +120,158 @@ async def process_month_selection(callback: CallbackQuery, state: FSMContext):
     year = int(year)
     month = int(month)
     
-    # Получаем данные и изображения
-    data, images = await generate_contest_report(month, year)
-    
-    if not data:
+    version = await participations_repo.month_version(year, month)
+    if version is None:
         await callback.message.answer("За выбранный период нет данных для отчета.")
         await callback.answer()
         return
     
-    # Создаем Excel файл
-    excel_data = await create_contest_excel_report(data, images)
+    # Если данные месяца не менялись, отправляем готовый снимок отчёта
+    snapshot = await report_snapshots_repo.get(year, month, version)
+    if snapshot:
+        try:
+            sent = await send_report(callback.message, snapshot, year, month)
+        except ReportDeliveryError as e:
+            # Часть файлов уже в чате: перестроение отправило бы их повторно
+            logger.error(f"Не удалось отправить отчет за {month:02d}.{year}: {e}")
+            await callback.message.answer(f"❌ Не удалось отправить часть отчета ({e}). Попробуйте запросить его ещё раз.")
+            sent = True
+        if sent:
+            await callback.answer()
+            return
     
-    # Создаем HTML файл
-    html_report = await create_contest_html_report(data, images)
+    # Отчёт строится в отдельном процессе, здесь только ставим его в очередь
+    try:
+        job = report_queue.submit(callback.from_user.id, year, month, version)
+    except ReportQueueBusy as e:
+        await callback.answer(str(e), show_alert=True)
+        return
     
-    # Отправляем Excel файл
-    await callback.message.answer_document(
-        document=BufferedInputFile(
-            excel_data,
-            filename=f"contest_report_{year}_{month:02d}.xlsx"
-        ),
-        caption=f"Отчет по конкурсам за {RUSSIAN_MONTHS[month]} {year} (Excel)"
+    status_message = await callback.message.answer(
+        f"⏳ Отчет за {RUSSIAN_MONTHS[month]} {year} поставлен в очередь"
     )
+    await callback.answer()
     
-    # Отправляем HTML файл
-    await callback.message.answer_document(
-        document=BufferedInputFile(
-            html_report.encode('utf-8'),
-            filename=f"contest_report_{year}_{month:02d}.html"
-        ),
-        caption=f"Отчет по конкурсам за {RUSSIAN_MONTHS[month]} {year} (HTML с возможностью сортировки)"
-    )
+    # Не ждём готовности в обработчике, чтобы не задерживать другие обновления этого чата
+    task = asyncio.create_task(deliver_report(callback.message, status_message, job, year, month, version))
+    _delivery_tasks.add(task)
+    task.add_done_callback(_delivery_tasks.discard)
+
+
+async def deliver_report(message: Message, status_message: Message, job: ReportJob, year: int, month: int, version: int):
+    """Обновляет сообщение о ходе построения отчёта и отправляет готовые файлы"""
+    period = f"{RUSSIAN_MONTHS[month]} {year}"
+    last_percent = None
     
-    await callback.answer()
+    while not await job.wait(REPORT_PROGRESS_INTERVAL):
+        percent = job.percent
+        if percent is None or percent == last_percent:
+            continue
+        last_percent = percent
+        try:
+            await status_message.edit_text(f"⏳ Формируется отчет за {period}: {percent}%")
+        except TelegramBadRequest as e:
+            logger.debug(f"Не удалось обновить статус отчета: {e}")
+    
+    try:
+        files = job.future.result()
+    except Exception as e:
+        logger.error(f"Ошибка при построении отчета за {month:02d}.{year}: {e}", exc_info=True)
+        await status_message.edit_text(f"❌ Не удалось сформировать отчет за {period}. Попробуйте позже.")
+        return
+    
+    if not files:
+        await status_message.edit_text("За выбранный период нет данных для отчета.")
+        return
+    
+    # Сохраняем снимок; файлы предыдущей версии больше не нужны
+    saved, previous = await report_snapshots_repo.save(year, month, version, files)
+    if saved and previous:
+        for path in previous.get("files", {}).values():
+            if path not in files.values():
+                await file_io.remove(path)
+    
+    try:
+        sent = await send_report(message, {"version": version, "files": files, "file_ids": {}}, year, month)
+    except Exception as e:
+        logger.error(f"Ошибка при отправке отчета за {month:02d}.{year}: {e}", exc_info=True)
+        sent = False
+    if sent:
+        await status_message.edit_text(f"✅ Отчет за {period} готов")
+    else:
+        await status_message.edit_text(f"❌ Не удалось отправить отчет за {period}. Попробуйте запросить его ещё раз.")
+
+
+def report_part(key: str, year: int, month: int) -> Tuple[str, str]:
+    """Имя файла и пояснение для файла отчёта или его части (ключи частей описаны в services/report_queue.py)"""
+    kind, _, part = key.partition("-")
+    extension, title = REPORT_DOCUMENTS[kind]
+    filename = f"contest_report_{year}_{month:02d}"
+    if not part:
+        return f"{filename}.{extension}", title
+    if part.isdigit():
+        return f"{filename}.part{part}.{extension}", f"{title}, часть {part}"
+    first, last = part.split("-")
+    days = f"за {first} число" if first == last else f"с {first} по {last} число"
+    return f"{filename}_{part}.{extension}", f"{title}, {days}"
+
+
+async def send_report(message: Message, snapshot: dict, year: int, month: int) -> bool:
+    """
+    Отправляет файлы снимка отчёта: по сохранённому file_id, а если его нет — загружая файл.
+    Файлы загружаются параллельно; если отчёт разбит на части, сначала отправляется их список.
+    
+    Returns:
+        False, если снимок непригоден (отчёт нужно построить заново); в этом случае
+        ничего не отправлено
+    
+    Raises:
+        ReportDeliveryError: Часть файлов не отправлена; остальные файлы уже в чате
+    """
+    files = snapshot.get("files", {})
+    file_ids = snapshot.get("file_ids", {})
+    if {key.partition("-")[0] for key in files} != set(REPORT_DOCUMENTS):
+        # Снимок построен до изменения состава отчёта
+        return False
+    # Файлы нужны и при известном file_id: если он устарел, файл загружается заново,
+    # а прерывать отправку на середине, когда часть файлов уже в чате, нельзя
+    for path in files.values():
+        if not await file_io.exists(path):
+            return False
+    
+    period = f"{RUSSIAN_MONTHS[month]} {year}"
+    parts = [(key, *report_part(key, year, month)) for key in files]
+    if len(parts) > len(REPORT_DOCUMENTS):
+        index = "\n".join(f"{number}. {filename} — {title}" for number, (_, filename, title) in enumerate(parts, 1))
+        if "html_archive" not in files:
+            index += "\n\nТома zip-архива распакуйте в одну папку."
+        await message.answer(f"Отчет за {period} не помещается в один файл и отправлен частями ({len(parts)}):\n{index}")
+    
+    semaphore = asyncio.Semaphore(REPORT_UPLOAD_CONCURRENCY)
+    
+    async def send_part(key: str, filename: str, title: str) -> None:
+        caption = f"Отчет по конкурсам за {period} ({title})"
+        async with semaphore:
+            if key in file_ids:
+                try:
+                    await message.answer_document(document=file_ids[key], caption=caption)
+                    return
+                except TelegramBadRequest as e:
+                    logger.warning(f"Не удалось отправить отчет по file_id, загружаем файл заново: {e}")
+            
+            sent = await message.answer_document(document=FSInputFile(files[key], filename=filename), caption=caption)
+            await report_snapshots_repo.set_file_id(year, month, snapshot["version"], key, sent.document.file_id)
+    
+    # Каждая часть отправляется независимо: ошибка одной не прерывает остальные
+    results = await asyncio.gather(*(send_part(*part) for part in parts), return_exceptions=True)
+    failed = []
+    for (key, filename, _), result in zip(parts, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Не удалось отправить файл отчета {filename}: {result}", exc_info=result)
+            failed.append(filename)
+    if failed:
+        raise ReportDeliveryError(", ".join(failed))
+    return True
 
 @router.callback_query(ReportState.selecting_month, F.data == "cancel_report")
 async def cancel_report(callback: CallbackQuery, state: FSMContext):
@@ -163,10 +281,9 @@ async def cancel_report(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.message(Command("watcher"))
-async def cmd_watcher(message: Message):
+async def cmd_watcher(message: Message, user: dict = None):
     """Обработчик команды /watcher для отображения доступных команд наблюдателя"""
-    # Проверяем, есть ли у пользователя роль watcher
-    user = db.users.find_one({"telegram_id": message.from_user.id})
+    # Проверяем, есть ли у пользователя роль watcher (профиль передаётся из RoleMiddleware)
     
     # Получаем роли пользователя
     user_roles = user.get("role") if user else None
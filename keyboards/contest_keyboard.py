@@ -1,55 +1,75 @@
+from datetime import datetime
+from typing import Callable, Optional, Tuple
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from bson import ObjectId
+
+
+# Префикс callback_data кнопок перехода по страницам списка конкурсов
+CONTEST_PAGE_PREFIX = "cpg"
+# Сколько конкурсов показывается на одной странице
+CONTESTS_PER_PAGE = 8
+
+_CURSOR_DATE_FORMAT = "%Y%m%d%H%M%S%f"
+
+
+def encode_contest_cursor(contest: dict) -> str:
+    """Ключ (end_date, _id) конкурса в виде строки для callback_data"""
+    # MongoDB хранит даты с точностью до миллисекунд
+    return f"{contest['end_date'].strftime(_CURSOR_DATE_FORMAT)[:-3]}:{contest['_id']}"
+
 
-def get_contest_selection_keyboard(contests, page: int = 0, items_per_page: int = 5) -> InlineKeyboardMarkup:
+def parse_contest_page_callback(data: str) -> Tuple[Optional[Tuple[datetime, ObjectId]], bool]:
     """
-    Создает клавиатуру с пагинацией для выбора конкурса
-    
+    Разбирает callback_data кнопки перехода по страницам: cpg:<список>:<n|p>:<дата>:<id>.
+
+    Returns:
+        tuple: (ключ (end_date, _id), назад ли листать)
+    """
+    _, _, direction, stamp, contest_id = data.split(":")
+    end_date = datetime.strptime(stamp + "000", _CURSOR_DATE_FORMAT)
+    return (end_date, ObjectId(contest_id)), direction == "p"
+
+
+def get_contest_selection_keyboard(
+    page,
+    kind: str,
+    item_callback: Callable[[dict], str],
+    item_text: Callable[[dict], str],
+) -> InlineKeyboardMarkup:
+    """
+    Создает клавиатуру страницы списка конкурсов
+
     Args:
-        contests: Список конкурсов
-        page: Номер текущей страницы (начиная с 0)
-        items_per_page: Количество элементов на странице
-    
+        page: Страница из contests_repo.page
+        kind: Короткий идентификатор списка; входит в callback_data кнопок навигации,
+            по нему обработчик списка узнаёт свои кнопки
+        item_callback: callback_data кнопки конкурса
+        item_text: Текст кнопки конкурса
+
     Returns:
-        InlineKeyboardMarkup: Клавиатура с кнопками выбора конкурса
+        InlineKeyboardMarkup: Клавиатура с кнопками выбора конкурса и навигацией
     """
-    # Вычисляем общее количество страниц
-    total_pages = (len(contests) + items_per_page - 1) // items_per_page
-    
-    # Вычисляем индексы для текущей страницы
-    start_idx = page * items_per_page
-    end_idx = min(start_idx + items_per_page, len(contests))
-    
-    # Создаем клавиатуру
-    keyboard = []
-    
-    # Добавляем кнопки для конкурсов текущей страницы
-    for contest in contests[start_idx:end_idx]:
-        keyboard.append([InlineKeyboardButton(
-            text=contest["name"],
-            callback_data=f"self_contest_{contest['_id']}"
-        )])
-    
-    # Добавляем кнопку для создания нового конкурса
-    keyboard.append([InlineKeyboardButton(
-        text="➕ Добавить новый конкурс",
-        callback_data="new_contest"
-    )])
-    
-    # Добавляем кнопки навигации, если есть несколько страниц
+    keyboard = [
+        [InlineKeyboardButton(text=item_text(contest), callback_data=item_callback(contest))]
+        for contest in page.contests
+    ]
+
+    # Кнопки навигации несут ключ крайнего конкурса страницы
     nav_buttons = []
-    if page > 0:
+    if page.has_prev and page.contests:
         nav_buttons.append(InlineKeyboardButton(
             text="◀️ Назад",
-            callback_data=f"contest_page_{page-1}"
+            callback_data=f"{CONTEST_PAGE_PREFIX}:{kind}:p:{encode_contest_cursor(page.contests[0])}"
         ))
-    if page < total_pages - 1:
+    if page.has_next and page.contests:
         nav_buttons.append(InlineKeyboardButton(
             text="Вперед ▶️",
-            callback_data=f"contest_page_{page+1}"
+            callback_data=f"{CONTEST_PAGE_PREFIX}:{kind}:n:{encode_contest_cursor(page.contests[-1])}"
         ))
     if nav_buttons:
         keyboard.append(nav_buttons)
-    
+
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 def get_cancel_keyboard() -> InlineKeyboardMarkup:
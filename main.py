@@ -1,14 +1,17 @@
+import asyncio
+
 from aiogram import Bot, Dispatcher, F
 from aiogram.fsm.storage.memory import MemoryStorage
 import os
-from aiogram.types import BotCommand, BotCommandScopeDefault, BotCommandScopeChat, CallbackQuery
+from aiogram.types import CallbackQuery
 
 from dotenv import load_dotenv
 
-from config import logger
+from config import logger, create_bot
+from middlewares.album_middleware import AlbumMiddleware
 from middlewares.role_middleware import RoleMiddleware
 from handlers.user import start_handler, contact_handler, name_handler
-from handlers.admin import admin_user_handlers, admin_contest_handlers, admin_watcher_handler
+from handlers.admin import admin_user_handlers, admin_contest_handlers, admin_watcher_handler, user_picker
 from handlers.contest import responsible_handlers
 from handlers.watcher import watcher_handler
 
@@ -16,6 +19,12 @@ from handlers.user import user_handlers
 from handlers.contest import contest_handlers
 from handlers.contest.contest_participation_handler import router as contest_participation_router
 from services.scheduler import start_scheduler  # Импортируем планировщик
+from services.bot_commands import provision_commands
+from services.database import fsm_states_col, ping_database, close_database
+from services.fsm_storage import MongoStorage
+from services.indexes import bootstrap_database
+from services.notifications import notification_service
+from services.report_queue import report_queue
 
 # Создаем общий роутер для админских обработчиков
 from aiogram import Router
@@ -23,16 +32,20 @@ admin_router = Router()
 admin_router.include_router(admin_user_handlers.router)
 admin_router.include_router(admin_contest_handlers.router)
 admin_router.include_router(admin_watcher_handler.router)  # Добавляем роутер для обработчика add_watcher
+admin_router.include_router(user_picker.router)  # Постраничный выбор пользователя с поиском
 
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise ValueError("Не указан BOT_TOKEN в переменных окружения.")
 
-bot = Bot(token=BOT_TOKEN)  # Инициализируем бота
+bot = create_bot(BOT_TOKEN)  # Инициализируем бота
 
-# Диспетчер
-storage = MemoryStorage()
+# Диспетчер: по умолчанию состояния FSM хранятся в MongoDB и переживают перезапуск
+if os.getenv("FSM_STORAGE", "mongo") == "memory":
+    storage = MemoryStorage()
+else:
+    storage = MongoStorage(fsm_states_col)
 dp = Dispatcher(storage=storage)
 
 admin_router.message.middleware(RoleMiddleware(allowed_roles=["admin"]))
@@ -47,6 +60,8 @@ contest_router.message.middleware(RoleMiddleware(allowed_roles=["teacher", "resp
 # Добавляем middleware для роутера участия в конкурсах
 contest_participation_router.message.middleware(RoleMiddleware(allowed_roles=["teacher", "responsible", "admin", "watcher"]))
 contest_participation_router.callback_query.middleware(RoleMiddleware(allowed_roles=["teacher", "responsible", "admin", "watcher"]))
+# Фото одного альбома обрабатываются одним вызовом обработчика
+contest_participation_router.message.middleware(AlbumMiddleware())
 
 user_router = user_handlers.router
 user_router.message.middleware(RoleMiddleware(allowed_roles=["teacher", "responsible", "admin"]))
@@ -68,86 +83,61 @@ dp.include_router(contest_participation_router)  # Добавляем роуте
 dp.include_router(watcher_router)
 
 
-async def main():
-    # Устанавливаем команды по умолчанию для всех пользователей
-    await set_default_commands(bot)
+async def on_startup(bot: Bot, primary: bool = True, database_ready=None):
+    """
+    Подготовка процесса к обработке обновлений.
+
+    Args:
+        bot: Объект бота
+        primary: Выполнять ли разовые задачи (миграции, команды, планировщик, рассылка).
+            При запуске нескольких процессов их выполняет только один из них.
+        database_ready: Общее для процессов событие (multiprocessing.Event): основной процесс
+            устанавливает его после индексов и миграций, остальные до этого не начинают работу
+    """
+    # Проверяем подключение к MongoDB до начала обработки обновлений
+    await ping_database()
+    if not primary:
+        if database_ready is not None:
+            await wait_database_ready(database_ready)
+        return
+
+    # Создаём индексы и применяем миграции схемы
+    await bootstrap_database()
+    if database_ready is not None:
+        database_ready.set()
+
+    # Устанавливаем команды по умолчанию и команды пользователей с особыми ролями
+    await provision_commands(bot)
     
     # Запуск планировщика
-    start_scheduler(bot)
-    await dp.start_polling(bot)
+    await start_scheduler(bot)
 
+    # Запуск фоновой рассылки уведомлений
+    notification_service.start(bot)
 
-async def set_default_commands(bot: Bot):
-    """Устанавливает команды бота для разных ролей пользователей"""
-    # Команды по умолчанию для всех пользователей
-    default_commands = [
-        BotCommand(command="start", description="Начать работу с ботом или перезапустить"),
-        BotCommand(command="contest", description="Заполнить участие в конкурсе"),
-    ]
-    
-    # Команды для администраторов
-    admin_commands = [
-        BotCommand(command="start", description="Начать работу с ботом или перезапустить"),
-        BotCommand(command="contest", description="Заполнить участие в конкурсе"),
-        BotCommand(command="add_watcher", description="Добавить роль наблюдателя"),
-        BotCommand(command="remove_role", description="Удалить роль у пользователя"),
-    ]
-    
-    # Команды для наблюдателей (watcher)
-    watcher_commands = [
-        BotCommand(command="start", description="Начать работу с ботом или перезапустить"),
-        BotCommand(command="watcher", description="Посмотреть доступные команды для наблюдателей"),
-        BotCommand(command="get_report", description="Получить отчет за период"),
-        BotCommand(command="contest", description="Заполнить участие в конкурсе"),
-    ]
-    
-    # Установка команд по умолчанию
-    await bot.set_my_commands(default_commands, scope=BotCommandScopeDefault())
-    
-    # Находим всех пользователей с ролью watcher и устанавливаем им специальные команды
-    from services.database import db
-    
-    watcher_users = list(db.users.find({
-        "$or": [
-            {"role": "watcher"},
-            {"role": {"$in": ["watcher"]}}
-        ]
-    }))
-    
-    logger.info(f"Найдено {len(watcher_users)} пользователей с ролью watcher")
-    
-    # Устанавливаем команды для каждого watcher
-    for user in watcher_users:
-        try:
-            await bot.set_my_commands(
-                watcher_commands,
-                scope=BotCommandScopeChat(chat_id=user["telegram_id"])
-            )
-        except Exception as e:
-            logger.error(f"Ошибка при установке команд для watcher {user['telegram_id']}: {e}")
-    
-    # Находим всех администраторов и устанавливаем им специальные команды
-    admin_users = list(db.users.find({
-        "$or": [
-            {"role": "admin"},
-            {"role": {"$in": ["admin"]}}
-        ]
-    }))
-    
-    logger.info(f"Найдено {len(admin_users)} пользователей с ролью admin")
-    
-    # Устанавливаем команды для каждого администратора
-    for user in admin_users:
-        try:
-            await bot.set_my_commands(
-                admin_commands,
-                scope=BotCommandScopeChat(chat_id=user["telegram_id"])
-            )
-        except Exception as e:
-            logger.error(f"Ошибка при установке команд для admin {user['telegram_id']}: {e}")
 
+async def wait_database_ready(database_ready, log_interval: float = 30) -> None:
+    """Ждёт, пока основной процесс подготовит базу; ожидание блокирующее, поэтому вне цикла событий"""
+    loop = asyncio.get_running_loop()
+    while not await loop.run_in_executor(None, database_ready.wait, log_interval):
+        logger.info("Ожидаем, пока основной процесс применит миграции и создаст индексы")
+
+
+async def on_shutdown():
+    await notification_service.stop()
+    report_queue.shutdown()
+    await storage.close()
+    await bot.session.close()
+    close_database()
 
-if __name__ == "__main__":
-    import asyncio
 
+async def main():
+    await on_startup(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await on_shutdown()
+
+
+if __name__ == "__main__":
     asyncio.run(main())
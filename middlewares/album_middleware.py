@@ -0,0 +1,50 @@
+import asyncio
+import os
+from typing import Dict, List
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+# Сколько секунд после последнего сообщения альбома ждать следующее
+ALBUM_WINDOW = float(os.getenv("ALBUM_WINDOW", "0.6"))
+
+
+class AlbumMiddleware(BaseMiddleware):
+    """
+    Собирает сообщения одного альбома (media_group_id) в одно событие.
+
+    Telegram присылает каждое фото альбома отдельным обновлением. Обработчик вызывается
+    один раз — для первого сообщения альбома, после того как в течение window секунд
+    не пришло новых; все сообщения альбома по порядку передаются в data["album"].
+    Остальные сообщения альбома до обработчика не доходят. Обновления одного чата должны
+    обрабатываться конкурентно (см. ChatSequencer в server/worker.py), иначе первое
+    сообщение альбома дождётся окончания окна раньше, чем придут остальные.
+    """
+
+    def __init__(self, window: float = ALBUM_WINDOW):
+        super().__init__()
+        self.window = window
+        self._albums: Dict[str, List[Message]] = {}
+
+    async def __call__(self, handler, event, data: dict):
+        if not isinstance(event, Message) or not event.media_group_id:
+            return await handler(event, data)
+
+        key = f"{event.chat.id}:{event.media_group_id}"
+        album = self._albums.get(key)
+        if album is not None:
+            album.append(event)
+            return None
+
+        album = self._albums[key] = [event]
+        try:
+            received = 0
+            while received != len(album):
+                received = len(album)
+                await asyncio.sleep(self.window)
+        finally:
+            self._albums.pop(key, None)
+
+        album.sort(key=lambda message: message.message_id)
+        data["album"] = album
+        return await handler(event, data)
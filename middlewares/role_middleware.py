@@ -1,6 +1,6 @@
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery
-from services.database import db
+from services.database import users_repo
 from config import logger
 
 
@@ -28,8 +28,12 @@ class RoleMiddleware(BaseMiddleware):
             logger.warning(f"Неизвестный тип события в middleware: {type(event)}")
             return await handler(event, data)
 
-        # Находим пользователя в базе данных
-        user = db.users.find_one({"telegram_id": user_id})
+        # Берём профиль, уже загруженный для этого обновления, или читаем его через кэш
+        if "user" in data:
+            user = data["user"]
+        else:
+            user = await users_repo.get_cached(user_id)
+            data["user"] = user
 
         if not user:
             await answer_method("Вы не зарегистрированы в системе.")
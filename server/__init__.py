@@ -0,0 +1 @@
+"""Режим работы бота через вебхук с несколькими процессами-обработчиками"""
@@ -0,0 +1,156 @@
+"""
+Локальный стенд для нагрузочной проверки режима вебхука без обращения к Telegram.
+
+    python -m server.fake_telegram serve [--port 8081]
+        Поддельный Bot API: отвечает на вызовы бота корректными объектами и считает их.
+        Бот направляется на него переменной TELEGRAM_API_URL=http://localhost:8081
+
+    python -m server.fake_telegram load [--url http://localhost:8080/webhook]
+                                        [--updates 5000] [--users 200] [--concurrency 100]
+        Отправляет на вебхук синтетические обновления /start от разных пользователей
+        и печатает пропускную способность и задержки ответа вебхука.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+import uuid
+from collections import Counter
+
+from aiohttp import ClientSession, web
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Методы, которые возвращают отправленное сообщение
+_MESSAGE_METHODS = {
+    "sendMessage", "sendDocument", "sendPhoto", "sendMediaGroup", "editMessageText", "copyMessage",
+}
+
+
+def _message(chat_id, message_id: int, text: str = None, document: dict = None) -> dict:
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": int(chat_id or 0), "type": "private"},
+        "text": text,
+        "document": document,
+    }
+
+
+def _document(media) -> dict:
+    """Документ отправленного сообщения: для загруженного файла выдаётся новый file_id"""
+    if isinstance(media, str) and not media.startswith("attach://"):
+        file_id = media
+    else:
+        file_id = f"fake-{uuid.uuid4().hex}"
+    return {"file_id": file_id, "file_unique_id": file_id[-16:]}
+
+
+def create_app() -> web.Application:
+    calls = Counter()
+    message_ids = itertools.count(1)
+
+    async def handle_method(request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        calls[method] += 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Fake bot", "username": "fake_bot"}
+        elif method == "sendMediaGroup":
+            media = params.get("media", [])
+            if isinstance(media, str):
+                media = json.loads(media)
+            result = [
+                _message(params.get("chat_id"), next(message_ids), document=_document(item.get("media")))
+                for item in media
+            ]
+        elif method == "sendDocument":
+            result = _message(params.get("chat_id"), next(message_ids), document=_document(params.get("document")))
+        elif method in _MESSAGE_METHODS:
+            result = _message(params.get("chat_id"), next(message_ids), params.get("text"))
+        else:
+            # setWebhook, setMyCommands, answerCallbackQuery и прочие методы возвращают True
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_stats(request: web.Request) -> web.Response:
+        return web.json_response(dict(calls))
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle_method)
+    app.router.add_get("/stats", handle_stats)
+    return app
+
+
+def make_update(update_id: int, user_id: int, text: str = "/start") -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+async def load(url: str, updates: int, users: int, concurrency: int, secret: str = None) -> None:
+    headers = {SECRET_HEADER: secret} if secret else {}
+    statuses = Counter()
+    latencies = []
+    update_ids = iter(range(1, updates + 1))
+
+    async def sender(session: ClientSession) -> None:
+        for update_id in update_ids:
+            update = make_update(update_id, 10_000 + update_id % users)
+            started = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as response:
+                statuses[response.status] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(sender(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"Отправлено обновлений: {updates} за {elapsed:.2f} с ({updates / elapsed:.0f} в секунду)")
+    print(f"Коды ответов: {dict(statuses)}")
+    print(
+        f"Задержка, мс: p50={latencies[len(latencies) // 2] * 1000:.1f} "
+        f"p95={latencies[int(len(latencies) * 0.95)] * 1000:.1f} "
+        f"max={latencies[-1] * 1000:.1f}"
+    )
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8081)
+
+    load_parser = commands.add_parser("load")
+    load_parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    load_parser.add_argument("--updates", type=int, default=5000)
+    load_parser.add_argument("--users", type=int, default=200)
+    load_parser.add_argument("--concurrency", type=int, default=100)
+    load_parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"))
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    if args.command == "serve":
+        web.run_app(create_app(), host=args.host, port=args.port)
+    else:
+        asyncio.run(load(args.url, args.updates, args.users, args.concurrency, args.secret))
@@ -0,0 +1,161 @@
+"""
+Приём обновлений Telegram через вебхук с раздачей по нескольким процессам.
+
+Фронтовой процесс aiohttp принимает обновление, определяет chat_id и кладёт его
+в очередь процесса chat_id % WEBHOOK_WORKERS. Все обновления одного чата
+обрабатывает один и тот же процесс и строго по очереди, поэтому порядок
+переходов FSM сохраняется. Если очередь переполнена, вебхук отвечает 503,
+и Telegram повторит доставку позже. Кэши в памяти процессов сбрасываются
+согласованно через общий счётчик (services.database.share_caches).
+
+Запуск:
+    python -m server.webhook
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+from typing import List, Optional
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+from config import create_bot
+from server.worker import WEBHOOK_WORKER_CONCURRENCY, run_worker
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+# Максимум обновлений, ожидающих обработки в очереди одного процесса
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+# Сколько одновременных соединений Telegram открывает к вебхуку (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Поля обновления, в которых лежит объект с чатом или пользователем
+_CHAT_SOURCES = ("chat", "message")
+
+
+def extract_chat_id(update: dict) -> int:
+    """Возвращает ID чата (или пользователя), к которому относится обновление"""
+    for event in update.values():
+        if not isinstance(event, dict):
+            continue
+        # callback_query и подобные содержат сообщение с чатом
+        for source in _CHAT_SOURCES:
+            nested = event.get(source)
+            if isinstance(nested, dict):
+                chat = nested.get("chat", nested)
+                if "id" in chat:
+                    return chat["id"]
+        for source in ("from", "user"):
+            if isinstance(event.get(source), dict):
+                return event[source]["id"]
+    return 0
+
+
+class UpdateDispatcher:
+    """Запускает процессы-обработчики и раздаёт им обновления по chat_id"""
+
+    def __init__(self, workers: int, queue_size: int, concurrency: int):
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [self._context.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._concurrency = concurrency
+        # Увеличивается при сбросе кэша в любом процессе, остальные очищают свой кэш
+        self._cache_generation = self._context.Value("q", 0)
+        # Основной процесс устанавливает событие после миграций, остальные до этого не обрабатывают обновления
+        self._database_ready = self._context.Event()
+        self._processes: List[multiprocessing.Process] = []
+
+    def start(self) -> None:
+        for index, updates in enumerate(self._queues):
+            process = self._context.Process(
+                target=run_worker,
+                args=(index, updates, index == 0, self._concurrency, self._cache_generation, self._database_ready),
+                name=f"bot-worker-{index}",
+            )
+            process.start()
+            self._processes.append(process)
+
+    def put(self, update: dict) -> bool:
+        """Кладёт обновление в очередь нужного процесса; возвращает False, если она переполнена"""
+        chat_id = extract_chat_id(update)
+        try:
+            self._queues[chat_id % len(self._queues)].put_nowait((chat_id, update))
+        except queue.Full:
+            return False
+        return True
+
+    def stop(self, timeout: float = 30) -> None:
+        for updates in self._queues:
+            updates.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Процесс {process.name} не завершился вовремя, останавливаем принудительно")
+                process.terminate()
+
+
+def create_app(dispatcher: UpdateDispatcher, secret: Optional[str] = WEBHOOK_SECRET) -> web.Application:
+    async def handle_update(request: web.Request) -> web.Response:
+        if secret and request.headers.get(SECRET_HEADER) != secret:
+            return web.Response(status=401)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not dispatcher.put(update):
+            logger.warning("Очередь обработчиков переполнена, Telegram повторит доставку")
+            return web.Response(status=503)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+    return app
+
+
+async def run() -> None:
+    if not BOT_TOKEN:
+        raise ValueError("Не указан BOT_TOKEN в переменных окружения.")
+    if not WEBHOOK_URL:
+        raise ValueError("Не указан WEBHOOK_URL в переменных окружения.")
+
+    dispatcher = UpdateDispatcher(WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKER_CONCURRENCY)
+    dispatcher.start()
+
+    # Журнал доступа на каждое обновление только нагружает процесс приёма
+    runner = web.AppRunner(create_app(dispatcher), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+    logger.info(f"Вебхук слушает {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}, процессов: {WEBHOOK_WORKERS}")
+
+    bot = create_bot(BOT_TOKEN)
+    try:
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+        await asyncio.Event().wait()
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+        # Join блокирует, поэтому выполняем его вне цикла событий
+        await asyncio.get_running_loop().run_in_executor(None, dispatcher.stop)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений один процесс обрабатывает одновременно
+WEBHOOK_WORKER_CONCURRENCY = int(os.getenv("WEBHOOK_WORKER_CONCURRENCY", "32"))
+
+
+def is_media_group(update: dict) -> bool:
+    return bool((update.get("message") or {}).get("media_group_id"))
+
+
+class ChatSequencer:
+    """
+    Запускает обработку обновлений конкурентно, но для одного чата строго по очереди:
+    следующее обновление чата ждёт завершения предыдущего, поэтому переходы FSM
+    не перемешиваются. Общее число одновременно обрабатываемых обновлений ограничено.
+
+    Сообщения альбома (concurrent=True) ждут только предыдущее обычное обновление
+    и обрабатываются одновременно друг с другом: AlbumMiddleware собирает их в одно
+    событие, пока первое сообщение альбома ждёт остальные. Следующее обычное
+    обновление чата ждёт завершения всего альбома.
+    """
+
+    def __init__(self, concurrency: int):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # chat_id -> (последнее обычное обновление, сообщения альбомов после него)
+        self._tails: Dict[int, Tuple[Optional[asyncio.Task], List[asyncio.Task]]] = {}
+
+    async def _run(self, previous: List[asyncio.Task], handler, update: dict) -> None:
+        if previous:
+            # Исключения предыдущих обновлений уже залогированы, здесь важен только порядок
+            await asyncio.gather(*previous, return_exceptions=True)
+        async with self._semaphore:
+            try:
+                await handler(update)
+            except Exception as e:
+                logger.exception(f"Ошибка при обработке обновления {update.get('update_id')}: {e}")
+
+    def submit(self, chat_id: int, handler, update: dict, concurrent: bool = False) -> asyncio.Task:
+        last, album = self._tails.get(chat_id, (None, []))
+        if concurrent:
+            task = asyncio.create_task(self._run([last] if last else [], handler, update))
+            self._tails[chat_id] = (last, album + [task])
+        else:
+            task = asyncio.create_task(self._run([t for t in (last, *album) if t], handler, update))
+            self._tails[chat_id] = (task, [])
+        task.add_done_callback(lambda _: self._forget(chat_id))
+        return task
+
+    def _forget(self, chat_id: int) -> None:
+        last, album = self._tails.get(chat_id, (None, []))
+        if all(t.done() for t in (last, *album) if t):
+            self._tails.pop(chat_id, None)
+
+    async def wait(self) -> None:
+        tasks = [t for last, album in self._tails.values() for t in (last, *album) if t]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _serve(
+    index: int, updates, primary: bool, concurrency: int, cache_generation=None, database_ready=None
+) -> None:
+    # Импортируем бота внутри процесса: каждый процесс создаёт свои соединения с Telegram и MongoDB
+    import main
+    from services.database import share_caches
+
+    if cache_generation is not None:
+        share_caches(cache_generation)
+
+    # Остальные процессы не берут обновления из очереди, пока основной не применит миграции
+    await main.on_startup(main.bot, primary=primary, database_ready=database_ready)
+    logger.info(f"Обработчик #{index} запущен (основной: {primary})")
+
+    sequencer = ChatSequencer(concurrency)
+    in_flight = asyncio.Semaphore(concurrency * 4)
+    loop = asyncio.get_running_loop()
+
+    async def handle(update: dict) -> None:
+        try:
+            await main.dp.feed_raw_update(main.bot, update)
+        finally:
+            in_flight.release()
+
+    try:
+        while True:
+            # Не забираем из очереди больше, чем успеваем обработать: остальное ждёт
+            # в общей очереди, и при её переполнении вебхук отвечает Telegram ошибкой
+            await in_flight.acquire()
+            item = await loop.run_in_executor(None, updates.get)
+            if item is None:
+                in_flight.release()
+                break
+            chat_id, update = item
+            sequencer.submit(chat_id, handle, update, concurrent=is_media_group(update))
+    finally:
+        await sequencer.wait()
+        await main.on_shutdown()
+        logger.info(f"Обработчик #{index} остановлен")
+
+
+def run_worker(
+    index: int,
+    updates,
+    primary: bool,
+    concurrency: int = WEBHOOK_WORKER_CONCURRENCY,
+    cache_generation=None,
+    database_ready=None,
+) -> None:
+    """
+    Точка входа процесса-обработчика.
+
+    Args:
+        index: Номер процесса
+        updates: Очередь пар (chat_id, обновление); None означает остановку
+        primary: Выполняет ли процесс разовые задачи (миграции, команды, планировщик)
+        concurrency: Сколько обновлений обрабатывается одновременно
+        cache_generation: Общий для процессов счётчик сбросов кэша (см. services.database.share_caches)
+        database_ready: Событие готовности базы: его устанавливает основной процесс, остальные ждут
+    """
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s [worker {index}] %(levelname)s %(name)s: %(message)s")
+    asyncio.run(_serve(index, updates, primary, concurrency, cache_generation, database_ready))
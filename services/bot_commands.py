@@ -0,0 +1,152 @@
+"""
+Установка меню команд бота для пользователей с особыми ролями.
+
+Команды по умолчанию задаются для всех, а администраторам и наблюдателям —
+отдельно для их чата. Хэш установленного набора хранится в профиле
+пользователя (поле commands_hash), поэтому при повторном запуске Bot API
+вызывается только для тех, чей набор изменился. После смены роли достаточно
+вызвать sync_user_commands_by_id для этого пользователя.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Union
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import BotCommand, BotCommandScopeChat, BotCommandScopeDefault
+
+from services.database import users_repo
+from services.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Сколько запросов к Bot API в секунду разрешено при установке команд
+BOT_COMMANDS_RATE = float(os.getenv("BOT_COMMANDS_RATE", "25"))
+# Сколько раз повторять запрос после ответа 429
+BOT_COMMANDS_RETRIES = 3
+# Сколько запросов может выполняться одновременно
+BOT_COMMANDS_CONCURRENCY = 10
+
+# Команды по умолчанию для всех пользователей
+DEFAULT_COMMANDS = [
+    BotCommand(command="start", description="Начать работу с ботом или перезапустить"),
+    BotCommand(command="contest", description="Заполнить участие в конкурсе"),
+]
+
+# Команды для администраторов
+ADMIN_COMMANDS = [
+    BotCommand(command="start", description="Начать работу с ботом или перезапустить"),
+    BotCommand(command="contest", description="Заполнить участие в конкурсе"),
+    BotCommand(command="add_watcher", description="Добавить роль наблюдателя"),
+    BotCommand(command="remove_role", description="Удалить роль у пользователя"),
+]
+
+# Команды для наблюдателей (watcher)
+WATCHER_COMMANDS = [
+    BotCommand(command="start", description="Начать работу с ботом или перезапустить"),
+    BotCommand(command="watcher", description="Посмотреть доступные команды для наблюдателей"),
+    BotCommand(command="get_report", description="Получить отчет за период"),
+    BotCommand(command="contest", description="Заполнить участие в конкурсе"),
+]
+
+# Общий лимит для всех вызовов set_my_commands/delete_my_commands процесса
+_bucket = TokenBucket(BOT_COMMANDS_RATE, capacity=BOT_COMMANDS_RATE)
+
+
+def commands_for_roles(roles: Union[str, List[str], None]) -> Optional[List[BotCommand]]:
+    """Набор команд для чата пользователя или None, если ему достаточно команд по умолчанию"""
+    if isinstance(roles, str):
+        roles = [roles]
+    roles = roles or []
+    if "admin" in roles:
+        return ADMIN_COMMANDS
+    if "watcher" in roles:
+        return WATCHER_COMMANDS
+    return None
+
+
+def commands_hash(commands: List[BotCommand]) -> str:
+    payload = json.dumps([command.model_dump() for command in commands], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+async def _call_api(method, *args, **kwargs):
+    """Вызывает метод Bot API с учётом лимита и повторяет его после ответа 429"""
+    for attempt in range(BOT_COMMANDS_RETRIES + 1):
+        await _bucket.acquire()
+        try:
+            return await method(*args, **kwargs)
+        except TelegramRetryAfter as e:
+            if attempt == BOT_COMMANDS_RETRIES:
+                raise
+            logger.warning(f"Bot API просит подождать {e.retry_after} с перед установкой команд")
+            _bucket.pause(e.retry_after)
+
+
+async def sync_user_commands(bot: Bot, user: Dict) -> bool:
+    """
+    Приводит меню команд в чате пользователя в соответствие с его ролями.
+
+    Args:
+        bot: Объект бота
+        user: Профиль пользователя с полями telegram_id, role и commands_hash
+
+    Returns:
+        True, если пришлось обращаться к Bot API
+    """
+    telegram_id = user["telegram_id"]
+    commands = commands_for_roles(user.get("role"))
+    current_hash = commands_hash(commands) if commands else None
+    if user.get("commands_hash") == current_hash:
+        return False
+
+    scope = BotCommandScopeChat(chat_id=telegram_id)
+    try:
+        if commands:
+            await _call_api(bot.set_my_commands, commands, scope=scope)
+        else:
+            # Особые команды больше не нужны: в чате снова действуют команды по умолчанию
+            await _call_api(bot.delete_my_commands, scope=scope)
+    except (TelegramBadRequest, TelegramForbiddenError) as e:
+        # Пользователь не начинал диалог с ботом или заблокировал его
+        logger.error(f"Не удалось установить команды для пользователя {telegram_id}: {e}")
+        return True
+
+    if current_hash:
+        await users_repo.update(telegram_id, {"commands_hash": current_hash})
+    else:
+        await users_repo.update_one({"telegram_id": telegram_id}, {"$unset": {"commands_hash": ""}})
+    return True
+
+
+async def sync_user_commands_by_id(bot: Bot, telegram_id: int) -> None:
+    """Обновляет меню команд пользователя после изменения его ролей"""
+    user = await users_repo.get(telegram_id)
+    if user:
+        await sync_user_commands(bot, user)
+
+
+async def provision_commands(bot: Bot) -> None:
+    """Устанавливает команды по умолчанию и команды всех пользователей с особыми ролями"""
+    await _call_api(bot.set_my_commands, DEFAULT_COMMANDS, scope=BotCommandScopeDefault())
+
+    # Одним запросом выбираем и привилегированных пользователей, и тех, у кого роль отозвали
+    users = await users_repo.find(
+        {"$or": [{"role": {"$in": ["admin", "watcher"]}}, {"commands_hash": {"$exists": True}}]},
+        {"telegram_id": 1, "role": 1, "commands_hash": 1},
+    )
+    semaphore = asyncio.Semaphore(BOT_COMMANDS_CONCURRENCY)
+
+    async def sync(user: Dict) -> bool:
+        async with semaphore:
+            try:
+                return await sync_user_commands(bot, user)
+            except Exception as e:
+                logger.error(f"Ошибка при установке команд для пользователя {user.get('telegram_id')}: {e}")
+                return True
+
+    updated = sum(await asyncio.gather(*(sync(user) for user in users)))
+    logger.info(f"Команды пользователей с особыми ролями: проверено {len(users)}, обновлено {updated}")
@@ -0,0 +1,78 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+# Маркер отсутствующего значения: позволяет кэшировать None как обычный результат
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Ограниченный по размеру LRU-кэш с временем жизни записей.
+
+    Кэш живёт в памяти процесса. Если данные меняют несколько процессов, кэш можно
+    связать с общим счётчиком сбросов (см. share): pop и clear в любом процессе
+    очищают этот кэш и в остальных процессах при следующем чтении.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._generation: Optional[Any] = None
+        self._seen = 0
+
+    def share(self, generation) -> None:
+        """Связывает кэш с общим для процессов счётчиком сбросов (multiprocessing.Value("q"))"""
+        self._generation = generation
+        self._seen = generation.value
+
+    def _sync(self) -> None:
+        # Другой процесс сбросил кэш: наши записи могли устареть
+        if self._generation is not None and self._generation.value != self._seen:
+            self._seen = self._generation.value
+            self._data.clear()
+
+    def _publish(self) -> None:
+        if self._generation is None:
+            return
+        with self._generation.get_lock():
+            stale = self._generation.value != self._seen
+            self._generation.value += 1
+            self._seen = self._generation.value
+        if stale:
+            self._data.clear()
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        self._sync()
+        item = self._data.get(key)
+        if item is None:
+            return default
+
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+
+        # Отмечаем запись как недавно использованную
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        # Счётчик здесь не проверяется: значение могло быть прочитано из базы до сброса в другом
+        # процессе, и такая запись должна очиститься при следующем get
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+        self._publish()
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._publish()
+
+    def __len__(self) -> int:
+        return len(self._data)
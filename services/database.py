@@ -1,9 +1,841 @@
-from pymongo import MongoClient
+import asyncio
+import logging
 import os
+from datetime import datetime, timedelta
+from collections import Counter
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import DuplicateKeyError
+
+from services.cache import MISSING, TTLCache
+
+# Модуль может импортироваться раньше main.py (например, из CLI), поэтому читаем .env здесь
+load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
-db = client["contests_bot"]
+
+# Параметры пула соединений и таймауты (значения в миллисекундах)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+
+# Порог (мс), после которого запрос к MongoDB логируется как медленный
+MONGO_SLOW_QUERY_MS = int(os.getenv("MONGO_SLOW_QUERY_MS", "100"))
+
+# Размер и время жизни (в секундах) кэша профилей пользователей
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "2048"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+
+# Время жизни (в секундах) кэша первых букв ФИО для выбора пользователя
+USER_LETTERS_CACHE_TTL = 300
+
+# Время жизни (в секундах) кэша страниц списка конкурсов
+CONTEST_PAGE_CACHE_TTL = float(os.getenv("CONTEST_PAGE_CACHE_TTL", "60"))
+
+DATABASE_NAME = "contests_bot"
+
+logger = logging.getLogger(__name__)
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Пишет предупреждение в лог для команд MongoDB, выполнявшихся дольше порога"""
+
+    # Команды, которые отправляют репозитории: find/find_one, aggregate (в том числе count_documents),
+    # distinct, insert_*, update_* и delete_* (и bulk_write), find_one_and_update
+    MONITORED_COMMANDS = ("find", "aggregate", "distinct", "insert", "update", "delete", "findAndModify")
+
+    def __init__(self, threshold_ms: int):
+        self.threshold_ms = threshold_ms
+        self._started = {}
+
+    def started(self, event):
+        if event.command_name in self.MONITORED_COMMANDS:
+            collection = event.command.get(event.command_name)
+            query = event.command.get("filter") or event.command.get("pipeline") or event.command.get("query")
+            if query is None:
+                # update/delete передают условия списком операций, у insert условий нет
+                statements = event.command.get("updates") or event.command.get("deletes") or [{}]
+                query = statements[0].get("q")
+            self._started[event.request_id] = (collection, query)
+
+    def succeeded(self, event):
+        self._report(event)
+
+    def failed(self, event):
+        self._report(event)
+
+    def _report(self, event):
+        collection, query = self._started.pop(event.request_id, (None, None))
+        duration_ms = event.duration_micros / 1000
+        if duration_ms >= self.threshold_ms:
+            logger.warning(
+                f"Медленный запрос MongoDB: {event.command_name} {collection} {query} — {duration_ms:.0f} мс"
+            )
+
+
+client = AsyncIOMotorClient(
+    MONGO_URI,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    event_listeners=[SlowQueryListener(MONGO_SLOW_QUERY_MS)],
+)
+db = client[DATABASE_NAME]
 users_col = db["users"]
 contests_col = db["contests"]
-contest_participations_col = db["contest_participations"]
\ No newline at end of file
+contest_participations_col = db["contest_participations"]
+participation_months_col = db["participation_months"]
+report_snapshots_col = db["report_snapshots"]
+notification_outbox_col = db["notification_outbox"]
+scheduler_state_col = db["scheduler_state"]
+upload_blobs_col = db["upload_blobs"]
+fsm_states_col = db["fsm_states"]
+
+
+class Repository:
+    """Базовый асинхронный репозиторий поверх коллекции MongoDB"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_one(self, query: Dict, projection: Optional[Dict] = None) -> Optional[Dict]:
+        return await self.collection.find_one(query, projection)
+
+    async def find(
+        self,
+        query: Optional[Dict] = None,
+        projection: Optional[Dict] = None,
+        sort: Optional[List] = None,
+        limit: int = 0,
+    ) -> List[Dict]:
+        cursor = self.collection.find(query or {}, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=None)
+
+    def iterate(self, query: Optional[Dict] = None, projection: Optional[Dict] = None):
+        """Возвращает курсор для постраничного чтения через `async for`"""
+        return self.collection.find(query or {}, projection)
+
+    async def insert_one(self, document: Dict):
+        return await self.collection.insert_one(document)
+
+    async def update_one(self, query: Dict, update: Dict, upsert: bool = False):
+        return await self.collection.update_one(query, update, upsert=upsert)
+
+    async def delete_one(self, query: Dict):
+        return await self.collection.delete_one(query)
+
+    async def delete_many(self, query: Dict):
+        return await self.collection.delete_many(query)
+
+    async def count(self, query: Optional[Dict] = None) -> int:
+        return await self.collection.count_documents(query or {})
+
+
+def name_key(full_name: str) -> str:
+    """Ключ для поиска и сортировки по ФИО: нижний регистр, ё заменена на е, лишние пробелы убраны"""
+    return " ".join(full_name.lower().replace("ё", "е").split())
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    """Наименьшая строка, которая больше всех строк с префиксом prefix"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class UserPage(NamedTuple):
+    """Страница справочника пользователей, упорядоченного по (full_name_key, telegram_id)"""
+    users: List[Dict]
+    has_prev: bool
+    has_next: bool
+
+
+class UserRepository(Repository):
+    """
+    Доступ к коллекции пользователей с кэшем профилей в памяти процесса.
+
+    Вместе с full_name хранится нормализованный ключ full_name_key (см. name_key):
+    по нему с индексом выполняются поиск по началу ФИО и постраничный просмотр.
+    """
+
+    DIRECTORY_PROJECTION = {"_id": 0, "telegram_id": 1, "full_name": 1, "full_name_key": 1, "role": 1}
+
+    def __init__(self, collection, cache: TTLCache, letters_cache: TTLCache):
+        super().__init__(collection)
+        self.cache = cache
+        self.letters_cache = letters_cache
+
+    async def get(self, telegram_id: int) -> Optional[Dict]:
+        return await self.find_one({"telegram_id": telegram_id})
+
+    async def get_cached(self, telegram_id: int) -> Optional[Dict]:
+        """
+        Возвращает профиль пользователя из кэша, при промахе читает его из базы.
+        Результат используется только для чтения: изменять его нельзя.
+        """
+        user = self.cache.get(telegram_id)
+        if user is MISSING:
+            user = await self.get(telegram_id)
+            self.cache.set(telegram_id, user)
+        return user
+
+    def invalidate(self, telegram_id: Optional[int] = None) -> None:
+        """Сбрасывает кэш пользователя (или весь кэш, если ID неизвестен)"""
+        if telegram_id is None:
+            self.cache.clear()
+        else:
+            self.cache.pop(telegram_id)
+
+    def _invalidate_by_query(self, query: Dict) -> None:
+        telegram_id = query.get("telegram_id")
+        self.invalidate(telegram_id if isinstance(telegram_id, int) else None)
+
+    async def insert_one(self, document: Dict):
+        if document.get("full_name"):
+            document = {**document, "full_name_key": name_key(document["full_name"])}
+        result = await super().insert_one(document)
+        self._invalidate_by_query(document)
+        self.letters_cache.clear()
+        return result
+
+    async def update_one(self, query: Dict, update: Dict, upsert: bool = False):
+        fields = update.get("$set", {})
+        if fields.get("full_name"):
+            # Ключ поиска всегда обновляется вместе с ФИО
+            update = {**update, "$set": {**fields, "full_name_key": name_key(fields["full_name"])}}
+        result = await super().update_one(query, update, upsert=upsert)
+        self._invalidate_by_query(query)
+        if "full_name" in fields or "full_name" in update.get("$unset", {}):
+            self.letters_cache.clear()
+        return result
+
+    async def delete_one(self, query: Dict):
+        result = await super().delete_one(query)
+        self._invalidate_by_query(query)
+        self.letters_cache.clear()
+        return result
+
+    async def delete_many(self, query: Dict):
+        result = await super().delete_many(query)
+        self.invalidate()
+        self.letters_cache.clear()
+        return result
+
+    async def update(self, telegram_id: int, fields: Dict[str, Any], upsert: bool = False):
+        return await self.update_one({"telegram_id": telegram_id}, {"$set": fields}, upsert=upsert)
+
+    async def delete(self, telegram_id: int):
+        return await self.delete_one({"telegram_id": telegram_id})
+
+    async def find_by_role(self, role: str, projection: Optional[Dict] = None) -> List[Dict]:
+        # Поле role может быть строкой или массивом, запрос по значению покрывает оба случая
+        return await self.find({"role": role}, projection)
+
+    async def name_letters(self) -> List[str]:
+        """Первые буквы ФИО пользователей (в нижнем регистре), по алфавиту"""
+        letters = self.letters_cache.get("letters")
+        if letters is MISSING:
+            pipeline = [
+                {"$match": {"full_name_key": {"$gt": ""}}},
+                {"$group": {"_id": {"$substrCP": ["$full_name_key", 0, 1]}}},
+                {"$sort": {"_id": 1}},
+            ]
+            letters = [doc["_id"] async for doc in self.collection.aggregate(pipeline)]
+            self.letters_cache.set("letters", letters)
+        return letters
+
+    async def directory_page(
+        self,
+        prefix: str = "",
+        cursor: Optional[int] = None,
+        backward: bool = False,
+        limit: int = 20,
+        query: Optional[Dict] = None,
+    ) -> UserPage:
+        """
+        Страница пользователей с ФИО, начинающимся на prefix (без prefix — всех), по алфавиту.
+
+        Выборка — диапазон по индексу full_name_key_telegram_id. Ключ страницы — telegram_id
+        крайнего пользователя: он помещается в callback_data, а его full_name_key читается
+        отдельным запросом. Без cursor возвращается первая страница; backward=True листает назад.
+        Дополнительные условия можно передать в query.
+        """
+        prefix = name_key(prefix)
+        if prefix:
+            conditions = [{"full_name_key": {"$gte": prefix, "$lt": _prefix_upper_bound(prefix)}}]
+        else:
+            conditions = [{"full_name_key": {"$type": "string"}}]
+        if query:
+            conditions.append(query)
+
+        anchor = None
+        if cursor is not None:
+            anchor = await self.find_one({"telegram_id": cursor}, {"full_name_key": 1})
+        if anchor and anchor.get("full_name_key") is not None:
+            op = "$lt" if backward else "$gt"
+            conditions.append({"$or": [
+                {"full_name_key": {op: anchor["full_name_key"]}},
+                {"full_name_key": anchor["full_name_key"], "telegram_id": {op: cursor}},
+            ]})
+        else:
+            # Пользователь, на котором закончилась страница, удалён: начинаем сначала
+            anchor = None
+            backward = False
+
+        direction = -1 if backward else 1
+        users = await self.find(
+            {"$and": conditions}, self.DIRECTORY_PROJECTION,
+            sort=[("full_name_key", direction), ("telegram_id", direction)], limit=limit + 1,
+        )
+        more = len(users) > limit
+        users = users[:limit]
+        if backward:
+            users.reverse()
+            return UserPage(users, has_prev=more, has_next=True)
+        return UserPage(users, has_prev=anchor is not None, has_next=more)
+
+    async def get_names(self, telegram_ids: List[int]) -> Dict[int, str]:
+        """
+        ФИО пользователей по их ID: {telegram_id: full_name}.
+        Профили из кэша используются как есть, остальные читаются одним запросом $in.
+        Пользователи без профиля или без ФИО в результат не попадают.
+        """
+        names = {}
+        missing = []
+        for telegram_id in dict.fromkeys(telegram_ids):
+            user = self.cache.get(telegram_id)
+            if user is MISSING:
+                missing.append(telegram_id)
+            elif user and user.get("full_name"):
+                names[telegram_id] = user["full_name"]
+        if missing:
+            cursor = self.collection.find({"telegram_id": {"$in": missing}}, {"_id": 0, "telegram_id": 1, "full_name": 1})
+            async for user in cursor:
+                if user.get("full_name"):
+                    names[user["telegram_id"]] = user["full_name"]
+        return names
+
+
+class ContestPage(NamedTuple):
+    """Страница списка конкурсов, упорядоченного по (end_date, _id)"""
+    contests: List[Dict]
+    has_prev: bool
+    has_next: bool
+
+
+class ContestRepository(Repository):
+    """
+    Доступ к коллекции конкурсов.
+
+    Списки конкурсов для выбора читаются постранично по ключу (end_date, _id): каждая
+    страница — один запрос по индексу end_date_id с проекцией нужных для кнопок полей.
+    Страницы кэшируются в памяти процесса и сбрасываются при любом изменении конкурсов,
+    в режиме вебхука — во всех процессах-обработчиках (см. share_caches).
+    """
+
+    PAGE_PROJECTION = {"name": 1, "start_date": 1, "end_date": 1}
+
+    def __init__(self, collection, page_cache: TTLCache):
+        super().__init__(collection)
+        self.page_cache = page_cache
+
+    async def insert_one(self, document: Dict):
+        result = await super().insert_one(document)
+        self.page_cache.clear()
+        return result
+
+    async def update_one(self, query: Dict, update: Dict, upsert: bool = False):
+        result = await super().update_one(query, update, upsert=upsert)
+        self.page_cache.clear()
+        return result
+
+    async def delete_one(self, query: Dict):
+        result = await super().delete_one(query)
+        self.page_cache.clear()
+        return result
+
+    async def delete_many(self, query: Dict):
+        result = await super().delete_many(query)
+        self.page_cache.clear()
+        return result
+
+    async def page(
+        self,
+        cursor: Optional[Tuple[datetime, Any]] = None,
+        backward: bool = False,
+        limit: int = 8,
+    ) -> ContestPage:
+        """
+        Страница конкурсов после ключа cursor = (end_date, _id), а при backward=True — перед ним.
+        Без cursor возвращается первая страница.
+        """
+        key = (cursor, backward, limit)
+        cached = self.page_cache.get(key)
+        if cached is not MISSING:
+            return cached
+
+        query: Dict[str, Any] = {"end_date": {"$type": "date"}}
+        if cursor is not None:
+            end_date, contest_id = cursor
+            op = "$lt" if backward else "$gt"
+            query["$or"] = [
+                {"end_date": {op: end_date}},
+                {"end_date": end_date, "_id": {op: contest_id}},
+            ]
+        direction = -1 if backward else 1
+        contests = await self.find(
+            query, self.PAGE_PROJECTION, sort=[("end_date", direction), ("_id", direction)], limit=limit + 1
+        )
+        more = len(contests) > limit
+        contests = contests[:limit]
+        if backward:
+            contests.reverse()
+            result = ContestPage(contests, has_prev=more, has_next=True)
+        else:
+            result = ContestPage(contests, has_prev=cursor is not None, has_next=more)
+        self.page_cache.set(key, result)
+        return result
+
+    async def get(self, contest_id) -> Optional[Dict]:
+        return await self.find_one({"_id": contest_id})
+
+    async def add_file_ids(self, contest_id, entries: List[Dict]) -> None:
+        """
+        Запоминает Telegram file_id вложений конкурса: entries = [{"name": ..., "file_id": ...}].
+        Прежние записи для тех же имён файлов заменяются.
+        """
+        if not entries:
+            return
+        names = [entry["name"] for entry in entries]
+        # $pull и $push одного поля нельзя выполнить одним обновлением
+        await self.update_one({"_id": contest_id}, {"$pull": {"file_ids": {"name": {"$in": names}}}})
+        await self.update_one({"_id": contest_id}, {"$push": {"file_ids": {"$each": entries}}})
+
+
+def confirmation_file_names(confirmation_files: Iterable) -> List[str]:
+    """Имена файлов подтверждения записи об участии (элемент — строка или {saved_name, ...})"""
+    names = []
+    for file_info in confirmation_files or []:
+        name = file_info.get("saved_name") if isinstance(file_info, dict) else file_info
+        if name:
+            names.append(name)
+    return names
+
+
+class UploadRepository(Repository):
+    """
+    Файлы хранилища загрузок (services/upload_store.py): {_id: путь относительно uploads, refs, last_seen_at}.
+
+    refs — число ссылок из confirmation_files записей об участии, last_seen_at — время
+    последней загрузки файла. Файл без ссылок может понадобиться ещё не сохранённой
+    заявке, поэтому удаляется только через некоторое время после последней загрузки.
+
+    Удаление двухфазное: сборщик помечает запись полем removing_at, удаляет файл с диска
+    и только потом удаляет запись. Загрузка того же содержимого (register) ждёт, пока
+    удаление закончится, поэтому файл не пропадёт после того, как загрузка сочла его
+    уже лежащим в хранилище.
+    """
+
+    # Через сколько секунд незавершённое удаление (сборщик упал) перестаёт блокировать загрузку
+    REMOVAL_TIMEOUT = 600
+    # Как часто загрузка проверяет, закончилось ли удаление файла, с
+    REMOVAL_POLL_INTERVAL = 0.5
+
+    def _not_removing(self, now: datetime) -> Dict:
+        return {"$or": [
+            {"removing_at": {"$exists": False}},
+            {"removing_at": {"$lt": now - timedelta(seconds=self.REMOVAL_TIMEOUT)}},
+        ]}
+
+    async def register(self, name: str) -> None:
+        """
+        Отмечает загрузку файла. После возврата сборщик не удалит файл раньше, чем через
+        UPLOAD_ORPHAN_HOURS, поэтому вызывается до того, как файл кладётся в хранилище.
+        """
+        while True:
+            now = datetime.now()
+            try:
+                await self.update_one(
+                    {"_id": name, **self._not_removing(now)},
+                    {"$set": {"last_seen_at": now}, "$unset": {"removing_at": ""}, "$setOnInsert": {"refs": 0}},
+                    upsert=True,
+                )
+                return
+            except DuplicateKeyError:
+                # Запись есть, но сборщик как раз удаляет файл: ждём, пока он удалит и запись
+                await asyncio.sleep(self.REMOVAL_POLL_INTERVAL)
+
+    async def add_refs(self, names: Iterable[str], sign: int = 1) -> None:
+        """Увеличивает (sign=1) или уменьшает (sign=-1) счётчики ссылок на файлы хранилища"""
+        counts = Counter(name for name in names if self.is_stored(name))
+        if counts:
+            await self.collection.bulk_write([
+                UpdateOne({"_id": name}, {"$inc": {"refs": sign * count}}, upsert=sign > 0)
+                for name, count in counts.items()
+            ], ordered=False)
+
+    async def orphans(self, cutoff: datetime, limit: int = 500) -> List[Dict]:
+        """Файлы без ссылок, которые не загружались с момента cutoff и ещё не удаляются"""
+        query = {"refs": {"$lte": 0}, "last_seen_at": {"$lt": cutoff}, **self._not_removing(datetime.now())}
+        return await self.find(query, limit=limit)
+
+    async def claim_orphan(self, name: str, cutoff: datetime) -> bool:
+        """Помечает файл удаляемым, если на него так и нет ссылок; True — файл можно удалить с диска"""
+        now = datetime.now()
+        result = await self.update_one(
+            {"_id": name, "refs": {"$lte": 0}, "last_seen_at": {"$lt": cutoff}, **self._not_removing(now)},
+            {"$set": {"removing_at": now}},
+        )
+        return bool(result.modified_count)
+
+    async def finish_removal(self, name: str) -> None:
+        """Удаляет запись о файле, уже удалённом с диска"""
+        await self.delete_one({"_id": name, "removing_at": {"$exists": True}})
+
+    @staticmethod
+    def is_stored(name: str) -> bool:
+        """Файл лежит в хранилище (путь с папками-префиксами), а не в корне uploads"""
+        return "/" in name
+
+    async def rebuild_refs(self, participations_collection) -> None:
+        """Пересчитывает счётчики ссылок по всем записям об участии"""
+        await self.collection.update_many({}, {"$set": {"refs": 0}})
+        await participations_collection.aggregate([
+            {"$unwind": "$confirmation_files"},
+            {"$project": {"name": {"$cond": [
+                {"$eq": [{"$type": "$confirmation_files"}, "object"]},
+                "$confirmation_files.saved_name",
+                "$confirmation_files",
+            ]}}},
+            {"$match": {"name": {"$regex": "/"}}},
+            {"$group": {"_id": "$name", "refs": {"$sum": 1}}},
+            {"$set": {"last_seen_at": "$$NOW"}},
+            {"$merge": {
+                "into": self.collection.name,
+                "on": "_id",
+                "whenMatched": [{"$set": {"refs": "$$new.refs"}}],
+                "whenNotMatched": "insert",
+            }},
+        ]).to_list(length=None)
+
+
+class ParticipationRepository(Repository):
+    """
+    Доступ к коллекции записей об участии в конкурсах.
+
+    Вместе с записями ведётся сводка по месяцам (коллекция participation_months,
+    документ {_id: "ГГГГ-ММ", year, month, count, version}), из которой строится
+    выбор месяца для отчёта без просмотра всей истории участий. Поле version
+    увеличивается при любом добавлении, изменении или удалении записи месяца
+    и служит ключом для снимков готовых отчётов. При добавлении и удалении записей
+    меняются и счётчики ссылок на файлы подтверждения в хранилище загрузок.
+    """
+
+    def __init__(self, collection, months_collection, uploads: UploadRepository):
+        super().__init__(collection)
+        self.months_collection = months_collection
+        self.uploads = uploads
+
+    @staticmethod
+    def _month_id(created_at: datetime) -> str:
+        return f"{created_at.year}-{created_at.month:02d}"
+
+    async def _affected_months(self, query: Dict, limit: int = 0) -> Dict[str, int]:
+        """Число подходящих под запрос записей по месяцам: {"ГГГГ-ММ": количество}"""
+        pipeline = [{"$match": query}, {"$match": {"created_at": {"$type": "date"}}}]
+        if limit:
+            pipeline.append({"$limit": limit})
+        pipeline.append({"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m", "date": "$created_at"}},
+            "count": {"$sum": 1},
+        }})
+        return {doc["_id"]: doc["count"] async for doc in self.collection.aggregate(pipeline)}
+
+    async def _touch_months(self, months: Dict[str, int], sign: int = 0) -> None:
+        """Увеличивает версию месяцев и при необходимости меняет число записей на sign * количество"""
+        for month_id, count in months.items():
+            await self.months_collection.update_one(
+                {"_id": month_id}, {"$inc": {"count": sign * count, "version": 1}}
+            )
+
+    async def insert_one(self, document: Dict):
+        result = await super().insert_one(document)
+        created_at = document.get("created_at")
+        if isinstance(created_at, datetime):
+            await self.months_collection.update_one(
+                {"_id": self._month_id(created_at)},
+                {"$inc": {"count": 1, "version": 1}, "$setOnInsert": {"year": created_at.year, "month": created_at.month}},
+                upsert=True,
+            )
+        await self.uploads.add_refs(confirmation_file_names(document.get("confirmation_files")))
+        return result
+
+    async def update_one(self, query: Dict, update: Dict, upsert: bool = False):
+        months = await self._affected_months(query, limit=1)
+        result = await super().update_one(query, update, upsert=upsert)
+        # Изменение created_at переносит запись в другой месяц: такие правки требуют rebuild_month_index,
+        # а изменение confirmation_files — пересчёта ссылок (python -m services.upload_store refs)
+        await self._touch_months(months)
+        return result
+
+    async def _file_names(self, query: Dict, limit: int = 0) -> List[str]:
+        docs = await self.find(query, {"confirmation_files": 1}, limit=limit)
+        return [name for doc in docs for name in confirmation_file_names(doc.get("confirmation_files"))]
+
+    async def delete_one(self, query: Dict):
+        months = await self._affected_months(query, limit=1)
+        names = await self._file_names(query, limit=1)
+        result = await super().delete_one(query)
+        if result.deleted_count:
+            await self._touch_months(months, sign=-1)
+            await self.uploads.add_refs(names, sign=-1)
+        return result
+
+    async def delete_many(self, query: Dict):
+        months = await self._affected_months(query)
+        names = await self._file_names(query)
+        result = await super().delete_many(query)
+        await self._touch_months(months, sign=-1)
+        await self.uploads.add_refs(names, sign=-1)
+        return result
+
+    async def available_months(self) -> List[Tuple[int, int]]:
+        """Месяцы, за которые есть записи, от новых к старым: [(год, месяц), ...]"""
+        cursor = self.months_collection.find({"count": {"$gt": 0}}, {"year": 1, "month": 1}).sort("_id", -1)
+        return [(doc["year"], doc["month"]) async for doc in cursor]
+
+    async def month_version(self, year: int, month: int) -> Optional[int]:
+        """Версия данных месяца или None, если записей за месяц нет"""
+        doc = await self.months_collection.find_one({"_id": f"{year}-{month:02d}"}, {"count": 1, "version": 1})
+        if not doc or doc.get("count", 0) <= 0:
+            return None
+        return doc.get("version", 0)
+
+    async def rebuild_month_index(self) -> None:
+        """Пересчитывает сводку по месяцам по всем записям (для существующих данных и после массовых правок)"""
+        # Версии не сбрасываются, а увеличиваются: иначе совпали бы с версиями старых снимков отчётов
+        await self.months_collection.update_many({}, {"$set": {"count": 0}, "$inc": {"version": 1}})
+        await self.collection.aggregate([
+            {"$match": {"created_at": {"$type": "date"}}},
+            {"$group": {
+                "_id": {"$dateToString": {"format": "%Y-%m", "date": "$created_at"}},
+                "year": {"$first": {"$year": "$created_at"}},
+                "month": {"$first": {"$month": "$created_at"}},
+                "count": {"$sum": 1},
+            }},
+            {"$merge": {
+                "into": self.months_collection.name,
+                "on": "_id",
+                "whenMatched": [{"$set": {"count": "$$new.count"}}],
+                "whenNotMatched": "insert",
+            }},
+        ]).to_list(length=None)
+
+
+class ReportSnapshotRepository(Repository):
+    """
+    Снимки готовых отчётов за месяц: {_id: "ГГГГ-ММ", version, files, file_ids}.
+
+    Снимок действителен, пока версия данных месяца не изменилась. Файлы лежат на диске,
+    а file_id, полученные от Telegram после первой отправки, позволяют отправлять
+    отчёт повторно без загрузки файла.
+    """
+
+    async def get(self, year: int, month: int, version: int) -> Optional[Dict]:
+        return await self.find_one({"_id": f"{year}-{month:02d}", "version": version})
+
+    async def save(self, year: int, month: int, version: int, files: Dict[str, str]) -> Tuple[bool, Optional[Dict]]:
+        """
+        Сохраняет снимок, если он новее текущего.
+        Возвращает признак сохранения и заменённый снимок (его файлы больше не нужны).
+        """
+        try:
+            previous = await self.collection.find_one_and_update(
+                {"_id": f"{year}-{month:02d}", "version": {"$lt": version}},
+                {"$set": {"version": version, "files": files, "file_ids": {}, "created_at": datetime.now()}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Уже сохранён снимок той же или более новой версии
+            return False, None
+        return True, previous
+
+    async def set_file_id(self, year: int, month: int, version: int, kind: str, file_id: str) -> None:
+        await self.update_one(
+            {"_id": f"{year}-{month:02d}", "version": version},
+            {"$set": {f"file_ids.{kind}": file_id}},
+        )
+
+
+class NotificationOutboxRepository(Repository):
+    """
+    Очередь исходящих уведомлений: {chat_id, text, status, attempts, next_attempt_at, created_at, offset}.
+
+    Статусы: pending — ждёт отправки, sending — взято обработчиком (до lease_until),
+    sent — отправлено, failed — не доставлено. Отправленные уведомления удаляет
+    TTL-индекс по sent_at; пока они хранятся, повторная постановка уведомления с тем же
+    _id не приводит к повторной отправке. Обработчик забирает сразу все ожидающие
+    уведомления одного получателя и отправляет их одним сообщением. offset — сколько
+    символов текста уже отправлено, если доставка склеенных уведомлений оборвалась.
+    """
+
+    def __init__(self, collection, users_collection):
+        super().__init__(collection)
+        self.users_collection = users_collection
+
+    async def enqueue(self, chat_id: int, text: str, delay: float = 0) -> None:
+        now = datetime.now()
+        await self.insert_one({
+            "chat_id": chat_id,
+            "text": text,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now + timedelta(seconds=delay),
+        })
+
+    async def enqueue_for_users(self, users_query: Dict, text: str) -> None:
+        """Ставит уведомление всем пользователям, подходящим под запрос, не вычитывая их в бота"""
+        await self.users_collection.aggregate([
+            {"$match": users_query},
+            {"$project": {
+                "_id": 0,
+                "chat_id": "$telegram_id",
+                "text": {"$literal": text},
+                "status": "pending",
+                "attempts": {"$literal": 0},
+                "created_at": "$$NOW",
+                "next_attempt_at": "$$NOW",
+            }},
+            {"$merge": {"into": self.collection.name, "whenNotMatched": "insert"}},
+        ]).to_list(length=None)
+
+    async def claim(self, batch_id: str, lease: float, coalesce: float = 0) -> List[Dict]:
+        """
+        Забирает получателя, у которого подошло время отправки, вместе с его ожидающими
+        уведомлениями, время которых наступает в ближайшие coalesce секунд. Отложенные
+        повторы с более поздним next_attempt_at остаются ждать. Уведомления с истёкшей
+        арендой (обработчик упал) забираются повторно. Возвращает уведомления в порядке
+        создания или пустой список.
+        """
+        now = datetime.now()
+        claimed = {"$set": {"status": "sending", "batch": batch_id, "lease_until": now + timedelta(seconds=lease)}}
+        first = await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "lease_until": {"$lt": now}},
+            ]},
+            claimed,
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if first is None:
+            return []
+        await self.collection.update_many({
+            "chat_id": first["chat_id"],
+            "status": "pending",
+            "next_attempt_at": {"$lte": now + timedelta(seconds=coalesce)},
+        }, claimed)
+        return await self.find({"batch": batch_id}, sort=[("created_at", 1), ("_id", 1)])
+
+    async def complete(self, batch_id: str) -> None:
+        await self.collection.update_many(
+            {"batch": batch_id},
+            {"$set": {"status": "sent", "sent_at": datetime.now()}, "$unset": {"batch": "", "lease_until": ""}},
+        )
+
+    async def save_progress(self, batch_id: str, sent_ids: List[Any], offsets: Dict[Any, int]) -> None:
+        """
+        Отмечает отправленными уведомления sent_ids (они выходят из пачки batch_id)
+        и запоминает для остальных, сколько символов текста уже отправлено
+        """
+        if sent_ids:
+            await self.collection.update_many(
+                {"batch": batch_id, "_id": {"$in": sent_ids}},
+                {"$set": {"status": "sent", "sent_at": datetime.now()}, "$unset": {"batch": "", "lease_until": ""}},
+            )
+        if offsets:
+            await self.collection.bulk_write([
+                UpdateOne({"_id": notification_id, "batch": batch_id}, {"$set": {"offset": offset}})
+                for notification_id, offset in offsets.items()
+            ], ordered=False)
+
+    async def release(self, batch_id: str, retry_at: datetime, count_attempt: bool = True) -> None:
+        """Возвращает уведомления в очередь до retry_at"""
+        update = {"$set": {"status": "pending", "next_attempt_at": retry_at}, "$unset": {"batch": "", "lease_until": ""}}
+        if count_attempt:
+            update["$inc"] = {"attempts": 1}
+        await self.collection.update_many({"batch": batch_id}, update)
+
+    async def fail(self, batch_id: str, error: str) -> None:
+        await self.collection.update_many(
+            {"batch": batch_id},
+            {"$set": {"status": "failed", "error": error}, "$unset": {"batch": "", "lease_until": ""}},
+        )
+
+
+users_repo = UserRepository(
+    users_col,
+    TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL),
+    TTLCache(maxsize=1, ttl=USER_LETTERS_CACHE_TTL),
+)
+contests_repo = ContestRepository(contests_col, TTLCache(maxsize=256, ttl=CONTEST_PAGE_CACHE_TTL))
+uploads_repo = UploadRepository(upload_blobs_col)
+participations_repo = ParticipationRepository(contest_participations_col, participation_months_col, uploads_repo)
+report_snapshots_repo = ReportSnapshotRepository(report_snapshots_col)
+notification_outbox_repo = NotificationOutboxRepository(notification_outbox_col, users_col)
+
+
+def share_caches(generation) -> None:
+    """
+    Делает сброс кэшей видимым всем процессам-обработчикам вебхука (server/worker.py):
+    изменение пользователя или конкурса в одном процессе очищает кэши профилей и страниц
+    конкурсов в остальных, поэтому, например, снятая роль перестаёт действовать сразу,
+    а новый конкурс сразу появляется в списке. Изменения из других процессов (утилиты
+    командной строки, процессы отчётов) видны только после истечения TTL кэша.
+    """
+    users_repo.cache.share(generation)
+    users_repo.letters_cache.share(generation)
+    contests_repo.page_cache.share(generation)
+
+
+_sync_client: Optional[MongoClient] = None
+
+
+def get_sync_database():
+    """
+    Синхронный доступ к базе для кода, который выполняется вне цикла событий
+    (процессы построения отчётов, утилиты командной строки). Клиент создаётся
+    при первом обращении, отдельно в каждом процессе.
+    """
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = MongoClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+            event_listeners=[SlowQueryListener(MONGO_SLOW_QUERY_MS)],
+        )
+    return _sync_client[DATABASE_NAME]
+
+
+async def ping_database() -> None:
+    """Проверяет доступность MongoDB при старте бота"""
+    await client.admin.command("ping")
+
+
+def close_database() -> None:
+    client.close()
@@ -0,0 +1,110 @@
+"""
+Файловые операции без блокировки цикла событий.
+
+Обращения к диску из обработчиков (проверка существования, создание папок,
+переименование, запись, хэширование) выполняются в отдельном пуле из
+FILE_IO_THREADS потоков, а не в пуле по умолчанию, который занят построением
+миниатюр. Число одновременных скачиваний из Telegram ограничено FILE_IO_DOWNLOADS.
+Файл скачивается потоком во временный файл рядом с местом назначения и получает
+итоговое имя только после полной записи, поэтому недокачанный файл никто не прочитает.
+"""
+import asyncio
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, BinaryIO, Callable, Optional, Tuple, TypeVar
+
+from aiogram import Bot
+
+# Число потоков для операций с диском
+FILE_IO_THREADS = int(os.getenv("FILE_IO_THREADS", "4"))
+# Сколько файлов одновременно скачивается из Telegram
+FILE_IO_DOWNLOADS = int(os.getenv("FILE_IO_DOWNLOADS", "8"))
+
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+# Общее время на скачивание одного файла, с
+DOWNLOAD_TIMEOUT = 60
+
+T = TypeVar("T")
+
+_executor = ThreadPoolExecutor(max_workers=FILE_IO_THREADS, thread_name_prefix="file-io")
+# Семафор создаётся при первом скачивании: в Python 3.9 он привязывается к циклу событий в момент создания
+_downloads: Optional[asyncio.Semaphore] = None
+
+
+async def run(func: Callable[..., T], *args) -> T:
+    """Выполняет синхронную файловую операцию в пуле файловых операций"""
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+
+async def exists(path: str) -> bool:
+    return await run(os.path.exists, path)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def remove(path: str) -> None:
+    """Удаляет файл; отсутствие файла ошибкой не считается"""
+    await run(_remove, path)
+
+
+def _open_temp(destination: str) -> Tuple[str, BinaryIO]:
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    temp_path = f"{destination}.{uuid.uuid4().hex}.part"
+    return temp_path, open(temp_path, "wb")
+
+
+def _commit(f: BinaryIO, temp_path: str, destination: str) -> None:
+    f.close()
+    os.replace(temp_path, destination)
+
+
+def _abort(f: BinaryIO, temp_path: str) -> None:
+    f.close()
+    _remove(temp_path)
+
+
+async def _read_local(path: str) -> AsyncIterator[bytes]:
+    with await run(open, path, "rb") as f:
+        while True:
+            chunk = await run(f.read, DOWNLOAD_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _stream(bot: Bot, file_path: str) -> AsyncIterator[bytes]:
+    if bot.session.api.is_local:
+        # Локальный сервер Bot API отдаёт путь к уже сохранённому на диске файлу
+        return _read_local(str(bot.session.api.wrap_local_file.to_local(file_path)))
+    return bot.session.stream_content(
+        url=bot.session.api.file_url(bot.token, file_path),
+        timeout=DOWNLOAD_TIMEOUT,
+        chunk_size=DOWNLOAD_CHUNK_SIZE,
+        raise_for_status=True,
+    )
+
+
+async def download(bot: Bot, file_path: str, destination: str) -> None:
+    """
+    Скачивает файл Telegram (file_path из get_file) в destination.
+    Части файла пишутся в пуле файловых операций по мере получения.
+    """
+    global _downloads
+    if _downloads is None:
+        _downloads = asyncio.Semaphore(FILE_IO_DOWNLOADS)
+
+    async with _downloads:
+        temp_path, f = await run(_open_temp, destination)
+        try:
+            async for chunk in _stream(bot, file_path):
+                await run(f.write, chunk)
+        except BaseException:
+            await run(_abort, f, temp_path)
+            raise
+        await run(_commit, f, temp_path, destination)
@@ -0,0 +1,138 @@
+import asyncio
+import copy
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from services.cache import MISSING, TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Через сколько часов неактивности удаляется незавершённая сессия FSM
+FSM_STATE_TTL_HOURS = int(os.getenv("FSM_STATE_TTL_HOURS", "48"))
+
+
+class MongoStorage(BaseStorage):
+    """
+    Хранилище FSM в MongoDB, общее для всех процессов бота.
+
+    Состояние и данные пользователя лежат в одном документе с полем expires_at,
+    по которому TTL-индекс удаляет брошенные сессии. Записи копятся в памяти и
+    сбрасываются в базу одним update спустя flush_delay секунд, поэтому серия
+    подряд идущих state.update_data превращается в одну операцию. Последнее
+    известное значение кэшируется локально: при шардировании обновлений по
+    chat_id каждый ключ обслуживает только один процесс, и кэш остаётся согласованным.
+    """
+
+    def __init__(
+        self,
+        collection,
+        key_builder: Optional[KeyBuilder] = None,
+        state_ttl: timedelta = timedelta(hours=FSM_STATE_TTL_HOURS),
+        flush_delay: float = 0.05,
+        cache_size: int = 4096,
+        cache_ttl: float = 30.0,
+    ):
+        self._collection = collection
+        self._key_builder = key_builder or DefaultKeyBuilder()
+        self._state_ttl = state_ttl
+        self._flush_delay = flush_delay
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # Несохранённые записи: ключ документа -> {"state": ..., "data": ...}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def resolve_state(value: StateType) -> Optional[str]:
+        if value is None:
+            return None
+        if isinstance(value, State):
+            return value.state
+        return str(value)
+
+    async def _load(self, document_id: str) -> Dict[str, Any]:
+        record = self._pending.get(document_id)
+        if record is not None:
+            return record
+
+        record = self._cache.get(document_id)
+        if record is not MISSING:
+            return record
+
+        document = await self._collection.find_one({"_id": document_id}, {"state": 1, "data": 1})
+        record = {
+            "state": document.get("state") if document else None,
+            "data": (document.get("data") or {}) if document else {},
+        }
+        self._cache.set(document_id, record)
+        return record
+
+    async def _write(self, document_id: str, **fields: Any) -> None:
+        record = dict(await self._load(document_id))
+        record.update(fields)
+        self._pending[document_id] = record
+        self._cache.set(document_id, record)
+        if document_id not in self._flush_tasks:
+            self._flush_tasks[document_id] = asyncio.create_task(self._flush_later(document_id))
+
+    async def _flush_later(self, document_id: str) -> None:
+        try:
+            # Пока копятся новые записи, повторяем сброс; одновременно для ключа работает одна задача
+            while document_id in self._pending:
+                await asyncio.sleep(self._flush_delay)
+                await self._flush(document_id)
+        finally:
+            self._flush_tasks.pop(document_id, None)
+
+    async def _flush(self, document_id: str) -> None:
+        record = self._pending.pop(document_id, None)
+        if record is None:
+            return
+
+        try:
+            if record["state"] is None and not record["data"]:
+                await self._collection.delete_one({"_id": document_id})
+            else:
+                await self._collection.update_one(
+                    {"_id": document_id},
+                    {"$set": {
+                        "state": record["state"],
+                        "data": record["data"],
+                        "expires_at": datetime.utcnow() + self._state_ttl,
+                    }},
+                    upsert=True,
+                )
+        except Exception as e:
+            logger.error(f"Не удалось сохранить состояние FSM {document_id}: {e}")
+            # Возвращаем запись в очередь, если за это время не появилось более новой
+            self._pending.setdefault(document_id, record)
+            await asyncio.sleep(1)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._write(self._key_builder.build(key), state=self.resolve_state(state))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._load(self._key_builder.build(key))
+        return record["state"]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._write(self._key_builder.build(key), data=copy.deepcopy(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._load(self._key_builder.build(key))
+        # Обработчики изменяют вложенные списки на месте, поэтому отдаём копию
+        return copy.deepcopy(record["data"])
+
+    async def flush(self) -> None:
+        """Немедленно сохраняет все накопленные записи"""
+        for document_id in list(self._pending):
+            await self._flush(document_id)
+
+    async def close(self) -> None:
+        await self.flush()
+        # Дожидаемся отложенных задач, чтобы ни одна запись не оборвалась на середине
+        await asyncio.gather(*self._flush_tasks.values(), return_exceptions=True)
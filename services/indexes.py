@@ -0,0 +1,246 @@
+"""
+Создание индексов и применение миграций схемы базы contests_bot.
+
+Запуск из командной строки:
+    python -m services.indexes apply    — создать индексы и применить миграции
+    python -m services.indexes explain  — показать планы выполнения горячих запросов
+    python -m services.indexes months   — пересчитать сводку участий по месяцам
+"""
+import asyncio
+import logging
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, UpdateOne
+from pymongo.errors import OperationFailure
+
+from services import file_io
+from services.database import confirmation_file_names, db, name_key, participations_repo, uploads_repo
+from services.upload_store import rebuild_refs, remove_legacy_file, store_legacy_file
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+
+# Индексы, необходимые для горячих запросов бота
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("telegram_id", ASCENDING)], name="telegram_id_unique", unique=True),
+        IndexModel([("role", ASCENDING)], name="role"),
+        IndexModel([("full_name", ASCENDING)], name="full_name"),
+        IndexModel([("full_name_key", ASCENDING), ("telegram_id", ASCENDING)], name="full_name_key_telegram_id"),
+        IndexModel([("commands_hash", ASCENDING)], name="commands_hash", sparse=True),
+    ],
+    "contests": [
+        IndexModel([("responsible_id", ASCENDING), ("start_date", ASCENDING)], name="responsible_id_start_date"),
+        IndexModel([("end_date", ASCENDING)], name="end_date"),
+        IndexModel([("end_date", ASCENDING), ("_id", ASCENDING)], name="end_date_id"),
+        IndexModel([("start_date", ASCENDING)], name="start_date"),
+    ],
+    "contest_participations": [
+        IndexModel([("created_at", ASCENDING)], name="created_at"),
+    ],
+    "notification_outbox": [
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt_at"),
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease_until"),
+        IndexModel([("chat_id", ASCENDING), ("status", ASCENDING)], name="chat_id_status"),
+        IndexModel([("batch", ASCENDING)], name="batch", sparse=True),
+        # Отправленные уведомления хранятся двое суток, чтобы повторная постановка не дублировала их
+        IndexModel([("sent_at", ASCENDING)], name="sent_at_ttl", expireAfterSeconds=2 * 24 * 3600),
+    ],
+    "upload_blobs": [
+        IndexModel([("refs", ASCENDING), ("last_seen_at", ASCENDING)], name="refs_last_seen_at"),
+    ],
+    "fsm_states": [
+        # TTL-индекс: MongoDB удаляет брошенные сессии FSM после expires_at
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+# Горячие запросы для проверки планов выполнения: (описание, коллекция, фильтр, сортировка)
+HOT_QUERIES = [
+    ("Пользователь по telegram_id", "users", {"telegram_id": 0}, None),
+    ("Пользователи по роли", "users", {"role": "watcher"}, None),
+    ("Пользователи по первой букве ФИО", "users", {"full_name_key": {"$gte": "а", "$lt": "б"}},
+     [("full_name_key", ASCENDING), ("telegram_id", ASCENDING)]),
+    ("Конкурсы ответственного", "contests", {"responsible_id": 0}, [("start_date", ASCENDING)]),
+    ("Устаревшие конкурсы", "contests", {"end_date": {"$lt": datetime(2000, 1, 1)}}, None),
+    ("Страница списка конкурсов", "contests",
+     {"end_date": {"$type": "date"}, "$or": [{"end_date": {"$gt": datetime(2000, 1, 1)}},
+                                            {"end_date": datetime(2000, 1, 1), "_id": {"$gt": ObjectId("000000000000000000000000")}}]},
+     [("end_date", ASCENDING), ("_id", ASCENDING)]),
+    ("Конкурсы для напоминаний", "contests",
+     {"end_date": {"$gt": datetime(2000, 1, 1), "$lte": datetime(2000, 1, 4)}, "reminders": {"$ne": "ends_in_3_days"}}, None),
+    ("Участия за месяц", "contest_participations",
+     {"created_at": {"$gte": datetime(2000, 1, 1), "$lt": datetime(2000, 2, 1)}}, None),
+    ("Загруженные файлы без ссылок", "upload_blobs",
+     {"refs": {"$lte": 0}, "last_seen_at": {"$lt": datetime(2000, 1, 1)}}, None),
+]
+
+
+async def ensure_indexes() -> None:
+    """Идемпотентно создаёт все объявленные индексы"""
+    for collection_name, indexes in INDEXES.items():
+        try:
+            created = await db[collection_name].create_indexes(indexes)
+            logger.info(f"Индексы коллекции {collection_name}: {', '.join(created)}")
+        except OperationFailure as e:
+            # Например, дубликаты telegram_id не дают построить уникальный индекс
+            logger.error(f"Не удалось создать индексы коллекции {collection_name}: {e}")
+
+
+async def migrate_created_at_to_date() -> None:
+    """Переводит строковые created_at в даты, чтобы диапазонные запросы использовали индекс"""
+    participations = db["contest_participations"]
+    async for doc in participations.find({"created_at": {"$type": "string"}}, {"created_at": 1}):
+        try:
+            created_at = datetime.fromisoformat(doc["created_at"].replace("Z", "+00:00"))
+        except ValueError:
+            logger.warning(f"Некорректная дата created_at у записи {doc['_id']}: {doc['created_at']}")
+            continue
+        await participations.update_one({"_id": doc["_id"]}, {"$set": {"created_at": created_at}})
+
+
+async def drop_contest_drafts() -> None:
+    """
+    Черновики конкурсов теперь хранятся в FSM: удаляем незавершённые документы,
+    служебное поле edit_step и индексы, которые были нужны только для поиска черновиков
+    """
+    contests = db["contests"]
+    result = await contests.delete_many({"step": {"$ne": None}})
+    logger.info(f"Удалено незавершённых черновиков конкурсов: {result.deleted_count}")
+    await contests.update_many({}, {"$unset": {"step": "", "edit_step": ""}})
+
+    existing = await contests.index_information()
+    for index_name in ("telegram_id_step", "edit_step_telegram_id"):
+        if index_name in existing:
+            await contests.drop_index(index_name)
+
+
+async def build_month_index() -> None:
+    """Строит сводку участий по месяцам для уже существующих записей"""
+    await participations_repo.rebuild_month_index()
+
+
+async def fill_full_name_key() -> None:
+    """Заполняет нормализованный ключ ФИО у существующих пользователей"""
+    users = db["users"]
+    batch = []
+    async for user in users.find({"full_name": {"$type": "string"}}, {"full_name": 1, "full_name_key": 1}):
+        key = name_key(user["full_name"])
+        if user.get("full_name_key") != key:
+            batch.append(UpdateOne({"_id": user["_id"]}, {"$set": {"full_name_key": key}}))
+        if len(batch) >= 500:
+            await users.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        await users.bulk_write(batch, ordered=False)
+
+
+async def move_uploads_to_store() -> None:
+    """
+    Переносит фото подтверждения из корня uploads в хранилище с адресацией по содержимому,
+    переписывает confirmation_files и пересчитывает ссылки. Оригиналы удаляются только после
+    того, как переписаны все записи, поэтому прерванную миграцию можно просто запустить снова.
+    """
+    participations = db["contest_participations"]
+    stored: Dict[str, Optional[str]] = {}
+
+    async for doc in participations.find({"confirmation_files.0": {"$exists": True}}, {"confirmation_files": 1}):
+        files = []
+        for file_info in doc["confirmation_files"]:
+            names = confirmation_file_names([file_info])
+            if names and not uploads_repo.is_stored(names[0]):
+                if names[0] not in stored:
+                    stored[names[0]] = await file_io.run(store_legacy_file, names[0])
+                if stored[names[0]]:
+                    # Прежнее имя файла остаётся в original_name: его показывает отчёт
+                    original = file_info if isinstance(file_info, dict) else {"original_name": file_info, "file_id": file_info}
+                    file_info = {**original, "saved_name": stored[names[0]]}
+            files.append(file_info)
+        if files != doc["confirmation_files"]:
+            await participations.update_one({"_id": doc["_id"]}, {"$set": {"confirmation_files": files}})
+
+    for name, stored_name in stored.items():
+        if stored_name:
+            await file_io.run(remove_legacy_file, name)
+    logger.info(f"Перенесено в хранилище загрузок файлов: {sum(1 for name in stored.values() if name)}")
+    await rebuild_refs()
+
+
+# Миграции применяются по порядку и один раз; идентификаторы нельзя менять
+MIGRATIONS = [
+    ("0001_created_at_to_date", migrate_created_at_to_date),
+    ("0002_drop_contest_drafts", drop_contest_drafts),
+    ("0003_build_month_index", build_month_index),
+    ("0004_full_name_key", fill_full_name_key),
+    ("0005_content_addressed_uploads", move_uploads_to_store),
+]
+
+
+async def apply_migrations() -> None:
+    """Применяет ещё не выполненные миграции и записывает их в schema_migrations"""
+    applied_col = db[MIGRATIONS_COLLECTION]
+    applied = set(await applied_col.distinct("_id"))
+
+    for migration_id, migration in MIGRATIONS:
+        if migration_id in applied:
+            continue
+        logger.info(f"Применяем миграцию {migration_id}")
+        await migration()
+        await applied_col.insert_one({"_id": migration_id, "applied_at": datetime.now()})
+        logger.info(f"Миграция {migration_id} применена")
+
+
+async def bootstrap_database() -> None:
+    """Подготавливает базу при старте бота: индексы и миграции"""
+    await ensure_indexes()
+    await apply_migrations()
+
+
+def _plan_stages(plan: Dict) -> List[str]:
+    """Собирает названия стадий плана выполнения сверху вниз"""
+    stages = [plan.get("stage", "?")]
+    if plan.get("indexName"):
+        stages[-1] += f"({plan['indexName']})"
+    if "inputStage" in plan:
+        stages += _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+async def explain_hot_queries() -> bool:
+    """Печатает планы горячих запросов; возвращает False, если какой-то запрос сканирует коллекцию"""
+    all_indexed = True
+    for title, collection_name, query, sort in HOT_QUERIES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        stages = _plan_stages(explanation["queryPlanner"]["winningPlan"])
+        collscan = any(stage.startswith("COLLSCAN") for stage in stages)
+        all_indexed = all_indexed and not collscan
+        marker = "COLLSCAN!" if collscan else "OK"
+        print(f"[{marker}] {title} ({collection_name}): {' <- '.join(stages)}")
+    return all_indexed
+
+
+async def _run_cli(command: str) -> int:
+    if command == "apply":
+        await bootstrap_database()
+        return 0
+    if command == "explain":
+        return 0 if await explain_hot_queries() else 1
+    if command == "months":
+        await participations_repo.rebuild_month_index()
+        return 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_run_cli(sys.argv[1] if len(sys.argv) > 1 else "")))
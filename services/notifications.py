@@ -0,0 +1,211 @@
+"""
+Очередь уведомлений пользователям.
+
+Обработчики только записывают уведомление в коллекцию notification_outbox и сразу
+возвращаются. Рассылкой занимаются несколько фоновых обработчиков в основном
+процессе бота: они соблюдают общий лимит Bot API и интервал между сообщениями
+в один чат, при ответе 429 ждут retry_after, а при сетевых ошибках повторяют
+отправку с нарастающей задержкой. Уведомления одному получателю, накопившиеся
+за NOTIFY_COALESCE_SECONDS, отправляются одним сообщением. Если склеенный текст
+занял несколько сообщений и отправка оборвалась, уже отправленные сообщения не
+повторяются: доставленные уведомления отмечаются отправленными, а у частично
+доставленных запоминается, сколько символов уже отправлено.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from services.database import notification_outbox_repo
+from services.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Число фоновых обработчиков рассылки
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "4"))
+# Сколько сообщений в секунду бот отправляет всем получателям вместе
+NOTIFY_RATE = float(os.getenv("NOTIFY_RATE", "25"))
+# Минимальный интервал между сообщениями в один чат, с
+NOTIFY_CHAT_INTERVAL = float(os.getenv("NOTIFY_CHAT_INTERVAL", "1"))
+# Сколько секунд копить уведомления одному получателю, прежде чем отправить их одним сообщением
+NOTIFY_COALESCE_SECONDS = float(os.getenv("NOTIFY_COALESCE_SECONDS", "3"))
+# Число попыток отправки до перевода уведомления в failed
+NOTIFY_MAX_ATTEMPTS = 5
+# Как часто свободный обработчик проверяет очередь, с
+NOTIFY_POLL_INTERVAL = 1
+# На сколько секунд обработчик забирает уведомления; после этого их подхватит другой
+NOTIFY_LEASE = 120
+
+# Максимальная длина текста сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+
+class ComposedMessage(NamedTuple):
+    text: str
+    # Сколько символов каждого уведомления (по _id) будет отправлено вместе с этим сообщением
+    progress: Dict[Any, int]
+
+
+def compose_messages(notifications: List[Dict]) -> List[ComposedMessage]:
+    """
+    Склеивает тексты уведомлений в сообщения не длиннее MESSAGE_LIMIT, убирая повторы.
+    Уже отправленное начало текста (поле offset) пропускается.
+    """
+    texts: Dict[str, List[Dict]] = {}
+    for notification in notifications:
+        texts.setdefault(notification["text"], []).append(notification)
+
+    messages = []
+    current = ""
+    progress: Dict[Any, int] = {}
+    for text, same in texts.items():
+        offset = min(notification.get("offset", 0) for notification in same)
+        for start in range(offset, len(text), MESSAGE_LIMIT):
+            end = min(start + MESSAGE_LIMIT, len(text))
+            part = text[start:end]
+            if current and len(current) + 2 + len(part) <= MESSAGE_LIMIT:
+                current += "\n\n" + part
+            else:
+                if current:
+                    messages.append(ComposedMessage(current, progress))
+                current, progress = part, {}
+            progress.update({notification["_id"]: end for notification in same})
+    if current:
+        messages.append(ComposedMessage(current, progress))
+    return messages
+
+
+class ChatRateLimiter:
+    """Выдерживает интервал между сообщениями в один чат"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_send: Dict[int, float] = {}
+
+    async def wait(self, chat_id: int) -> None:
+        now = time.monotonic()
+        send_at = max(now, self._next_send.get(chat_id, 0))
+        self._next_send[chat_id] = send_at + self.interval
+        if len(self._next_send) > 10000:
+            # Забываем чаты, в которые давно ничего не отправлялось
+            self._next_send = {chat: moment for chat, moment in self._next_send.items() if moment > now}
+        if send_at > now:
+            await asyncio.sleep(send_at - now)
+
+
+class NotificationService:
+    def __init__(self, workers: int, rate: float, chat_interval: float):
+        self._workers = workers
+        self._bucket = TokenBucket(rate, capacity=rate)
+        self._chats = ChatRateLimiter(chat_interval)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def notify(self, chat_id: int, text: str) -> None:
+        """Ставит уведомление в очередь; оно может быть объединено с соседними уведомлениями получателю"""
+        await notification_outbox_repo.enqueue(chat_id, text, delay=NOTIFY_COALESCE_SECONDS)
+
+    async def notify_subscribers(self, text: str) -> None:
+        """Ставит уведомление всем пользователям, у которых включены уведомления"""
+        # Без поля notifications_enabled уведомления считаются включёнными (как в настройках)
+        await notification_outbox_repo.enqueue_for_users({"notifications_enabled": {"$ne": False}}, text)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self, bot: Bot) -> None:
+        """Запускает обработчики рассылки (только в одном процессе, чтобы лимиты были общими)"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(bot)) for _ in range(self._workers)]
+        logger.info(f"Запущено обработчиков рассылки уведомлений: {self._workers}")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, bot: Bot) -> None:
+        while True:
+            batch_id = uuid.uuid4().hex
+            try:
+                notifications = await notification_outbox_repo.claim(batch_id, NOTIFY_LEASE, NOTIFY_COALESCE_SECONDS)
+            except Exception as e:
+                logger.error(f"Не удалось прочитать очередь уведомлений: {e}")
+                notifications = []
+
+            if not notifications:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), NOTIFY_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            try:
+                await self._deliver(bot, batch_id, notifications)
+            except Exception as e:
+                # Например, недоступна база: уведомления вернутся в очередь по истечении аренды
+                logger.error(f"Ошибка при отправке уведомлений: {e}")
+
+    @staticmethod
+    async def _save_progress(batch_id: str, notifications: List[Dict], delivered: Dict[Any, int]) -> None:
+        """Запоминает, что успело уйти до ошибки, чтобы при повторе не отправлять это снова"""
+        if not delivered:
+            return
+        sent_ids = []
+        offsets = {}
+        for notification in notifications:
+            offset = delivered.get(notification["_id"], notification.get("offset", 0))
+            if offset >= len(notification["text"]):
+                sent_ids.append(notification["_id"])
+            elif notification["_id"] in delivered:
+                offsets[notification["_id"]] = offset
+        await notification_outbox_repo.save_progress(batch_id, sent_ids, offsets)
+
+    async def _deliver(self, bot: Bot, batch_id: str, notifications: List[Dict]) -> None:
+        chat_id = notifications[0]["chat_id"]
+        delivered: Dict[Any, int] = {}
+        try:
+            for message in compose_messages(notifications):
+                await self._chats.wait(chat_id)
+                await self._bucket.acquire()
+                await bot.send_message(chat_id, message.text)
+                delivered.update(message.progress)
+        except TelegramRetryAfter as e:
+            # Лимит Telegram: останавливаем всю рассылку, попытка не засчитывается
+            logger.warning(f"Bot API просит подождать {e.retry_after} с перед рассылкой")
+            await self._save_progress(batch_id, notifications, delivered)
+            self._bucket.pause(e.retry_after)
+            await notification_outbox_repo.release(
+                batch_id, datetime.now() + timedelta(seconds=e.retry_after), count_attempt=False
+            )
+            return
+        except (TelegramBadRequest, TelegramForbiddenError) as e:
+            # Бот заблокирован или чат не существует: повтор не поможет
+            logger.error(f"Не удалось уведомить пользователя {chat_id}: {e}")
+            await self._save_progress(batch_id, notifications, delivered)
+            await notification_outbox_repo.fail(batch_id, str(e))
+            return
+        except Exception as e:
+            await self._save_progress(batch_id, notifications, delivered)
+            attempts = max(notification.get("attempts", 0) for notification in notifications) + 1
+            if attempts >= NOTIFY_MAX_ATTEMPTS:
+                logger.error(f"Уведомление пользователю {chat_id} не доставлено после {attempts} попыток: {e}")
+                await notification_outbox_repo.fail(batch_id, str(e))
+            else:
+                logger.warning(f"Ошибка при отправке уведомления пользователю {chat_id}, повторим позже: {e}")
+                await notification_outbox_repo.release(batch_id, datetime.now() + timedelta(seconds=5 * 2 ** attempts))
+            return
+
+        await notification_outbox_repo.complete(batch_id)
+
+
+notification_service = NotificationService(NOTIFY_WORKERS, NOTIFY_RATE, NOTIFY_CHAT_INTERVAL)
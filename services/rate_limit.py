@@ -0,0 +1,52 @@
+"""
+Ограничение частоты обращений к Bot API.
+
+Telegram допускает порядка 30 запросов в секунду на бота; при превышении он
+отвечает 429 с полем retry_after. TokenBucket распределяет запросы во времени,
+а при получении 429 приостанавливает всех, кто ждёт токен этого ведра.
+"""
+import asyncio
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Асинхронное ведро токенов: не больше rate запросов в секунду с запасом capacity"""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # Замок создаётся при первом использовании: в Python 3.9 он привязывается
+        # к циклу событий в момент создания, а ведро создаётся при импорте модуля
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Ждёт, пока в ведре появится токен, и забирает его"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Ожидающие обслуживаются по очереди, поэтому порядок запросов сохраняется
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Запрещает запросы на seconds секунд (ответ 429 с retry_after)"""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0
+        self._updated = now
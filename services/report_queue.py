@@ -0,0 +1,293 @@
+"""
+Очередь построения отчётов по конкурсам.
+
+Отчёт (чтение фотографий, сборка xlsx и zip-архива с html) строится в пуле
+процессов, чтобы не блокировать цикл событий бота. Одинаковые запросы за один
+и тот же месяц и версию данных объединяются в одно задание, число заданий ограничено глобально
+и для каждого пользователя. Процент готовности процессы пишут в общий словарь,
+откуда его читают обработчики для обновления сообщения о статусе.
+
+Файл больше REPORT_PART_SIZE нельзя отправить через Bot API, поэтому такой отчёт
+делится на части: Excel — по неделям (а неделя — по дням), zip-архив HTML-отчёта —
+на тома, которые распаковываются в одну папку. Ключ части в словаре файлов —
+вид отчёта и через дефис номер тома или дни месяца: "html_archive-2", "excel-08-14".
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Число процессов, в которых строятся отчёты
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+# Сколько разных отчётов может одновременно строиться или ждать в очереди
+REPORT_QUEUE_LIMIT = int(os.getenv("REPORT_QUEUE_LIMIT", "10"))
+# Сколько отчётов одновременно может ждать один пользователь
+REPORT_USER_LIMIT = int(os.getenv("REPORT_USER_LIMIT", "1"))
+# Как часто (в секундах) обновляется сообщение о ходе построения
+REPORT_PROGRESS_INTERVAL = float(os.getenv("REPORT_PROGRESS_INTERVAL", "2"))
+# Наибольший размер одного файла отчёта, МБ (Bot API принимает файлы до 50 МБ)
+REPORT_PART_SIZE = int(float(os.getenv("REPORT_PART_SIZE_MB", "45")) * 1024 * 1024)
+# Запас на заголовки записей zip-тома, байт
+ZIP_ENTRY_OVERHEAD = 1024
+
+REPORTS_FOLDER = os.path.join("uploads", "reports")
+
+# (год, месяц, версия данных месяца)
+ReportKey = Tuple[int, int, int]
+
+
+class ReportQueueBusy(Exception):
+    """Задание нельзя поставить в очередь; текст исключения показывается пользователю"""
+
+
+def build_report(year: int, month: int, version: int, progress=None) -> Optional[Dict[str, str]]:
+    """
+    Строит отчёты за месяц и сохраняет их в REPORTS_FOLDER. Версия данных входит
+    в имя файла, поэтому файлы снимков никогда не перезаписываются.
+    Выполняется в процессе пула.
+
+    Returns:
+        Пути к файлам {"excel": ..., "html_archive": ...} (или к их частям, см. описание модуля)
+        или None, если за месяц нет данных
+    """
+    from services.database import get_sync_database
+    from utils.contest_utils import create_contest_excel_report, create_contest_html_archive
+
+    key = (year, month, version)
+    last_percent = -1
+
+    def report_progress(percent: int) -> None:
+        nonlocal last_percent
+        # Обращение к словарю менеджера — межпроцессный вызов, поэтому пишем только изменения
+        if progress is not None and percent != last_percent:
+            last_percent = percent
+            progress[key] = percent
+
+    participations = get_sync_database()["contest_participations"]
+
+    # Excel-отчёт пишется потоково прямо из курсора: первые 60% работы
+    excel_file = create_contest_excel_report(month, year, participations, lambda p: report_progress(p * 6 // 10))
+    if excel_file is None:
+        return None
+
+    os.makedirs(REPORTS_FOLDER, exist_ok=True)
+    base_name = os.path.join(REPORTS_FOLDER, f"contest_report_{year}_{month:02d}_v{version}")
+    excel_temp = f"{base_name}.{os.getpid()}.xlsx.tmp"
+    archive_temp = f"{base_name}.{os.getpid()}.zip.tmp"
+    # Все файлы, которые создаёт построение: если оно оборвётся, они удаляются, а не копятся в REPORTS_FOLDER
+    created = [excel_temp, archive_temp]
+
+    try:
+        # Файлы пишутся под временными именами и переименовываются, чтобы их не прочитали недописанными
+        with excel_file, open(excel_temp, "wb") as f:
+            shutil.copyfileobj(excel_file, f)
+
+        # HTML-страница с фотографиями пишется потоково прямо в zip-архив: оставшиеся 40%
+        with open(archive_temp, "wb") as f:
+            create_contest_html_archive(month, year, participations, f, lambda p: report_progress(60 + p * 4 // 10))
+
+        files = {}
+        if os.path.getsize(excel_temp) <= REPORT_PART_SIZE:
+            created.append(f"{base_name}.xlsx")
+            os.replace(excel_temp, f"{base_name}.xlsx")
+            files["excel"] = f"{base_name}.xlsx"
+        else:
+            os.remove(excel_temp)
+            files.update(_split_excel_report(year, month, participations, base_name, created))
+
+        if os.path.getsize(archive_temp) <= REPORT_PART_SIZE:
+            created.append(f"{base_name}.zip")
+            os.replace(archive_temp, f"{base_name}.zip")
+            files["html_archive"] = f"{base_name}.zip"
+        else:
+            files.update(_split_archive(archive_temp, base_name, created))
+            os.remove(archive_temp)
+    except BaseException:
+        _remove_files(created)
+        raise
+    report_progress(100)
+
+    return files
+
+
+def _remove_files(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _split_excel_report(year: int, month: int, collection, base_name: str, created: List[str]) -> Dict[str, str]:
+    """
+    Строит Excel-отчёт по неделям месяца; неделя, которая всё ещё не помещается в файл, делится по дням.
+    Пути всех создаваемых файлов добавляются в created.
+    """
+    from utils.contest_utils import create_contest_excel_report
+
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    ranges = [(start + timedelta(days=day), min(start + timedelta(days=day + 7), end)) for day in range(0, (end - start).days, 7)]
+
+    files = {}
+    while ranges:
+        first, last = ranges.pop(0)
+        excel_file = create_contest_excel_report(
+            month, year, collection, query={"created_at": {"$gte": first, "$lt": last}}
+        )
+        if excel_file is None:
+            continue
+        with excel_file:
+            excel_file.seek(0, os.SEEK_END)
+            size = excel_file.tell()
+            excel_file.seek(0)
+            if size > REPORT_PART_SIZE and last - first > timedelta(days=1):
+                ranges[:0] = [(first + timedelta(days=day), first + timedelta(days=day + 1)) for day in range((last - first).days)]
+                continue
+            if size > REPORT_PART_SIZE:
+                logger.warning(f"Excel-отчёт за {first:%d.%m.%Y} больше {REPORT_PART_SIZE} байт даже за один день")
+
+            days = f"{first.day:02d}-{(last - timedelta(days=1)).day:02d}"
+            path = f"{base_name}_{days}.xlsx"
+            created += [f"{path}.{os.getpid()}.tmp", path]
+            with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+                shutil.copyfileobj(excel_file, f)
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+            files[f"excel-{days}"] = path
+    return files
+
+
+def _split_archive(archive_path: str, base_name: str, created: List[str]) -> Dict[str, str]:
+    """
+    Делит zip-архив HTML-отчёта на тома не больше REPORT_PART_SIZE. Каждый том — обычный
+    zip-архив; страница отчёта лежит в первом, а фотографии из всех томов нужно распаковать рядом с ней.
+    Пути всех создаваемых файлов добавляются в created.
+    """
+    from utils.contest_utils import HTML_REPORT_NAME
+
+    files = {}
+    with zipfile.ZipFile(archive_path) as source:
+        volumes: List[List[zipfile.ZipInfo]] = []
+        size = 0
+        for info in sorted(source.infolist(), key=lambda entry: entry.filename != HTML_REPORT_NAME):
+            entry_size = info.compress_size + ZIP_ENTRY_OVERHEAD
+            if volumes and size + entry_size <= REPORT_PART_SIZE:
+                volumes[-1].append(info)
+                size += entry_size
+            else:
+                volumes.append([info])
+                size = entry_size
+
+        for number, entries in enumerate(volumes, 1):
+            path = f"{base_name}.part{number}.zip"
+            created += [f"{path}.{os.getpid()}.tmp", path]
+            with zipfile.ZipFile(f"{path}.{os.getpid()}.tmp", "w") as volume:
+                for info in entries:
+                    target = zipfile.ZipInfo(info.filename, info.date_time)
+                    target.compress_type = info.compress_type
+                    with source.open(info) as src, volume.open(target, "w") as dst:
+                        shutil.copyfileobj(src, dst)
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+            files[f"html_archive-{number}"] = path
+    return files
+
+
+class ReportJob:
+    """Задание на построение отчёта за месяц, общее для всех, кто его запросил"""
+
+    def __init__(self, key: ReportKey, future: asyncio.Future, progress):
+        self.key = key
+        self.future = future
+        self.users: Set[int] = set()
+        self._progress = progress
+
+    @property
+    def percent(self) -> Optional[int]:
+        """Процент готовности или None, если задание ещё ждёт свободный процесс"""
+        return self._progress.get(self.key)
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    async def wait(self, timeout: float) -> bool:
+        """Ждёт завершения не дольше timeout секунд; возвращает True, если задание завершено"""
+        await asyncio.wait({self.future}, timeout=timeout)
+        return self.future.done()
+
+
+class ReportQueue:
+    def __init__(self, workers: int, queue_limit: int, user_limit: int):
+        self._workers = workers
+        self._queue_limit = queue_limit
+        self._user_limit = user_limit
+        self._context = multiprocessing.get_context("spawn")
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._progress = None
+        self._jobs: Dict[ReportKey, ReportJob] = {}
+
+    def _ensure_started(self) -> None:
+        # Пул и менеджер запускаются при первом отчёте, а не при импорте модуля
+        if self._manager is None:
+            self._manager = self._context.Manager()
+            self._progress = self._manager.dict()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self._workers, mp_context=self._context)
+
+    def submit(self, user_id: int, year: int, month: int, version: int) -> ReportJob:
+        """
+        Ставит отчёт в очередь или присоединяет пользователя к уже запущенному заданию.
+
+        Raises:
+            ReportQueueBusy: Превышен лимит пользователя или общей очереди
+        """
+        key = (year, month, version)
+        job = self._jobs.get(key)
+        if job is not None and user_id in job.users:
+            return job
+
+        if sum(user_id in active.users for active in self._jobs.values()) >= self._user_limit:
+            raise ReportQueueBusy("Дождитесь готовности уже запрошенного отчёта.")
+
+        if job is None:
+            if len(self._jobs) >= self._queue_limit:
+                raise ReportQueueBusy("Сейчас строится слишком много отчётов. Попробуйте через несколько минут.")
+
+            self._ensure_started()
+            future = asyncio.wrap_future(self._executor.submit(build_report, year, month, version, self._progress))
+            job = ReportJob(key, future, self._progress)
+            self._jobs[key] = job
+            future.add_done_callback(lambda _: self._finish(job))
+            logger.info(f"Отчёт за {month:02d}.{year} поставлен в очередь")
+
+        job.users.add(user_id)
+        return job
+
+    def _finish(self, job: ReportJob) -> None:
+        self._jobs.pop(job.key, None)
+        if self._progress is not None:
+            self._progress.pop(job.key, None)
+        if not job.future.cancelled() and isinstance(job.future.exception(), BrokenProcessPool):
+            # Процесс пула аварийно завершился: следующий отчёт запустит новый пул
+            logger.error("Пул построения отчётов сломан, он будет пересоздан")
+            self._executor = None
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+            self._progress = None
+
+
+report_queue = ReportQueue(REPORT_WORKERS, REPORT_QUEUE_LIMIT, REPORT_USER_LIMIT)
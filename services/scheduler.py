@@ -1,7 +1,8 @@
 import logging
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from datetime import datetime, timedelta
-from services.database import contests_col
+from services.database import contests_repo, notification_outbox_repo, scheduler_state_col, users_col
+from services.upload_store import collect_garbage
 
 # Настройка логгера
 logger = logging.getLogger(__name__)
@@ -9,28 +10,154 @@ logger = logging.getLogger(__name__)
 # Инициализация планировщика
 scheduler = AsyncIOScheduler()
 
+# Кампании напоминаний о сроке окончания конкурса: (идентификатор, за сколько дней, текст)
+REMINDER_CAMPAIGNS = [
+    ("ends_in_3_days", 3, "Напоминание: через 3 дня завершается конкурс"),
+    ("ends_tomorrow", 1, "Напоминание: завтра завершается конкурс"),
+]
+
+# Как часто проверяются кампании напоминаний
+REMINDER_INTERVAL = timedelta(hours=1)
+OLD_CONTESTS_INTERVAL = timedelta(hours=24)
+UPLOAD_GC_INTERVAL = timedelta(hours=24)
+
+
 # Функция для удаления старых конкурсов
 async def remove_old_contests():
     try:
         three_weeks_ago = datetime.now() - timedelta(weeks=3)
         # Находим конкурсы, которые нужно удалить
-        contests_to_delete = list(contests_col.find({"end_date": {"$lt": three_weeks_ago}}))
+        contests_to_delete = await contests_repo.find({"end_date": {"$lt": three_weeks_ago}})
 
         if contests_to_delete:
             for contest in contests_to_delete:
                 logger.info(
                     f"Удален конкурс: '{contest['name']}' (Дата окончания: {contest['end_date'].strftime('%d.%m.%Y')})")
 
-        result = contests_col.delete_many({"end_date": {"$lt": three_weeks_ago}})
+        result = await contests_repo.delete_many({"end_date": {"$lt": three_weeks_ago}})
         logger.info(f"Удалено {result.deleted_count} старых конкурсов.")
     except Exception as e:
         logger.error(f"Ошибка при удалении старых конкурсов: {e}")
 
+
+async def run_reminder_campaign(campaign_id: str, days: int, text: str, now: datetime, min_days: int = 0) -> int:
+    """
+    Ставит в очередь напоминания участникам конкурсов, которые заканчиваются позже чем через
+    min_days, но не позже чем через days дней. Конкурсы ближе min_days достаются более короткой
+    кампании, иначе участник получил бы сразу «через 3 дня» и «завтра».
+
+    Конкурсы выбираются по индексу end_date, а получатели и тексты собираются
+    на стороне MongoDB и сразу записываются в notification_outbox, поэтому
+    число участников не влияет на цикл событий бота. Идентификатор напоминания
+    детерминирован, так что повторный запуск после сбоя не дублирует отправку,
+    а отметка в поле reminders конкурса не даёт запустить кампанию повторно.
+
+    Returns:
+        Число конкурсов, по которым поставлены напоминания
+    """
+    due = {
+        "end_date": {"$gt": now + timedelta(days=min_days), "$lte": now + timedelta(days=days)},
+        "reminders": {"$ne": campaign_id},
+    }
+    contest_ids = [contest["_id"] for contest in await contests_repo.find(due, {"_id": 1})]
+    if not contest_ids:
+        return 0
+
+    await contests_repo.collection.aggregate([
+        {"$match": {"_id": {"$in": contest_ids}}},
+        {"$unwind": "$participants"},
+        {"$lookup": {
+            "from": users_col.name,
+            "localField": "participants",
+            "foreignField": "telegram_id",
+            "as": "user",
+        }},
+        # Без поля notifications_enabled уведомления считаются включёнными (как в настройках)
+        {"$match": {"user.0": {"$exists": True}, "user.notifications_enabled": {"$ne": False}}},
+        {"$project": {
+            "_id": {"$concat": [
+                campaign_id, ":", {"$toString": "$_id"}, ":",
+                {"$dateToString": {"format": "%Y%m%d", "date": "$end_date"}}, ":",
+                {"$toString": "$participants"},
+            ]},
+            "chat_id": "$participants",
+            "text": {"$concat": [
+                text, " «", "$name", "» (дата окончания: ",
+                {"$dateToString": {"format": "%d.%m.%Y", "date": "$end_date"}}, ").",
+            ]},
+            "status": "pending",
+            "attempts": {"$literal": 0},
+            "created_at": "$$NOW",
+            "next_attempt_at": "$$NOW",
+        }},
+        # Уже поставленные (в том числе отправленные) напоминания не перезаписываются
+        {"$merge": {"into": notification_outbox_repo.collection.name, "whenMatched": "keepExisting"}},
+    ]).to_list(length=None)
+
+    await contests_repo.collection.update_many(
+        {"_id": {"$in": contest_ids}}, {"$addToSet": {"reminders": campaign_id}}
+    )
+    return len(contest_ids)
+
+
+# Функция для рассылки напоминаний о сроках конкурсов
+async def send_deadline_reminders():
+    now = datetime.now()
+    for campaign_id, days, text in REMINDER_CAMPAIGNS:
+        # Нижняя граница окна — срок ближайшей более короткой кампании
+        min_days = max((other for _, other, _ in REMINDER_CAMPAIGNS if other < days), default=0)
+        try:
+            contests = await run_reminder_campaign(campaign_id, days, text, now, min_days)
+            if contests:
+                logger.info(f"Кампания {campaign_id}: напоминания поставлены по {contests} конкурсам")
+        except Exception as e:
+            logger.error(f"Ошибка в кампании напоминаний {campaign_id}: {e}")
+
+
+# Функция для удаления загруженных фото, на которые не ссылается ни одна заявка
+async def remove_orphan_uploads():
+    try:
+        await collect_garbage()
+    except Exception as e:
+        logger.error(f"Ошибка при очистке хранилища загрузок: {e}")
+
+
+def _persistent(job_id: str, func):
+    """Оборачивает задачу так, чтобы время её последнего запуска сохранялось в базе"""
+    async def run():
+        await func()
+        await scheduler_state_col.update_one(
+            {"_id": job_id}, {"$set": {"last_run_at": datetime.now()}}, upsert=True
+        )
+    return run
+
+
+async def _next_run_time(job_id: str, interval: timedelta) -> datetime:
+    """Время следующего запуска с учётом последнего запуска до перезапуска бота"""
+    state = await scheduler_state_col.find_one({"_id": job_id})
+    now = datetime.now()
+    if not state or not state.get("last_run_at"):
+        return now
+    return max(now, state["last_run_at"] + interval)
+
+
 # Запуск планировщика
-def start_scheduler(bot):
+async def start_scheduler(bot):
     try:
-        # Добавляем задачу на выполнение каждые 24 часа
-        scheduler.add_job(remove_old_contests, 'interval', hours=24)
+        # Интервал отсчитывается от последнего запуска, сохранённого в базе, а не от старта бота:
+        # частые перезапуски не откладывают задачи, а пропущенный запуск выполняется сразу
+        jobs = [
+            ("remove_old_contests", remove_old_contests, OLD_CONTESTS_INTERVAL),
+            ("deadline_reminders", send_deadline_reminders, REMINDER_INTERVAL),
+            ("upload_gc", remove_orphan_uploads, UPLOAD_GC_INTERVAL),
+        ]
+        for job_id, func, interval in jobs:
+            scheduler.add_job(
+                _persistent(job_id, func), 'interval',
+                id=job_id, seconds=interval.total_seconds(),
+                next_run_time=await _next_run_time(job_id, interval),
+                coalesce=True, max_instances=1,
+            )
         scheduler.start()
         logger.info("Планировщик успешно запущен.")
     except Exception as e:
@@ -40,4 +167,4 @@ def start_scheduler(bot):
 
 # Остановка планировщика при завершении работы бота
 import atexit
-atexit.register(lambda: scheduler.shutdown())
\ No newline at end of file
+atexit.register(lambda: scheduler.shutdown())
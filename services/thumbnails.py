@@ -0,0 +1,98 @@
+"""
+Производные изображения для отчётов: миниатюры для Excel- и HTML-отчётов.
+
+Они создаются в фоне сразу после загрузки фото и лежат рядом с оригиналом:
+    uploads/ab/cd/<хэш>.thumb.jpg — миниатюра для ячейки Excel-отчёта и таблицы HTML-отчёта
+
+Запуск из командной строки:
+    python -m services.thumbnails backfill — создать недостающие производные для уже загруженных фото
+"""
+import asyncio
+import logging
+import os
+import sys
+import uuid
+from typing import Optional
+
+from utils.file_utils import UPLOAD_FOLDER, compress_and_save_image
+
+logger = logging.getLogger(__name__)
+
+# Размер (ширина, высота), в который вписывается миниатюра
+THUMBNAIL_SIZE = (150, 120)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+# .preview.jpg — превью, которые создавались для прежнего HTML-отчёта со встроенными фото
+DERIVATIVE_SUFFIXES = (".thumb.jpg", ".preview.jpg", ".tmp.jpg")
+
+# Ссылки на фоновые задачи, чтобы их не удалил сборщик мусора
+_background_tasks = set()
+
+
+def thumbnail_path(original_path: str) -> str:
+    return f"{os.path.splitext(original_path)[0]}.thumb.jpg"
+
+
+def is_derivative(path: str) -> bool:
+    return path.endswith(DERIVATIVE_SUFFIXES)
+
+
+def create_derivatives(original_path: str) -> bool:
+    """Создаёт отсутствующую миниатюру; возвращает True, если она есть"""
+    target_path = thumbnail_path(original_path)
+    if os.path.exists(target_path):
+        return True
+    # Пишем во временный файл и переименовываем, чтобы отчёт не прочитал файл наполовину
+    temp_path = f"{os.path.splitext(target_path)[0]}.{uuid.uuid4().hex}.tmp.jpg"
+    if compress_and_save_image(original_path, temp_path, max_size=THUMBNAIL_SIZE):
+        os.replace(temp_path, target_path)
+        return True
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    return False
+
+
+def ensure_thumbnail(original_path: str) -> Optional[str]:
+    """Путь к миниатюре; если её ещё нет (фото загружено до появления производных), создаёт её"""
+    path = thumbnail_path(original_path)
+    if not os.path.exists(path):
+        create_derivatives(original_path)
+    return path if os.path.exists(path) else None
+
+
+def schedule_derivatives(original_path: str) -> None:
+    """Запускает создание производных в пуле потоков, не дожидаясь результата"""
+    task = asyncio.get_running_loop().run_in_executor(None, create_derivatives, original_path)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def backfill(folder: str = UPLOAD_FOLDER) -> int:
+    """Создаёт миниатюры для всех загруженных фото, у которых их нет; возвращает число обработанных"""
+    processed = 0
+    # Фото лежат в папках хранилища загрузок (services/upload_store.py), старые — в корне uploads
+    for directory, _, names in os.walk(folder):
+        for name in sorted(names):
+            path = os.path.join(directory, name)
+            if is_derivative(name) or not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            if os.path.exists(thumbnail_path(path)):
+                continue
+            if create_derivatives(path):
+                processed += 1
+            else:
+                logger.warning(f"Не удалось создать производные для {path}")
+    return processed
+
+
+def _run_cli(command: str) -> int:
+    if command == "backfill":
+        print(f"Создано производных для фото: {backfill()}")
+        return 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(_run_cli(sys.argv[1] if len(sys.argv) > 1 else ""))
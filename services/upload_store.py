@@ -0,0 +1,195 @@
+"""
+Хранилище фото подтверждения участия с адресацией по содержимому.
+
+Файл сохраняется под SHA-256 своего содержимого в двухуровневой структуре папок:
+    uploads/ab/cd/abcd….jpg
+поэтому одно и то же фото, отправленное для нескольких студентов или повторно,
+лежит на диске один раз, а число файлов в каждой папке остаётся небольшим.
+В confirmation_files записей об участии хранится {saved_name: путь относительно uploads,
+original_name: имя для отчёта, file_id}. Коллекция upload_blobs считает ссылки на файлы
+(UploadRepository); файл без ссылок удаляется, если его не загружали дольше UPLOAD_ORPHAN_HOURS
+и на него не ссылается незавершённая заявка в сохранённом состоянии FSM.
+
+Запуск из командной строки:
+    python -m services.upload_store gc   — удалить файлы, на которые не ссылается ни одна запись
+    python -m services.upload_store refs — пересчитать счётчики ссылок по записям об участии
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Set
+
+from aiogram import Bot
+
+from services import file_io
+from services.database import confirmation_file_names, contest_participations_col, fsm_states_col, uploads_repo
+from services.fsm_storage import FSM_STATE_TTL_HOURS
+from services.thumbnails import thumbnail_path
+from utils.file_utils import UPLOAD_FOLDER
+
+logger = logging.getLogger(__name__)
+
+# Через сколько часов после последней загрузки удаляется файл, на который не ссылается ни одна запись.
+# Незавершённая заявка живёт FSM_STATE_TTL_HOURS с последнего действия, поэтому окно берётся с запасом
+UPLOAD_ORPHAN_HOURS = float(os.getenv("UPLOAD_ORPHAN_HOURS", str(2 * FSM_STATE_TTL_HOURS + 24)))
+
+# Папка для скачиваемых файлов; она на том же диске, что и хранилище, поэтому перенос атомарный
+TEMP_FOLDER = os.path.join(UPLOAD_FOLDER, "tmp")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def store_name(digest: str, extension: str = ".jpg") -> str:
+    """Путь файла в хранилище относительно uploads"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def store_path(name: str) -> str:
+    return os.path.join(UPLOAD_FOLDER, *name.split("/"))
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def put_file(source_path: str, extension: str = ".jpg", name: Optional[str] = None) -> str:
+    """
+    Переносит файл в хранилище; если файл с таким содержимым уже есть, удаляет source_path.
+    Возвращает путь файла в хранилище относительно uploads (его можно передать в name,
+    если хэш уже посчитан).
+    """
+    name = name or store_name(file_digest(source_path), extension)
+    target = store_path(name)
+    if os.path.exists(target):
+        os.remove(source_path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source_path, target)
+    return name
+
+
+async def save_telegram_file(bot: Bot, file_path: str, extension: str = ".jpg") -> str:
+    """Скачивает файл из Telegram в хранилище и возвращает его путь относительно uploads"""
+    temp_path = os.path.join(TEMP_FOLDER, f"{uuid.uuid4().hex}{extension}")
+    await file_io.download(bot, file_path, temp_path)
+    try:
+        # Хэширование читает файл целиком, поэтому выполняется вне цикла событий
+        name = store_name(await file_io.run(file_digest, temp_path), extension)
+        # Регистрируем до переноса: если файл с таким содержимым уже лежит в хранилище,
+        # сборщик не удалит его после того, как put_file откажется от скачанной копии
+        await uploads_repo.register(name)
+        await file_io.run(put_file, temp_path, extension, name)
+    except BaseException:
+        await file_io.remove(temp_path)
+        raise
+    return name
+
+
+def store_legacy_file(name: str) -> Optional[str]:
+    """
+    Копирует файл из корня uploads (прежняя схема хранения) в хранилище вместе с миниатюрой.
+    Возвращает путь в хранилище или None, если файла нет. Оригинал не удаляется: на него
+    могут ссылаться ещё не перенесённые записи.
+    """
+    saved_name = name if os.path.splitext(name)[1] else f"{name}.jpg"
+    legacy_path = os.path.join(UPLOAD_FOLDER, saved_name)
+    if not os.path.isfile(legacy_path):
+        return None
+    stored = store_name(file_digest(legacy_path), os.path.splitext(saved_name)[1].lower())
+    target = store_path(stored)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    for source, destination in ((legacy_path, target), (thumbnail_path(legacy_path), thumbnail_path(target))):
+        if os.path.exists(source) and not os.path.exists(destination):
+            temp_path = os.path.join(TEMP_FOLDER, f"{uuid.uuid4().hex}.part")
+            os.makedirs(TEMP_FOLDER, exist_ok=True)
+            shutil.copyfile(source, temp_path)
+            os.replace(temp_path, destination)
+    return stored
+
+
+def remove_legacy_file(name: str) -> None:
+    """Удаляет перенесённый в хранилище файл из корня uploads вместе с его производными"""
+    saved_name = name if os.path.splitext(name)[1] else f"{name}.jpg"
+    base = os.path.splitext(os.path.join(UPLOAD_FOLDER, saved_name))[0]
+    for path in (f"{base}{os.path.splitext(saved_name)[1]}", f"{base}.thumb.jpg", f"{base}.preview.jpg"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _remove_files(name: str) -> None:
+    path = store_path(name)
+    for target in (path, thumbnail_path(path)):
+        if os.path.exists(target):
+            os.remove(target)
+
+
+async def draft_file_names() -> Set[str]:
+    """Файлы, на которые ссылаются незавершённые заявки в сохранённых состояниях FSM"""
+    names = set()
+    async for doc in fsm_states_col.find(
+        {"$or": [
+            {"data.confirmation_files.0": {"$exists": True}},
+            {"data.students.confirmation_files.0": {"$exists": True}},
+        ]},
+        {"data.confirmation_files": 1, "data.students.confirmation_files": 1},
+    ):
+        data = doc.get("data") or {}
+        names.update(confirmation_file_names(data.get("confirmation_files")))
+        for student in data.get("students") or []:
+            names.update(confirmation_file_names(student.get("confirmation_files")))
+    return names
+
+
+async def collect_garbage(now: Optional[datetime] = None) -> int:
+    """Удаляет файлы без ссылок, которые не загружались дольше UPLOAD_ORPHAN_HOURS; возвращает их число"""
+    cutoff = (now or datetime.now()) - timedelta(hours=UPLOAD_ORPHAN_HOURS)
+    drafts = await draft_file_names()
+    removed = 0
+    while True:
+        orphans = await uploads_repo.orphans(cutoff)
+        if not orphans:
+            break
+        for blob in orphans:
+            if blob["_id"] in drafts:
+                # Фото ещё в черновике заявки: откладываем удаление, как будто его загрузили заново
+                await uploads_repo.register(blob["_id"])
+                continue
+            # Условие проверяется ещё раз при пометке: за это время файл могли загрузить или сослаться на него.
+            # Пока файл помечен удаляемым, загрузка того же содержимого ждёт (см. UploadRepository.register)
+            if await uploads_repo.claim_orphan(blob["_id"], cutoff):
+                await file_io.run(_remove_files, blob["_id"])
+                await uploads_repo.finish_removal(blob["_id"])
+                removed += 1
+    if removed:
+        logger.info(f"Удалено файлов без ссылок из хранилища загрузок: {removed}")
+    return removed
+
+
+async def rebuild_refs() -> None:
+    await uploads_repo.rebuild_refs(contest_participations_col)
+
+
+async def _run_cli(command: str) -> int:
+    if command == "gc":
+        print(f"Удалено файлов: {await collect_garbage()}")
+        return 0
+    if command == "refs":
+        await rebuild_refs()
+        print("Счётчики ссылок пересчитаны")
+        return 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_run_cli(sys.argv[1] if len(sys.argv) > 1 else "")))
@@ -0,0 +1,78 @@
+"""
+Проверки очереди уведомлений на настоящей MongoDB (MONGO_URI, по умолчанию localhost).
+Если база недоступна, тесты пропускаются.
+
+Запуск:
+    python -m pytest tests
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+
+from services import notifications
+from services.database import DATABASE_NAME, MONGO_URI, NotificationOutboxRepository
+from services.notifications import NOTIFY_COALESCE_SECONDS, NotificationService
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id: int, text: str) -> None:
+        self.sent.append((chat_id, text))
+
+
+def run_with_outbox(scenario):
+    """Выполняет сценарий на временной коллекции отдельной тестовой базы"""
+    async def run():
+        client = AsyncIOMotorClient(MONGO_URI, serverSelectionTimeoutMS=1000)
+        try:
+            await client.admin.command("ping")
+        except PyMongoError:
+            client.close()
+            pytest.skip("MongoDB недоступна")
+        collection = client[f"{DATABASE_NAME}_test"][f"notification_outbox_{uuid.uuid4().hex}"]
+        try:
+            await scenario(collection)
+        finally:
+            await collection.drop()
+            client.close()
+
+    asyncio.run(run())
+
+
+def test_backed_off_retry_stays_pending(monkeypatch):
+    async def scenario(collection):
+        repo = NotificationOutboxRepository(collection, None)
+        monkeypatch.setattr(notifications, "notification_outbox_repo", repo)
+        now = datetime.now()
+        await collection.insert_many([
+            {
+                "chat_id": 1, "text": "повтор", "status": "pending", "attempts": 2,
+                "created_at": now - timedelta(minutes=1), "next_attempt_at": now + timedelta(seconds=40),
+            },
+            {
+                "chat_id": 1, "text": "новое", "status": "pending", "attempts": 0,
+                "created_at": now, "next_attempt_at": now,
+            },
+        ])
+
+        batch_id = uuid.uuid4().hex
+        claimed = await repo.claim(batch_id, lease=60, coalesce=NOTIFY_COALESCE_SECONDS)
+        assert [notification["text"] for notification in claimed] == ["новое"]
+
+        bot = FakeBot()
+        await NotificationService(workers=1, rate=100, chat_interval=0)._deliver(bot, batch_id, claimed)
+        assert bot.sent == [(1, "новое")]
+
+        retry = await collection.find_one({"text": "повтор"})
+        assert retry["status"] == "pending"
+        assert retry["next_attempt_at"] > datetime.now()
+        assert "batch" not in retry
+        assert (await collection.find_one({"text": "новое"}))["status"] == "sent"
+
+    run_with_outbox(scenario)
@@ -12,4 +12,19 @@ class ContestParticipationStates(StatesGroup):
     entering_student_name = State()          # Ввод ФИО студента (если студент)
     entering_group = State()                 # Ввод группы
     entering_result = State()                # Ввод результата
-    uploading_confirmation_file = State()    # Загрузка фото 
\ No newline at end of file
+    uploading_confirmation_file = State()    # Загрузка фото 
+
+class ContestCreationStates(StatesGroup):
+    entering_name = State()                  # Ввод названия конкурса
+    entering_dates = State()                 # Ввод дат проведения
+    entering_description = State()           # Ввод описания
+    uploading_files = State()                # Загрузка файлов конкурса
+    selecting_responsible = State()          # Выбор ответственного
+
+
+class ContestEditStates(StatesGroup):
+    editing_name = State()                   # Новое название
+    editing_dates = State()                  # Новые даты проведения
+    editing_description = State()            # Новое описание
+    uploading_files = State()                # Загрузка дополнительных файлов
+    selecting_responsible = State()          # Выбор нового ответственного
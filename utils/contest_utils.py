@@ -1,15 +1,19 @@
 from datetime import datetime
-from typing import Optional, List, Dict, Tuple
-from services.database import db, contest_participations_col
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional, List, Dict, Tuple
+from services.database import participations_repo
 import os
-import base64
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
-from PIL import Image
+from services.thumbnails import THUMBNAIL_SIZE, ensure_thumbnail
 from bson import ObjectId
 import logging
 import io
+import json
+import shutil
+import tempfile
+import zipfile
 import openpyxl.drawing.image
 from openpyxl.drawing.spreadsheet_drawing import OneCellAnchor, AnchorMarker
 from openpyxl.utils.units import pixels_to_EMU
@@ -49,7 +53,7 @@ async def save_contest_participation(
             
         logger.info(f"Сохранение участия в конкурсе. User ID: {user_id}, Files: {confirmation_files}")
         
-        contest_participations_col.insert_one({
+        await participations_repo.insert_one({
             "contest_id": ObjectId(contest_id),
             "contest_name": contest_name,
             "date": date,
@@ -70,106 +74,164 @@ async def save_contest_participation(
         logger.error(f"Ошибка при сохранении участия в конкурсе: {e}", exc_info=True)
         raise
 
-async def generate_contest_report(month: int, year: int) -> Tuple[List[Dict], Dict[str, list]]:
-    """
-    Генерирует отчет по конкурсам за указанный месяц и год.
-    Возвращает список данных и словарь с изображениями в формате base64.
-    """
-    logger.info(f"Начинаем генерацию отчета за {month}.{year}")
-    
+# Функция, которой построение отчёта сообщает процент готовности (0-100)
+ProgressCallback = Callable[[int], None]
+
+# Колонки отчёта в порядке вывода
+REPORT_HEADERS = [
+    "Название конкурса", "Дата", "Уровень конкурса", "ФИО преподавателя", "Номинация",
+    "Форма участия", "Участник", "ФИО студента", "Группа", "Результат", "Файлы"
+]
+
+# Поля документа участия, из которых берутся значения колонок
+REPORT_FIELDS = {
+    "Название конкурса": "contest_name",
+    "Дата": "date",
+    "Уровень конкурса": "level",
+    "ФИО преподавателя": "teacher_name",
+    "Номинация": "nomination",
+    "Форма участия": "participation_form",
+    "Участник": "participant_type",
+    "ФИО студента": "student_name",
+    "Группа": "group",
+    "Результат": "result",
+}
+
+# Максимальный размер Excel-отчёта, который держится в памяти; больший сбрасывается на диск
+EXCEL_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+def _report_progress(progress: Optional[ProgressCallback], done: int, total: int) -> None:
+    if progress and total:
+        progress(100 * done // total)
+
+
+def month_query(month: int, year: int) -> Dict:
+    """Фильтр записей об участии за указанный месяц"""
     start_date = datetime(year, month, 1)
     if month == 12:
         end_date = datetime(year + 1, 1, 1)
     else:
         end_date = datetime(year, month + 1, 1)
+    return {"created_at": {"$gte": start_date, "$lt": end_date}}
 
-    records = list(db.contest_participations.find({
-        "created_at": {"$gte": start_date, "$lt": end_date}
-    }))
+
+def _report_row(doc: Dict) -> Tuple[Dict, List[Tuple[str, str]]]:
+    """
+    Преобразует запись об участии в строку отчёта.
+    Возвращает строку и список (file_id, путь) найденных файлов подтверждения.
+    """
+    confirmation_files = doc.get("confirmation_files", [])
+    logger.debug(f"confirmation_files: {confirmation_files}")
+    
+    files_info = []
+    for file_info in confirmation_files:
+        if isinstance(file_info, dict):
+            saved_name = file_info.get("saved_name")
+            original_name = file_info.get("original_name")
+            file_id = file_info.get("file_id")
+        else:
+            saved_name = file_info  # Убираем добавление .jpg
+            # Для файла из хранилища показываем имя без папок-префиксов
+            original_name = saved_name.rsplit("/", 1)[-1]
+            file_id = file_info
+            
+        logger.debug(f"Обработка файла: saved_name={saved_name}, original_name={original_name}, file_id={file_id}")
+        
+        # Проверяем, есть ли расширение в имени файла
+        if not os.path.splitext(saved_name)[1]:
+            saved_name = f"{saved_name}.jpg"
+        
+        file_path = os.path.join(UPLOAD_FOLDER, saved_name)
+        if os.path.exists(file_path):
+            logger.debug(f"Файл найден: {file_path}")
+            files_info.append({
+                "file_id": file_id,
+                "name": original_name,
+                "path": file_path
+            })
+        else:
+            logger.warning(f"Файл не найден: {file_path}")
     
-    logger.info(f"Найдено записей в базе данных: {len(records)}")
+    row = {header: doc.get(field, "") for header, field in REPORT_FIELDS.items()}
+    row["Файлы"] = ", ".join(f_info["name"] for f_info in files_info)
+    row["confirmation_files"] = [f_info["file_id"] for f_info in files_info]
+    return row, [(f_info["file_id"], f_info["path"]) for f_info in files_info]
 
-    if not records:
-        return [], {}
 
-    data = []
-    images = {}
+def _excel_column_widths(collection, query: Dict) -> Tuple[List[float], int]:
+    """
+    Считает ширину колонок данных и наибольшее число файлов в строке агрегацией на стороне MongoDB.
 
-    for doc in records:
-        confirmation_files = doc.get("confirmation_files", [])
-        logger.debug(f"confirmation_files: {confirmation_files}")
-        
-        files_info = []
-        for file_info in confirmation_files:
-            if isinstance(file_info, dict):
-                saved_name = file_info.get("saved_name")
-                original_name = file_info.get("original_name")
-                file_id = file_info.get("file_id")
-            else:
-                saved_name = file_info  # Убираем добавление .jpg
-                original_name = saved_name
-                file_id = file_info
-                
-            logger.debug(f"Обработка файла: saved_name={saved_name}, original_name={original_name}, file_id={file_id}")
-            
-            # Проверяем, есть ли расширение в имени файла
-            if not os.path.splitext(saved_name)[1]:
-                saved_name = f"{saved_name}.jpg"
-            
-            file_path = os.path.join(UPLOAD_FOLDER, saved_name)
-            if os.path.exists(file_path):
-                logger.debug(f"Файл найден: {file_path}")
-                with open(file_path, "rb") as img_file:
-                    image_data = base64.b64encode(img_file.read()).decode()
-                    images[file_id] = [image_data]
-                files_info.append({
-                    "file_id": file_id,
-                    "name": original_name
-                })
-            else:
-                logger.warning(f"Файл не найден: {file_path}")
-                
-        data.append({
-            "Название конкурса": doc.get("contest_name", ""),
-            "Дата": doc.get("date", ""),
-            "Уровень конкурса": doc.get("level", ""),
-            "ФИО преподавателя": doc.get("teacher_name", ""),
-            "Номинация": doc.get("nomination", ""),
-            "Форма участия": doc.get("participation_form", ""),
-            "Участник": doc.get("participant_type", ""),
-            "ФИО студента": doc.get("student_name", ""),
-            "Группа": doc.get("group", ""),
-            "Результат": doc.get("result", ""),
-            "Файлы": ", ".join(f_info["name"] for f_info in files_info),
-            "confirmation_files": [f_info["file_id"] for f_info in files_info]
-        })
-        
-    logger.info(f"Подготовлено данных: {len(data)}, изображений: {len(images)}")
-    return data, images
+    Книга в режиме write-only записывает ширины колонок до первой строки, поэтому
+    они должны быть известны заранее; агрегация обходится без второго прохода по данным в Python.
+    """
+    def text_length(expression) -> Dict:
+        return {"$strLenCP": {"$toString": {"$ifNull": [expression, ""]}}}
+
+    files = {"$ifNull": ["$confirmation_files", []]}
+    group = {"_id": None, "max_files": {"$max": {"$size": files}}}
+    for index, field in enumerate(REPORT_FIELDS.values()):
+        group[f"c{index}"] = {"$max": text_length(f"${field}")}
+    # Колонка «Файлы» — имена файлов через запятую
+    group["files"] = {"$max": {"$sum": {"$map": {
+        "input": files,
+        "as": "file",
+        "in": {"$add": [2, text_length({"$cond": [
+            {"$eq": [{"$type": "$$file"}, "object"]}, "$$file.original_name", "$$file"
+        ]})]},
+    }}}}
 
-async def create_contest_excel_report(data: List[Dict], images: Dict[str, list]) -> bytes:
+    stats = next(collection.aggregate([{"$match": query}, {"$group": group}]), None) or {}
+    lengths = [stats.get(f"c{index}") or 0 for index in range(len(REPORT_FIELDS))] + [stats.get("files") or 0]
+    # Ширина с небольшим отступом, но не меньше заголовка и не больше 50
+    widths = [min(max(length, len(header)) + 2, 50) for length, header in zip(lengths, REPORT_HEADERS)]
+    return widths, stats.get("max_files") or 0
+
+
+def create_contest_excel_report(
+    month: int,
+    year: int,
+    collection,
+    progress: Optional[ProgressCallback] = None,
+    query: Optional[Dict] = None,
+) -> Optional[BinaryIO]:
     """
     Создание Excel-отчета по конкурсам с данными и изображениями
     
+    Книга пишется в режиме write-only за один проход по курсору MongoDB, поэтому
+    потребление памяти не зависит от числа записей и фотографий за период.
+    
     Args:
-        data: Список словарей с данными
-        images: Словарь с изображениями в формате base64
+        month: Месяц отчёта
+        year: Год отчёта
+        collection: Синхронная коллекция pymongo с записями об участии
+        progress: Функция для сообщения процента готовности
+        query: Фильтр записей вместо всего месяца (для отчёта, разбитого на части)
     
     Returns:
-        bytes: Бинарные данные Excel-файла
+        Временный файл с отчётом (в памяти до EXCEL_SPOOL_MAX_SIZE, дальше на диске),
+        установленный на начало, или None, если за период нет записей
     """
-    logger.info(f"Начинаем создание отчета по конкурсам. Количество записей: {len(data)}")
+    query = query or month_query(month, year)
+    total = collection.count_documents(query)
+    logger.info(f"Начинаем создание отчета по конкурсам. Количество записей: {total}")
+    if not total:
+        return None
     
-    # Создаем новую книгу Excel
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Отчет по конкурсам"
+    # Константы для форматирования
+    ROW_HEIGHT = 150
+    IMG_WIDTH = THUMBNAIL_SIZE[0]
     
-    # Определяем заголовки
-    headers = [
-        "Название конкурса", "Дата", "Уровень конкурса", "ФИО преподавателя", "Номинация",
-        "Форма участия", "Участник", "ФИО студента", "Группа", "Результат", "Файлы"
-    ]
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Отчет по конкурсам")
+    
+    # Ширины колонок должны быть заданы до записи первой строки
+    widths, max_files = _excel_column_widths(collection, query)
+    for col, width in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+    for col in range(len(REPORT_HEADERS) + 1, len(REPORT_HEADERS) + max_files + 1):
+        ws.column_dimensions[get_column_letter(col)].width = IMG_WIDTH * 0.14
     
     # Настраиваем стили
     header_font = Font(bold=True, size=12)
@@ -182,473 +244,363 @@ async def create_contest_excel_report(data: List[Dict], images: Dict[str, list])
     )
     wrap_alignment = Alignment(wrap_text=True, vertical='top')
     
-    # Записываем заголовки
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
+    def styled_cell(value, header: bool = False) -> WriteOnlyCell:
+        cell = WriteOnlyCell(ws, value=value)
         cell.border = thin_border
         cell.alignment = wrap_alignment
+        if header:
+            cell.font = header_font
+            cell.fill = header_fill
+        return cell
     
-    # Константы для форматирования
-    ROW_HEIGHT = 150
-    IMG_WIDTH = 150
-    MAX_IMG_HEIGHT = 120
-    
-    # Создаем временную директорию для изображений
-    temp_dir = os.path.join(UPLOAD_FOLDER, "temp")
-    os.makedirs(temp_dir, exist_ok=True)
+    # Записываем заголовки
+    ws.append([styled_cell(header, header=True) for header in REPORT_HEADERS])
     
     try:
-        # Записываем данные
-        for row_idx, row_data in enumerate(data, 2):
-            logger.debug(f"Обработка строки {row_idx}")
+        row_idx = 1
+        for doc in collection.find(query):
+            row_idx += 1
+            _report_progress(progress, row_idx - 2, total)
+            row_data, files = _report_row(doc)
             
-            # Устанавливаем высоту строки
+            # Высоту строки нужно задать до её записи
             ws.row_dimensions[row_idx].height = ROW_HEIGHT
+            ws.append([styled_cell(row_data.get(header, "")) for header in REPORT_HEADERS])
             
-            # Записываем основные данные
-            for col_idx, header in enumerate(headers, 1):
-                cell = ws.cell(row=row_idx, column=col_idx, value=row_data.get(header, ""))
-                cell.border = thin_border
-                cell.alignment = wrap_alignment
-            
-            # Добавляем изображения
-            confirmation_files = row_data.get("confirmation_files", [])
-            img_col = len(headers) + 1
-            
-            
-            for file_id in confirmation_files:
-                if file_id in images:
-                    for img_base64 in images[file_id]:
-                        try:
-                            
-                            # Декодируем base64 в бинарные данные
-                            img_data = base64.b64decode(img_base64)
-                            logger.debug(f"Изображение {file_id} успешно декодировано из base64")
-                            
-                            # Сохраняем во временный файл
-                            temp_img_path = os.path.join(temp_dir, f"temp_{file_id}.png")
-                            with open(temp_img_path, "wb") as f:
-                                f.write(img_data)
-                            logger.debug(f"Изображение {file_id} сохранено во временный файл: {temp_img_path}")
-                            
-                            # Открываем изображение с помощью PIL
-                            with Image.open(temp_img_path) as pil_img:
-                                # Получаем размеры изображения
-                                width, height = pil_img.size
-                                logger.debug(f"Размеры изображения {file_id}: {width}x{height}")
-                                
-                                # Вычисляем новые размеры с сохранением пропорций
-                                if width > height:
-                                    new_width = min(IMG_WIDTH, width)
-                                    new_height = int((height * new_width) / width)
-                                else:
-                                    new_height = min(MAX_IMG_HEIGHT, height)
-                                    new_width = int((width * new_height) / height)
-                                logger.debug(f"Новые размеры изображения {file_id}: {new_width}x{new_height}")
-                                
-                                # Изменяем размер изображения
-                                pil_img = pil_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                                pil_img.save(temp_img_path, format='PNG')
-                                logger.debug(f"Изображение {file_id} изменено и сохранено")
-                            
-                            # Создаем объект изображения для openpyxl
-                            img = openpyxl.drawing.image.Image(temp_img_path)
-                            logger.debug(f"Создан объект изображения для Excel: {file_id}")
-                            
-                            # Добавляем изображение в ячейку
-                            cell = ws.cell(row=row_idx, column=img_col)
-                            cell.value = None  # Очищаем ячейку
-                            logger.debug(f"Очищена ячейка {get_column_letter(img_col)}{row_idx}")
-                            
-                            # Устанавливаем размер ячейки
-                            ws.column_dimensions[get_column_letter(img_col)].width = new_width * 0.14
-                            logger.debug(f"Установлена ширина столбца {get_column_letter(img_col)}: {new_width * 0.14}")
-                            
-                            # Добавляем изображение
-                            ws.add_image(img, f"{get_column_letter(img_col)}{row_idx}")
-                            
-                            img_col += 1
-                            
-                        except Exception as e:
-                            logger.error(f"Ошибка при обработке изображения {file_id}: {str(e)}", exc_info=True)
-                            continue
-                else:
-                    logger.warning(f"Изображение {file_id} не найдено в словаре images")
-        
-        # Настраиваем ширину столбцов с данными
-        for col in range(1, len(headers) + 1):
-            max_length = 0
-            column = get_column_letter(col)
-            
-            # Проверяем длину заголовка
-            cell = ws[f"{column}1"]
-            max_length = len(str(cell.value))
-            
-            # Проверяем длину данных
-            for row in range(2, len(data) + 2):
-                cell = ws[f"{column}{row}"]
+            # Добавляем изображения справа от данных
+            img_col = len(REPORT_HEADERS) + 1
+            for file_id, file_path in files:
                 try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            
-            # Устанавливаем ширину с небольшим отступом
-            adjusted_width = min(max_length + 2, 50)  # Ограничиваем максимальную ширину
-            ws.column_dimensions[column].width = adjusted_width
+                    # Миниатюра создаётся при загрузке фото; openpyxl прочитает её с диска при сохранении книги
+                    thumbnail = ensure_thumbnail(file_path)
+                    if thumbnail is None:
+                        logger.warning(f"Нет миниатюры для изображения {file_id}")
+                        continue
+                    ws.add_image(openpyxl.drawing.image.Image(thumbnail), f"{get_column_letter(img_col)}{row_idx}")
+                    img_col += 1
+                except Exception as e:
+                    logger.error(f"Ошибка при обработке изображения {file_id}: {str(e)}", exc_info=True)
+                    continue
         
         logger.info("Сохранение отчета...")
-        # Сохраняем файл в байты
-        output = io.BytesIO()
+        output = tempfile.SpooledTemporaryFile(max_size=EXCEL_SPOOL_MAX_SIZE)
         wb.save(output)
         output.seek(0)
         
         logger.info("Отчет успешно создан")
-        return output.getvalue()
+        return output
     
     except Exception as e:
         logger.error(f"Ошибка при создании отчета: {str(e)}")
         raise
-    
-    finally:
-        # Удаляем временную директорию со всеми файлами
-        import shutil
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-            logger.debug("Временная директория удалена")
-
-async def create_contest_html_report(data: List[Dict], images: Dict[str, list]) -> str:
-    """
-    Создание HTML-отчета по конкурсам с данными и изображениями
-    
-    Args:
-        data: Список словарей с данными
-        images: Словарь с изображениями в формате base64
-    
-    Returns:
-        str: HTML-код отчета
-    """
-    logger.info(f"Начинаем создание HTML-отчета по конкурсам. Количество записей: {len(data)}")
-    
-    # Создаем HTML-шаблон с поддержкой сортировки и фильтрации
-    html_template = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <title>Отчет по конкурсам</title>
-        <style>
-            body {
-                font-family: Arial, sans-serif;
-                margin: 20px;
-            }
-            .controls {
-                margin: 20px 0;
-                padding: 15px;
-                background-color: #f5f5f5;
-                border-radius: 5px;
-            }
-            .filter-group {
-                margin: 10px 0;
-            }
-            .filter-group label {
-                display: inline-block;
-                width: 150px;
-                margin-right: 10px;
-            }
-            .filter-group input, .filter-group select {
-                padding: 5px;
-                margin: 5px 0;
-                width: 200px;
-            }
-            .buttons {
-                margin: 15px 0;
-            }
-            .buttons button {
-                padding: 8px 15px;
-                margin-right: 10px;
-                cursor: pointer;
-                background-color: #D7E4BC;
-                border: 1px solid #999;
-                border-radius: 3px;
-            }
-            .buttons button:hover {
-                background-color: #C5D4A9;
-            }
-            table {
-                border-collapse: collapse;
-                width: 100%;
-                margin: 20px 0;
-            }
-            th, td {
-                border: 1px solid #ddd;
-                padding: 8px;
-                text-align: left;
-                vertical-align: top;
-            }
-            th {
-                background-color: #D7E4BC;
-                cursor: pointer;
-                position: relative;
-            }
-            th:hover {
-                background-color: #C5D4A9;
-            }
-            th::after {
-                content: '↕';
-                position: absolute;
-                right: 8px;
-                color: #666;
-            }
-            th.asc::after {
-                content: '↑';
-            }
-            th.desc::after {
-                content: '↓';
-            }
-            .images-cell {
-                display: flex;
-                flex-wrap: wrap;
-                gap: 10px;
-            }
-            .image-container {
-                max-width: 150px;
-                margin: 5px;
-            }
-            .image-container img {
-                max-width: 100%;
-                height: auto;
-            }
-            .hidden {
-                display: none;
-            }
-            .stats {
-                margin: 10px 0;
-                padding: 10px;
-                background-color: #f0f0f0;
-                border-radius: 3px;
-            }
-            @media print {
-                .controls, .buttons {
-                    display: none;
-                }
-                table {
-                    width: 100%;
-                }
-                th, td {
-                    border: 1px solid #000;
-                }
-                .images-cell {
-                    page-break-inside: avoid;
-                }
-                .image-container {
-                    max-width: 200px;
-                }
-            }
-        </style>
-        <script>
-            let originalData = [];
-            let currentFilters = {};
-            let currentSort = { column: null, direction: 'asc' };
-            
-            function initializeData() {
-                const table = document.getElementById('contestTable');
-                const rows = Array.from(table.getElementsByTagName('tbody')[0].getElementsByTagName('tr'));
-                originalData = rows.map(row => {
-                    const cells = Array.from(row.getElementsByTagName('td'));
-                    const imagesCell = cells[cells.length - 1]; // Последняя ячейка содержит изображения
-                    return {
-                        element: row,
-                        data: cells.map(cell => cell.textContent.trim()),
-                        images: imagesCell.classList.contains('images-cell') ? 
-                            imagesCell.getElementsByTagName('img').length : 0
-                    };
-                });
-                updateStats();
-            }
-            
-            function updateStats() {
-                const total = originalData.length;
-                const visible = document.querySelectorAll('#contestTable tbody tr:not(.hidden)').length;
-                document.getElementById('stats').textContent = `Показано ${visible} из ${total} записей`;
-            }
-            
-            function applyFilters() {
-                const filters = {};
-                document.querySelectorAll('.filter-group input, .filter-group select').forEach(input => {
-                    if (input.value) {
-                        filters[input.name] = input.value.toLowerCase();
-                    }
-                });
-                currentFilters = filters;
-                filterAndSort();
-            }
-            
-            function filterAndSort() {
-                const tbody = document.querySelector('#contestTable tbody');
-                const rows = Array.from(tbody.getElementsByTagName('tr'));
-                
-                // Сначала применяем фильтры
-                rows.forEach(row => {
-                    let visible = true;
-                    const cells = Array.from(row.getElementsByTagName('td'));
-                    
-                    Object.entries(currentFilters).forEach(([key, value]) => {
-                        const index = parseInt(key);
-                        if (!cells[index].textContent.trim().toLowerCase().includes(value.toLowerCase())) {
-                            visible = false;
-                        }
-                    });
-                    
-                    row.classList.toggle('hidden', !visible);
-                });
-                
-                // Затем применяем сортировку
-                if (currentSort.column !== null) {
-                    const visibleRows = rows.filter(row => !row.classList.contains('hidden'));
-                    const sortIndex = currentSort.column;
-                    const direction = currentSort.direction;
-                    
-                    visibleRows.sort((a, b) => {
-                        const aCells = Array.from(a.getElementsByTagName('td'));
-                        const bCells = Array.from(b.getElementsByTagName('td'));
-                        
-                        if (sortIndex === 10) { // Сортировка по количеству изображений
-                            const aImages = aCells[sortIndex].getElementsByTagName('img').length;
-                            const bImages = bCells[sortIndex].getElementsByTagName('img').length;
-                            return direction === 'asc' ? aImages - bImages : bImages - aImages;
-                        } else {
-                            const aValue = aCells[sortIndex].textContent.trim();
-                            const bValue = bCells[sortIndex].textContent.trim();
-                            return direction === 'asc' ? 
-                                aValue.localeCompare(bValue) : 
-                                bValue.localeCompare(aValue);
-                        }
-                    });
-                    
-                    // Перемещаем отсортированные строки в DOM
-                    visibleRows.forEach(row => tbody.appendChild(row));
-                }
-                
-                updateStats();
+
+
+# Папки архива HTML-отчёта с миниатюрами и оригиналами фотографий
+HTML_THUMBS_FOLDER = "assets/thumbs"
+HTML_PHOTOS_FOLDER = "assets/photos"
+# Имя страницы отчёта внутри архива
+HTML_REPORT_NAME = "report.html"
+
+# Начало страницы: стили, скрипт виртуальной таблицы и элементы управления.
+# Строки таблицы не входят в разметку: они лежат JSON-массивом в <script id="report-data">,
+# а скрипт создаёт только те строки, которые видны в окне прокрутки.
+HTML_REPORT_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>Отчет по конкурсам</title>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            margin: 20px;
+        }
+        .controls {
+            margin: 20px 0;
+            padding: 15px;
+            background-color: #f5f5f5;
+            border-radius: 5px;
+        }
+        .filter-group {
+            margin: 10px 0;
+        }
+        .filter-group label {
+            display: inline-block;
+            width: 150px;
+            margin-right: 10px;
+        }
+        .filter-group input, .filter-group select {
+            padding: 5px;
+            margin: 5px 0;
+            width: 200px;
+        }
+        .buttons {
+            margin: 15px 0;
+        }
+        .buttons button {
+            padding: 8px 15px;
+            margin-right: 10px;
+            cursor: pointer;
+            background-color: #D7E4BC;
+            border: 1px solid #999;
+            border-radius: 3px;
+        }
+        .buttons button:hover {
+            background-color: #C5D4A9;
+        }
+        .viewport {
+            height: 75vh;
+            overflow: auto;
+            border: 1px solid #ddd;
+        }
+        table {
+            border-collapse: collapse;
+            width: 100%;
+        }
+        th, td {
+            border: 1px solid #ddd;
+            padding: 8px;
+            text-align: left;
+            vertical-align: top;
+        }
+        th {
+            background-color: #D7E4BC;
+            cursor: pointer;
+            position: sticky;
+            top: 0;
+            z-index: 1;
+            padding-right: 24px;
+        }
+        th:hover {
+            background-color: #C5D4A9;
+        }
+        th::after {
+            content: '↕';
+            position: absolute;
+            right: 8px;
+            color: #666;
+        }
+        th.asc::after {
+            content: '↑';
+        }
+        th.desc::after {
+            content: '↓';
+        }
+        tr.row td {
+            padding: 0 8px;
+        }
+        .cell {
+            height: 114px;
+            overflow: auto;
+            padding: 8px 0;
+            box-sizing: border-box;
+        }
+        .images-cell {
+            display: flex;
+            flex-wrap: wrap;
+            gap: 10px;
+        }
+        .images-cell img {
+            width: 75px;
+            height: 60px;
+            object-fit: cover;
+        }
+        tr.spacer td {
+            border: none;
+            padding: 0;
+        }
+        .stats {
+            margin: 10px 0;
+            padding: 10px;
+            background-color: #f0f0f0;
+            border-radius: 3px;
+        }
+    </style>
+    <script>
+        // Высота строки таблицы: по ней вычисляется, какие строки видны; уточняется после отрисовки
+        let rowHeight = 115;
+        // Сколько строк рисуется сверх видимых, чтобы прокрутка была плавной
+        const OVERSCAN = 10;
+        const PHOTO_COLUMN = 10;
+
+        let rows = [];
+        let visibleRows = [];
+        let currentFilters = {};
+        let currentSort = { column: null, direction: 'asc' };
+
+        function escapeHtml(value) {
+            return String(value).replace(/[&<>"']/g, ch => ({
+                '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+            })[ch]);
+        }
+
+        function initializeData() {
+            rows = JSON.parse(document.getElementById('report-data').textContent).map(row => ({
+                cells: row.c,
+                search: row.c.map(value => value.toLowerCase()),
+                images: row.i
+            }));
+            document.getElementById('viewport').addEventListener('scroll', () => requestAnimationFrame(render));
+            window.addEventListener('resize', render);
+            filterAndSort();
+        }
+
+        function updateStats() {
+            document.getElementById('stats').textContent = `Показано ${visibleRows.length} из ${rows.length} записей`;
+        }
+
+        function renderRow(row) {
+            const cells = row.cells.map(value => `<td><div class="cell">${escapeHtml(value)}</div></td>`);
+            const images = row.images.map(([thumb, photo]) =>
+                `<a href="${escapeHtml(encodeURI(photo))}" target="_blank">` +
+                `<img src="${escapeHtml(encodeURI(thumb))}" loading="lazy" alt="Фото подтверждения"></a>`
+            );
+            return `<tr class="row">${cells.join('')}<td><div class="cell images-cell">${images.join('')}</div></td></tr>`;
+        }
+
+        function spacer(height) {
+            return height > 0 ? `<tr class="spacer"><td colspan="11" style="height: ${height}px"></td></tr>` : '';
+        }
+
+        function render() {
+            const viewport = document.getElementById('viewport');
+            const first = Math.max(0, Math.floor(viewport.scrollTop / rowHeight) - OVERSCAN);
+            const last = Math.min(visibleRows.length, Math.ceil((viewport.scrollTop + viewport.clientHeight) / rowHeight) + OVERSCAN);
+            document.getElementById('rows').innerHTML =
+                spacer(first * rowHeight) +
+                visibleRows.slice(first, last).map(renderRow).join('') +
+                spacer((visibleRows.length - last) * rowHeight);
+            const sample = document.querySelector('#rows tr.row');
+            if (sample) {
+                rowHeight = sample.offsetHeight;
             }
-            
-            function sortTable(n) {
-                const headers = document.getElementsByTagName('th');
-                
-                // Сбрасываем классы сортировки со всех заголовков
-                Array.from(headers).forEach(header => {
-                    header.classList.remove('asc', 'desc');
-                });
-                
-                // Определяем направление сортировки
-                if (currentSort.column === n) {
-                    currentSort.direction = currentSort.direction === 'asc' ? 'desc' : 'asc';
-                } else {
-                    currentSort.column = n;
-                    currentSort.direction = 'asc';
+        }
+
+        function applyFilters() {
+            const filters = {};
+            document.querySelectorAll('.filter-group input, .filter-group select').forEach(input => {
+                if (input.value) {
+                    filters[input.name] = input.value.toLowerCase();
                 }
-                
-                // Добавляем класс сортировки к текущему заголовку
-                headers[n].classList.add(currentSort.direction);
-                
-                filterAndSort();
-            }
-            
-            function resetFilters() {
-                document.querySelectorAll('.filter-group input, .filter-group select').forEach(input => {
-                    input.value = '';
-                });
-                currentFilters = {};
-                filterAndSort();
-            }
-            
-            function resetSort() {
-                currentSort = { column: null, direction: 'asc' };
-                document.querySelectorAll('th').forEach(th => {
-                    th.classList.remove('asc', 'desc');
-                });
-                filterAndSort();
+            });
+            currentFilters = filters;
+            filterAndSort();
+        }
+
+        function filterAndSort() {
+            const filters = Object.entries(currentFilters).map(([key, value]) => [parseInt(key), value]);
+            visibleRows = rows.filter(row => filters.every(([index, value]) => row.search[index].includes(value)));
+
+            if (currentSort.column !== null) {
+                const sortIndex = currentSort.column;
+                const sign = currentSort.direction === 'asc' ? 1 : -1;
+                visibleRows.sort((a, b) => sortIndex === PHOTO_COLUMN ?
+                    sign * (a.images.length - b.images.length) :
+                    sign * a.cells[sortIndex].localeCompare(b.cells[sortIndex]));
             }
-            
-            function showAll() {
-                originalData.forEach(item => {
-                    item.element.classList.remove('hidden');
-                });
-                updateStats();
+
+            document.getElementById('viewport').scrollTop = 0;
+            render();
+            updateStats();
+        }
+
+        function sortTable(n) {
+            const headers = document.getElementsByTagName('th');
+            Array.from(headers).forEach(header => header.classList.remove('asc', 'desc'));
+
+            if (currentSort.column === n) {
+                currentSort.direction = currentSort.direction === 'asc' ? 'desc' : 'asc';
+            } else {
+                currentSort.column = n;
+                currentSort.direction = 'asc';
             }
-            
-            // Инициализация при загрузке страницы
-            window.onload = function() {
-                initializeData();
-            };
-        </script>
-    </head>
-    <body>
-        <h1>Отчет по конкурсам</h1>
-        
-        <div class="controls">
-            <div class="filter-group">
-                <label for="filter0">Название конкурса:</label>
-                <input type="text" id="filter0" name="0" oninput="applyFilters()">
-            </div>
-            <div class="filter-group">
-                <label for="filter1">Дата:</label>
-                <input type="text" id="filter1" name="1" oninput="applyFilters()">
-            </div>
-            <div class="filter-group">
-                <label for="filter2">Уровень конкурса:</label>
-                <input type="text" id="filter2" name="2" oninput="applyFilters()">
-            </div>
-            <div class="filter-group">
-                <label for="filter3">ФИО преподавателя:</label>
-                <input type="text" id="filter3" name="3" oninput="applyFilters()">
-            </div>
-            <div class="filter-group">
-                <label for="filter4">Номинация:</label>
-                <input type="text" id="filter4" name="4" oninput="applyFilters()">
-            </div>
-            <div class="filter-group">
-                <label for="filter5">Форма участия:</label>
-                <select id="filter5" name="5" onchange="applyFilters()">
-                    <option value="">Все</option>
-                    <option value="Очная">Очная</option>
-                    <option value="Заочная">Заочная</option>
-                </select>
-            </div>
-            <div class="filter-group">
-                <label for="filter6">Участник:</label>
-                <select id="filter6" name="6" onchange="applyFilters()">
-                    <option value="">Все</option>
-                    <option value="Преподаватель">Преподаватель</option>
-                    <option value="Студент">Студент</option>
-                </select>
-            </div>
-            <div class="filter-group">
-                <label for="filter7">ФИО студента:</label>
-                <input type="text" id="filter7" name="7" oninput="applyFilters()">
-            </div>
-            <div class="filter-group">
-                <label for="filter8">Группа:</label>
-                <input type="text" id="filter8" name="8" oninput="applyFilters()">
-            </div>
-            <div class="filter-group">
-                <label for="filter9">Результат:</label>
-                <input type="text" id="filter9" name="9" oninput="applyFilters()">
-            </div>
+            headers[n].classList.add(currentSort.direction);
+            filterAndSort();
+        }
+
+        function resetFilters() {
+            document.querySelectorAll('.filter-group input, .filter-group select').forEach(input => {
+                input.value = '';
+            });
+            currentFilters = {};
+            filterAndSort();
+        }
+
+        function resetSort() {
+            currentSort = { column: null, direction: 'asc' };
+            document.querySelectorAll('th').forEach(th => th.classList.remove('asc', 'desc'));
+            filterAndSort();
+        }
+
+        function showAll() {
+            resetFilters();
+        }
+
+        window.onload = initializeData;
+    </script>
+</head>
+<body>
+    <h1>Отчет по конкурсам</h1>
+
+    <div class="controls">
+        <div class="filter-group">
+            <label for="filter0">Название конкурса:</label>
+            <input type="text" id="filter0" name="0" oninput="applyFilters()">
         </div>
-        
-        <div class="buttons">
-            <button onclick="showAll()">Показать все записи</button>
-            <button onclick="resetFilters()">Сбросить фильтры</button>
-            <button onclick="resetSort()">Сбросить сортировку</button>
-            <button onclick="window.print()">Печать</button>
+        <div class="filter-group">
+            <label for="filter1">Дата:</label>
+            <input type="text" id="filter1" name="1" oninput="applyFilters()">
         </div>
-        
-        <div class="stats" id="stats"></div>
-        
+        <div class="filter-group">
+            <label for="filter2">Уровень конкурса:</label>
+            <input type="text" id="filter2" name="2" oninput="applyFilters()">
+        </div>
+        <div class="filter-group">
+            <label for="filter3">ФИО преподавателя:</label>
+            <input type="text" id="filter3" name="3" oninput="applyFilters()">
+        </div>
+        <div class="filter-group">
+            <label for="filter4">Номинация:</label>
+            <input type="text" id="filter4" name="4" oninput="applyFilters()">
+        </div>
+        <div class="filter-group">
+            <label for="filter5">Форма участия:</label>
+            <select id="filter5" name="5" onchange="applyFilters()">
+                <option value="">Все</option>
+                <option value="Очная">Очная</option>
+                <option value="Заочная">Заочная</option>
+            </select>
+        </div>
+        <div class="filter-group">
+            <label for="filter6">Участник:</label>
+            <select id="filter6" name="6" onchange="applyFilters()">
+                <option value="">Все</option>
+                <option value="Преподаватель">Преподаватель</option>
+                <option value="Студент">Студент</option>
+            </select>
+        </div>
+        <div class="filter-group">
+            <label for="filter7">ФИО студента:</label>
+            <input type="text" id="filter7" name="7" oninput="applyFilters()">
+        </div>
+        <div class="filter-group">
+            <label for="filter8">Группа:</label>
+            <input type="text" id="filter8" name="8" oninput="applyFilters()">
+        </div>
+        <div class="filter-group">
+            <label for="filter9">Результат:</label>
+            <input type="text" id="filter9" name="9" oninput="applyFilters()">
+        </div>
+    </div>
+
+    <div class="buttons">
+        <button onclick="showAll()">Показать все записи</button>
+        <button onclick="resetFilters()">Сбросить фильтры</button>
+        <button onclick="resetSort()">Сбросить сортировку</button>
+    </div>
+
+    <div class="stats" id="stats"></div>
+
+    <div class="viewport" id="viewport">
         <table id="contestTable">
             <thead>
                 <tr>
@@ -665,39 +617,104 @@ async def create_contest_html_report(data: List[Dict], images: Dict[str, list])
                     <th onclick="sortTable(10)">Фото</th>
                 </tr>
             </thead>
-            <tbody>
-    """
-    
-    # Добавляем строки с данными
-    for row_data in data:
-        html_template += "<tr>"
-        
-        # Добавляем основные данные
-        for header in ["Название конкурса", "Дата", "Уровень конкурса", "ФИО преподавателя", 
-                      "Номинация", "Форма участия", "Участник", "ФИО студента", "Группа", "Результат"]:
-            html_template += f"<td>{row_data.get(header, '')}</td>"
-        
-        # Добавляем ячейку с изображениями
-        html_template += '<td class="images-cell">'
-        confirmation_files = row_data.get("confirmation_files", [])
-        for file_id in confirmation_files:
-            if file_id in images:
-                for img_base64 in images[file_id]:
-                    html_template += f'''
-                        <div class="image-container">
-                            <img src="data:image/jpeg;base64,{img_base64}" alt="Фото подтверждения">
-                        </div>
-                    '''
-        html_template += "</td>"
-        
-        html_template += "</tr>"
-    
-    # Завершаем HTML-шаблон
-    html_template += """
-            </tbody>
+            <tbody id="rows"></tbody>
         </table>
-    </body>
-    </html>
+    </div>
+
+    <script type="application/json" id="report-data">[
+"""
+
+HTML_REPORT_TAIL = """
+]</script>
+</body>
+</html>
+"""
+
+
+def iter_contest_html_report(rows: Iterable[Dict]) -> Iterator[str]:
     """
-    
-    return html_template 
\ No newline at end of file
+    Генерирует HTML-отчёт по частям, не собирая страницу в памяти.
+
+    Args:
+        rows: Строки отчёта {"c": [значения колонок], "i": [[миниатюра, оригинал], ...]},
+            пути к изображениям — относительно страницы
+    """
+    yield HTML_REPORT_HEAD
+    separator = ""
+    for row in rows:
+        # "</" экранируется, чтобы текст из базы не мог закрыть тег <script>
+        yield separator + json.dumps(row, ensure_ascii=False).replace("</", "<\\/")
+        separator = ",\n"
+    yield HTML_REPORT_TAIL
+
+
+def create_contest_html_archive(
+    month: int,
+    year: int,
+    collection,
+    output: BinaryIO,
+    progress: Optional[ProgressCallback] = None,
+) -> bool:
+    """
+    Создание HTML-отчета по конкурсам в виде zip-архива
+
+    В архиве лежит страница HTML_REPORT_NAME и папка assets: миниатюры показываются
+    в таблице с отложенной загрузкой и ведут на оригиналы фотографий. Записи читаются
+    из курсора MongoDB за один проход, страница пишется потоково во временный файл,
+    поэтому ни данные, ни фотографии не собираются в памяти целиком.
+
+    Args:
+        month: Месяц отчёта
+        year: Год отчёта
+        collection: Синхронная коллекция pymongo с записями об участии
+        output: Файл, в который записывается архив
+        progress: Функция для сообщения процента готовности
+
+    Returns:
+        False, если за период нет записей (архив при этом не записывается)
+    """
+    query = month_query(month, year)
+    total = collection.count_documents(query)
+    logger.info(f"Начинаем создание HTML-отчета по конкурсам. Количество записей: {total}")
+    if not total:
+        return False
+
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+        written = set()
+
+        def add_asset(path: str, folder: str) -> str:
+            name = f"{folder}/{os.path.basename(path)}"
+            if name not in written:
+                # JPEG уже сжат: повторное сжатие только тратит время
+                archive.write(path, name, compress_type=zipfile.ZIP_STORED)
+                written.add(name)
+            return name
+
+        def report_rows() -> Iterator[Dict]:
+            for index, doc in enumerate(collection.find(query)):
+                _report_progress(progress, index, total)
+                row_data, files = _report_row(doc)
+                images = []
+                for file_id, file_path in files:
+                    try:
+                        photo = add_asset(file_path, HTML_PHOTOS_FOLDER)
+                        thumbnail = ensure_thumbnail(file_path)
+                        images.append([add_asset(thumbnail, HTML_THUMBS_FOLDER) if thumbnail else photo, photo])
+                    except Exception as e:
+                        logger.error(f"Ошибка при обработке изображения {file_id}: {str(e)}", exc_info=True)
+                yield {"c": [str(row_data.get(header) or "") for header in REPORT_HEADERS[:-1]], "i": images}
+
+        # Пока страница пишется, в архив добавляются фотографии, поэтому сама страница
+        # копится во временном файле и попадает в архив последней
+        with tempfile.TemporaryFile("w+b") as page:
+            text = io.TextIOWrapper(page, encoding="utf-8")
+            for chunk in iter_contest_html_report(report_rows()):
+                text.write(chunk)
+            text.flush()
+            page.seek(0)
+            with archive.open(HTML_REPORT_NAME, "w") as entry:
+                shutil.copyfileobj(page, entry)
+            text.detach()
+
+    logger.info(f"HTML-отчет создан, изображений в архиве: {len(written)}")
+    return True
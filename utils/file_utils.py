@@ -43,6 +43,9 @@ def compress_and_save_image(source_path, target_path, max_size=(1200, 1200), qua
             
             # Сохраняем изображение с указанным качеством
             if file_ext in ['.jpg', '.jpeg']:
+                # JPEG не поддерживает прозрачность и палитру
+                if img.mode not in ('RGB', 'L'):
+                    img = img.convert('RGB')
                 img.save(target_path, 'JPEG', quality=quality, optimize=True)
             elif file_ext == '.png':
                 img.save(target_path, 'PNG', optimize=True)
@@ -1,29 +1,43 @@
+from typing import Callable, List
+
 from aiogram import types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from config import logger
-from services.database import users_col
+from services.database import UserPage, users_repo
+
+# Сколько пользователей показывается на одной странице списка
+USERS_PER_PAGE = 20
+
+
+def user_page_navigation(page: UserPage, page_callback: Callable[[str, int], str]) -> List[InlineKeyboardButton]:
+    """
+    Кнопки перехода по страницам списка пользователей.
+
+    Args:
+        page: Страница из users_repo.directory_page
+        page_callback: Строит callback_data по направлению ("n" — вперёд, "p" — назад)
+            и telegram_id крайнего пользователя страницы
+    """
+    buttons = []
+    if page.has_prev and page.users:
+        buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=page_callback("p", page.users[0]["telegram_id"])))
+    if page.has_next and page.users:
+        buttons.append(InlineKeyboardButton(text="Вперед ▶️", callback_data=page_callback("n", page.users[-1]["telegram_id"])))
+    return buttons
 
 
 async def show_user_list(message: types.Message, role: str):
-    users = list(users_col.find({"full_name": {"$exists": True}}).sort("full_name", 1))
-    if not users:
+    # Буквы берутся из кэшированной агрегации по full_name_key, а не из всех профилей
+    letters = await users_repo.name_letters()
+    if not letters:
         await message.answer("Пользователи не найдены.")
         return
 
-    user_dict = {}
-    for user in users:
-        if user.get("full_name"):
-            first_letter = user["full_name"][0].upper()
-            if first_letter not in user_dict:
-                user_dict[first_letter] = []
-            user_dict[first_letter].append(user)
-
-    letters = sorted(user_dict.keys())
     keyboard = InlineKeyboardMarkup(inline_keyboard=[])
     row = []
     for letter in letters:
-        row.append(InlineKeyboardButton(text=letter, callback_data=f"letter_{letter}_{role}"))
+        row.append(InlineKeyboardButton(text=letter.upper(), callback_data=f"letter_{letter}_{role}"))
         logger.info(f'letter_{letter}_{role}')
         if len(row) == 5:
             keyboard.inline_keyboard.append(row)